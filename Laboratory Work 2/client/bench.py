@@ -1,14 +1,25 @@
 import time
 import socket
+import struct
 import os
+import sys
 import argparse
+import threading
 from urllib.parse import quote
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+# Run from "Laboratory Work 2/": python client/bench.py (the HTTP/2 mode reuses the server's framing).
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
 
-def get(host, port, path="/", timeout=20):
+from server import http2  # noqa: E402
+from server.hpack import Decoder, Encoder  # noqa: E402
+
+
+def get(host, port, path="/", timeout=20, unix=None, headers=None):
     """
     Minimal GET using raw sockets; reads until server closes the connection.
+    Connects to the Unix domain socket `unix` instead of host:port when given;
+    `headers` (a dict) are added to the request.
     Returns (elapsed_seconds, total_bytes) for reporting.
     """
     if not path.startswith("/"):
@@ -18,11 +29,17 @@ def get(host, port, path="/", timeout=20):
     req = (
         f"GET {path} HTTP/1.1\r\n"
         f"Host: {host}\r\n"
-        f"Connection: close\r\n\r\n"
+        + "".join(f"{name}: {value}\r\n" for name, value in (headers or {}).items())
+        + "Connection: close\r\n\r\n"
     ).encode("ascii")
 
     start = time.perf_counter()
-    s = socket.create_connection((host, port), timeout=timeout)
+    if unix:
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.settimeout(timeout)
+        s.connect(unix)
+    else:
+        s = socket.create_connection((host, port), timeout=timeout)
     s.sendall(req)
     buf = bytearray()
     while True:
@@ -35,42 +52,281 @@ def get(host, port, path="/", timeout=20):
     return elapsed, len(buf)
 
 
-def run_bench(host="127.0.0.1", port=8000, path="/", concurrency=10, timeout=20):
+class H2Client:
+    """
+    One HTTP/2 connection (prior knowledge) carrying many requests at once.
+
+    request() sends a HEADERS frame and returns; a reader thread collects each
+    stream's response and calls its callback with (elapsed_seconds, body_bytes)
+    or an exception. The client grants large flow-control windows so the server
+    is never held back by them.
+    """
+
+    WINDOW = 1 << 30
+
+    def __init__(self, host, port, timeout=20, unix=None):
+        if unix:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(timeout)
+            self.sock.connect(unix)
+        else:
+            self.sock = socket.create_connection((host, port), timeout=timeout)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.authority = unix or f"{host}:{port}"
+        self.encoder = Encoder()
+        self.decoder = Decoder()
+        self.next_stream_id = 1
+        self.streams = {}
+        self.max_streams = None
+        # Set on GOAWAY or when the connection ends: no new streams from then on.
+        self.closed = False
+        self.settings_received = threading.Event()
+        self._lock = threading.Lock()
+        self.sock.sendall(http2.PREFACE
+                          + http2.frame(http2.SETTINGS, 0, 0,
+                                        http2.pack_settings({http2.INITIAL_WINDOW_SIZE: self.WINDOW,
+                                                             http2.ENABLE_PUSH: 0}))
+                          + http2.frame(http2.WINDOW_UPDATE, 0, 0,
+                                        struct.pack(">I", self.WINDOW - http2.DEFAULT_WINDOW)))
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._reader.start()
+        # The server's SETTINGS carry its stream limit.
+        self.settings_received.wait(timeout)
+
+    def request(self, path, on_done):
+        path = quote(path if path.startswith("/") else "/" + path, safe="/%._-~")
+        headers = [(":method", "GET"), (":path", path), (":scheme", "http"), (":authority", self.authority)]
+        with self._lock:
+            if self.closed:
+                raise ConnectionError("connection is going away")
+            stream_id = self.next_stream_id
+            self.next_stream_id += 2
+            self.streams[stream_id] = [time.perf_counter(), 0, on_done]
+            self.sock.sendall(http2.frame(http2.HEADERS, http2.END_HEADERS | http2.END_STREAM, stream_id,
+                                          self.encoder.encode(headers)))
+
+    def _finish(self, stream_id, error=None):
+        with self._lock:
+            entry = self.streams.pop(stream_id, None)
+        if entry is not None:
+            started, size, on_done = entry
+            on_done(error if error is not None else (time.perf_counter() - started, size))
+
+    def _read(self):
+        reader = http2.FrameReader(self.sock)
+        unacknowledged = 0
+        try:
+            while True:
+                item = reader.read_frame(1 << 24)
+                if item is None:
+                    break
+                ftype, flags, stream_id, payload = item
+                if ftype == http2.HEADERS:
+                    block = http2.strip_padding(flags, payload)
+                    while not flags & http2.END_HEADERS:
+                        _, flags, _, payload = reader.read_frame(1 << 24)
+                        block += payload
+                    # Decoded even when unused: the HPACK table must follow the server's.
+                    self.decoder.decode(block)
+                    if flags & http2.END_STREAM:
+                        self._finish(stream_id)
+                elif ftype == http2.DATA:
+                    with self._lock:
+                        if stream_id in self.streams:
+                            self.streams[stream_id][1] += len(payload)
+                    unacknowledged += len(payload)
+                    if unacknowledged > self.WINDOW // 2:
+                        self.sock.sendall(http2.frame(http2.WINDOW_UPDATE, 0, 0, struct.pack(">I", unacknowledged)))
+                        unacknowledged = 0
+                    if flags & http2.END_STREAM:
+                        self._finish(stream_id)
+                elif ftype == http2.SETTINGS and not flags & http2.ACK:
+                    for key, value in http2.unpack_settings(payload):
+                        if key == http2.MAX_CONCURRENT_STREAMS:
+                            self.max_streams = value
+                    self.sock.sendall(http2.frame(http2.SETTINGS, http2.ACK, 0))
+                    self.settings_received.set()
+                elif ftype == http2.PING and not flags & http2.ACK:
+                    self.sock.sendall(http2.frame(http2.PING, http2.ACK, 0, payload))
+                elif ftype == http2.RST_STREAM:
+                    code = struct.unpack(">I", payload)[0]
+                    self._finish(stream_id, ConnectionError(f"stream reset by server (error code {code})"))
+                elif ftype == http2.GOAWAY:
+                    with self._lock:
+                        self.closed = True
+                    last = struct.unpack(">I", payload[:4])[0] & 0x7FFFFFFF
+                    for pending in [sid for sid in list(self.streams) if sid > last]:
+                        self._finish(pending, ConnectionError("refused by GOAWAY"))
+        except (OSError, ValueError) as e:
+            error = e
+        else:
+            error = ConnectionError("connection closed by server")
+        with self._lock:
+            self.closed = True
+        self.settings_received.set()
+        for stream_id in list(self.streams):
+            self._finish(stream_id, error)
+
+    def close(self):
+        try:
+            self.sock.sendall(http2.frame(http2.GOAWAY, 0, 0, struct.pack(">II", 0, http2.NO_ERROR)))
+        except OSError:
+            pass
+        self.sock.close()
+
+
+def run_h2_bench(host="127.0.0.1", port=8000, paths=("/",), concurrency=10, timeout=20, requests=1,
+                 unix=None, connections=1):
+    """
+    Sends concurrency x requests GETs as HTTP/2 streams over `connections` connections,
+    keeping `concurrency` streams in flight in total (cycling through `paths`).
+    Prints the same summary as run_bench() and returns it.
+    """
+    total = concurrency * requests
+    print("=== HTTP/2 Multiplexed Bench ===")
+    print(f"Socket: {unix}" if unix else f"Host: {host}    Port: {port}")
+    print(f"URLs: {', '.join(paths)}     Streams in flight: {concurrency}    Connections: {connections}    "
+          f"Requests: {total}")
+    print("Running requests...")
+
+    clients = [H2Client(host, port, timeout, unix) for _ in range(connections)]
+    results = []
+    failures = []
+    done = threading.Condition()
+    issued = 0
+
+    def drive(client, slots):
+        nonlocal issued
+        if client.max_streams is not None and slots > client.max_streams:
+            print(f"note: server allows {client.max_streams} streams per connection; using that many")
+            slots = client.max_streams
+        free = threading.Semaphore(slots)
+
+        def on_done(result):
+            with done:
+                (failures if isinstance(result, Exception) else results).append(result)
+                done.notify_all()
+            free.release()
+
+        while True:
+            free.acquire()
+            with done:
+                if issued >= total:
+                    return
+                index = issued
+                issued += 1
+            try:
+                client.request(paths[index % len(paths)], on_done)
+            except OSError as e:
+                on_done(e)
+
+    start = time.perf_counter()
+    drivers = [threading.Thread(target=drive, args=(client, concurrency // connections + (i < concurrency % connections)))
+               for i, client in enumerate(clients)]
+    for t in drivers:
+        t.start()
+    with done:
+        while len(results) + len(failures) < total:
+            if not done.wait(timeout):
+                break
+    total_elapsed = time.perf_counter() - start
+    for client in clients:
+        client.close()
+    for t in drivers:
+        t.join(1)
+
+    per_request_times = [elapsed for elapsed, _ in results]
+    sizes = [size for _, size in results]
+    failed = total - len(results)
+    for error in failures[:5]:
+        print(f"Failed ({error})")
+
+    print("\n=== Summary ===")
+    print(f"Total elapsed: {total_elapsed:.3f}s")
+    print(f"OK/Total: {total - failed}/{total}")
+    print(f"Failed: {failed}")
+    if per_request_times:
+        print(f"Response time (s): min={min(per_request_times):.3f}  "
+              f"avg={sum(per_request_times) / len(per_request_times):.3f}  max={max(per_request_times):.3f}")
+        print(f"Response time (ms): p50={percentile(per_request_times, 0.5) * 1000:.3f}  "
+              f"p99={percentile(per_request_times, 0.99) * 1000:.3f}    "
+              f"Throughput: {len(per_request_times) / total_elapsed:.0f} req/s")
+
+    print("\nReport (copy-paste):")
+    summary = {
+        "elapsed_total_s": round(total_elapsed, 6),
+        "requests": total,
+        "ok": total - failed,
+        "connections": connections,
+        "rt_avg_s": round((sum(per_request_times) / len(per_request_times)) if per_request_times else 0.0, 6),
+        "rt_min_s": round(min(per_request_times), 6) if per_request_times else 0.0,
+        "rt_max_s": round(max(per_request_times), 6) if per_request_times else 0.0,
+        "rt_p50_s": round(percentile(per_request_times, 0.5), 6),
+        "rt_p99_s": round(percentile(per_request_times, 0.99), 6),
+        "rps": round(len(per_request_times) / total_elapsed, 1),
+        "bytes_each": sorted(set(sizes)),
+    }
+    print(summary)
+    return summary
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+def run_bench(host="127.0.0.1", port=8000, path="/", concurrency=10, timeout=20, requests=1, unix=None,
+              paths=None):
     """
-    Launches N concurrent GET requests and prints detailed timings.
+    Launches N concurrent clients, each sending `requests` GETs one after another
+    (a new connection each), and prints detailed timings. Returns the summary.
+    With `paths`, the requests cycle through them instead of using `path`.
     """
+    total = concurrency * requests
+    paths = paths or [path]
     print("=== HTTP Concurrency Bench ===")
-    print(f"Host: {host}    Port: {port}")
-    print(f"URL: {path}     Concurrency: {concurrency}")
+    print(f"Socket: {unix}" if unix else f"Host: {host}    Port: {port}")
+    print(f"URL: {', '.join(paths)}     Concurrency: {concurrency}" + (f"    Requests: {total}" if requests > 1 else ""))
     print("Running requests...")
 
     per_request_times = []
     sizes = []
     failed = 0
 
+    def client(index):
+        results = []
+        for i in range(requests):
+            try:
+                results.append(get(host, port, paths[(index * requests + i) % len(paths)], timeout, unix))
+            except Exception as e:
+                results.append(e)
+        return results
+
     start = time.perf_counter()
     with ThreadPoolExecutor(max_workers=concurrency) as ex:
         future_to_idx = {}
         for i in range(concurrency):
-            fut = ex.submit(get, host, port, path, timeout)
+            fut = ex.submit(client, i)
             future_to_idx[fut] = i + 1
 
         for fut in as_completed(future_to_idx):
             idx = future_to_idx[fut]
-            try:
-                elapsed, total_bytes = fut.result()
+            for result in fut.result():
+                if isinstance(result, Exception):
+                    failed += 1
+                    print(f"Request {idx}: Failed ({result})")
+                    continue
+                elapsed, total_bytes = result
                 per_request_times.append(elapsed)
                 sizes.append(total_bytes)
-                print(f"req#{idx}: {elapsed:.3f}s, {total_bytes} bytes")
-            except Exception as e:
-                failed += 1
-                print(f"Request {idx}: Failed ({e})")
+                if requests == 1:
+                    print(f"req#{idx}: {elapsed:.3f}s, {total_bytes} bytes")
 
     total_elapsed = time.perf_counter() - start
 
     print("\n=== Summary ===")
     print(f"Total elapsed: {total_elapsed:.3f}s")
-    print(f"OK/Total: {concurrency - failed}/{concurrency}")
+    print(f"OK/Total: {total - failed}/{total}")
     print(f"Failed: {failed}")
 
     if per_request_times:
@@ -78,18 +334,68 @@ def run_bench(host="127.0.0.1", port=8000, path="/", concurrency=10, timeout=20)
         max_t = max(per_request_times)
         avg_t = sum(per_request_times) / len(per_request_times)
         print(f"Response time (s): min={min_t:.3f}  avg={avg_t:.3f}  max={max_t:.3f}")
+        if requests > 1:
+            print(f"Response time (ms): p50={percentile(per_request_times, 0.5) * 1000:.3f}  "
+                  f"p99={percentile(per_request_times, 0.99) * 1000:.3f}    "
+                  f"Throughput: {len(per_request_times) / total_elapsed:.0f} req/s")
 
     print("\nReport (copy-paste):")
     summary = {
         "elapsed_total_s": round(total_elapsed, 6),
-        "requests": concurrency,
-        "ok": concurrency - failed,
+        "requests": total,
+        "ok": total - failed,
         "rt_avg_s": round((sum(per_request_times) / len(per_request_times)) if per_request_times else 0.0, 6),
         "rt_min_s": round(min(per_request_times), 6) if per_request_times else 0.0,
         "rt_max_s": round(max(per_request_times), 6) if per_request_times else 0.0,
-        "bytes_each": sizes,
+        "rt_p50_s": round(percentile(per_request_times, 0.5), 6),
+        "rt_p99_s": round(percentile(per_request_times, 0.99), 6),
+        "rps": round(len(per_request_times) / total_elapsed, 1),
+        "bytes_each": sizes if requests == 1 else sorted(set(sizes)),
     }
     print(summary)
+    return summary
+
+
+def compare(args):
+    """The same load over TCP and over the Unix socket of one server (listening on both)."""
+    results = {}
+    for transport, unix in (("tcp", None), ("unix", args.unix)):
+        # A short warm-up so neither run pays for the server's first connections.
+        get(args.host, args.port, args.path, args.timeout, unix)
+        results[transport] = run_bench(args.host, args.port, args.path, args.concurrency, args.timeout,
+                                       args.requests, unix)
+        print()
+    print("=== TCP loopback vs Unix socket ===")
+    print(f"{'transport':<10} {'req/s':>9} {'avg ms':>9} {'p50 ms':>9} {'p99 ms':>9} {'failed':>7}")
+    for transport, r in results.items():
+        print(f"{transport:<10} {r['rps']:>9.0f} {r['rt_avg_s'] * 1000:>9.3f} {r['rt_p50_s'] * 1000:>9.3f} "
+              f"{r['rt_p99_s'] * 1000:>9.3f} {r['requests'] - r['ok']:>7}")
+    tcp, unix = results["tcp"], results["unix"]
+    if tcp["rt_avg_s"] and tcp["rps"]:
+        print(f"unix vs tcp: {unix['rps'] / tcp['rps'] - 1:+.1%} req/s, "
+              f"{unix['rt_avg_s'] / tcp['rt_avg_s'] - 1:+.1%} avg latency")
+
+
+def compare_h2(args):
+    """The same requests as one connection per request (HTTP/1.1), then as multiplexed HTTP/2 streams."""
+    results = {}
+    get(args.host, args.port, args.paths[0], args.timeout, args.unix)
+    results["http/1.1"] = run_bench(args.host, args.port, args.path, args.concurrency, args.timeout,
+                                    args.requests, args.unix, args.paths)
+    print()
+    results["h2"] = run_h2_bench(args.host, args.port, args.paths, args.concurrency, args.timeout,
+                                 args.requests, args.unix, args.connections)
+    print()
+    print(f"=== HTTP/1.1 (connection per request) vs HTTP/2 ({args.connections} connection(s), "
+          f"{args.concurrency} streams in flight) ===")
+    print(f"{'protocol':<10} {'req/s':>9} {'avg ms':>9} {'p50 ms':>9} {'p99 ms':>9} {'failed':>7}")
+    for protocol, r in results.items():
+        print(f"{protocol:<10} {r['rps']:>9.0f} {r['rt_avg_s'] * 1000:>9.3f} {r['rt_p50_s'] * 1000:>9.3f} "
+              f"{r['rt_p99_s'] * 1000:>9.3f} {r['requests'] - r['ok']:>7}")
+    h1, h2 = results["http/1.1"], results["h2"]
+    if h1["rt_avg_s"] and h1["rps"]:
+        print(f"h2 vs http/1.1: {h2['rps'] / h1['rps'] - 1:+.1%} req/s, "
+              f"{h2['rt_avg_s'] / h1['rt_avg_s'] - 1:+.1%} avg latency")
 
 
 if __name__ == "__main__":
@@ -99,7 +405,33 @@ if __name__ == "__main__":
     parser.add_argument("--path", default=os.getenv("BENCH_PATH", "/"), help="URL path (e.g., /, /index.html)")
     parser.add_argument("--concurrency", type=int, default=int(os.getenv("BENCH_CONCURRENCY", "10")), help="Number of concurrent requests")
     parser.add_argument("--timeout", type=int, default=int(os.getenv("BENCH_TIMEOUT", "20")), help="Socket timeout (s)")
+    parser.add_argument("--requests", type=int, default=int(os.getenv("BENCH_REQUESTS", "1")),
+                        help="Requests per client, sent one after another (one connection each)")
+    parser.add_argument("--unix", default=os.getenv("BENCH_UNIX"),
+                        help="Connect to this Unix domain socket (server --unix PATH) instead of host:port")
+    parser.add_argument("--compare", action="store_true",
+                        help="Run the same load over TCP (--host/--port) and then --unix, and compare them")
+    parser.add_argument("--paths", default=os.getenv("BENCH_PATHS"),
+                        help="Comma-separated URL paths to cycle through (a page with its assets); overrides --path")
+    parser.add_argument("--h2", action="store_true",
+                        help="Send the requests as HTTP/2 streams (server --http2), --concurrency of them in flight")
+    parser.add_argument("--connections", type=int, default=int(os.getenv("BENCH_CONNECTIONS", "1")),
+                        help="HTTP/2 connections the in-flight streams are spread over")
+    parser.add_argument("--compare-h2", action="store_true",
+                        help="Run the load as HTTP/1.1 (a connection per request) and then as HTTP/2, and compare")
     args = parser.parse_args()
-    run_bench(args.host, args.port, args.path, args.concurrency, args.timeout)
+    args.paths = [p.strip() for p in args.paths.split(",") if p.strip()] if args.paths else [args.path]
+    if args.compare_h2:
+        compare_h2(args)
+    elif args.h2:
+        run_h2_bench(args.host, args.port, args.paths, args.concurrency, args.timeout, args.requests, args.unix,
+                     args.connections)
+    elif args.compare:
+        if not args.unix:
+            parser.error("--compare needs --unix PATH (and a server listening on both)")
+        compare(args)
+    else:
+        run_bench(args.host, args.port, args.path, args.concurrency, args.timeout, args.requests, args.unix,
+                  args.paths)
 
 
@@ -1,6 +1,8 @@
 import argparse
 import os
 import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse, unquote, quote
 
 CRLF = b"\r\n"
@@ -62,6 +64,23 @@ def parse_response(raw):
         headers[k.strip().lower()] = v.strip()
     return status_code, reason, headers, body
 
+def decode_chunked(body):
+    """Body of a Transfer-Encoding: chunked response with the chunk framing removed."""
+    out = bytearray()
+    pos = 0
+    while True:
+        line_end = body.find(CRLF, pos)
+        if line_end == -1:
+            raise ValueError("Truncated chunked body")
+        size = int(body[pos:line_end].split(b";", 1)[0], 16)
+        if size == 0:
+            return bytes(out)
+        start = line_end + 2
+        if start + size > len(body):
+            raise ValueError("Truncated chunked body")
+        out += body[start:start + size]
+        pos = start + size + 2
+
 def guess_output_filename(url_path):
     parsed = urlparse(url_path)
     segment = os.path.basename(parsed.path.rstrip("/"))
@@ -70,42 +89,44 @@ def guess_output_filename(url_path):
         return "download.bin"
     return segment
 
-def build_get_request(host, path):
+def build_get_request(host, path, extra_headers=None):
     if not path.startswith("/"):
         path = "/" + path
-    path = quote(path, safe="/%._-~")
+    # Keep a query string (e.g. "?format=json&page=2") intact.
+    path = quote(path, safe="/%._-~?=&")
     lines = [
         "GET %s HTTP/1.1" % path,
         "Host: %s" % host,
         "Connection: close",
-        "",
-        "",
     ]
+    for k, v in (extra_headers or {}).items():
+        lines.append("%s: %s" % (k, v))
+    lines += ["", ""]
     return ("\r\n".join(lines)).encode("ascii")
 
-def main():
-    parser = argparse.ArgumentParser(description="Simple HTTP client for the lab")
-    parser.add_argument("server_host", help="Server host (e.g., 127.0.0.1)")
-    parser.add_argument("server_port", type=int, help="Server port (e.g., 8000)")
-    parser.add_argument("url_path", help="URL path to GET (e.g., /, /index.html, /image.png)")
-    parser.add_argument("out_dir", help="Directory to save files (used for PNG/PDF); can be '.'")
-    args = parser.parse_args()
-
-    req = build_get_request(args.server_host, args.url_path)
-
-    sock = socket.create_connection((args.server_host, args.server_port), timeout=10)
-    sock.sendall(req)
-
-    head_bytes, leftover = recv_until(sock, b"\r\n\r\n")
+def parse_head(head_bytes):
     head_text = head_bytes.decode("iso-8859-1")
     lines = head_text.split("\r\n") if head_text else []
     status_line = lines[0] if lines else "HTTP/1.1 000 Unknown"
+    parts = status_line.split(" ", 2)
+    status = int(parts[1]) if len(parts) >= 2 and parts[1].isdigit() else 0
     headers = {}
     for line in lines[1:]:
         if not line or ":" not in line:
             continue
         k, v = line.split(":", 1)
         headers[k.strip().lower()] = v.strip()
+    return status, headers
+
+def fetch(host, port, path, extra_headers=None, timeout=10):
+    """Single GET over its own connection; returns the raw response (head + body)."""
+    req = build_get_request(host, path, extra_headers)
+
+    sock = socket.create_connection((host, port), timeout=timeout)
+    sock.sendall(req)
+
+    head_bytes, leftover = recv_until(sock, b"\r\n\r\n")
+    _, headers = parse_head(head_bytes)
 
     body = leftover
     content_length = None
@@ -124,8 +145,142 @@ def main():
 
     sock.close()
 
-    raw = head_bytes + b"\r\n\r\n" + body
+    return head_bytes + b"\r\n\r\n" + body
+
+def parse_content_range(value):
+    """'bytes 0-0/12345' -> (0, 0, 12345); returns None if it cannot be parsed."""
+    try:
+        unit, spec = value.split(" ", 1)
+        span, total = spec.split("/", 1)
+        first, last = span.split("-", 1)
+        if unit.lower() != "bytes":
+            return None
+        return int(first), int(last), int(total)
+    except Exception:
+        return None
+
+def split_ranges(size, segments):
+    """Split [0, size) into at most `segments` contiguous inclusive (start, end) ranges."""
+    segments = max(1, min(segments, size))
+    step = size // segments
+    ranges = []
+    start = 0
+    for i in range(segments):
+        end = size - 1 if i == segments - 1 else start + step - 1
+        ranges.append((start, end))
+        start = end + 1
+    return ranges
+
+def download_segment(host, port, path, fd, start, end, timeout=20):
+    """
+    Fetch bytes [start, end] over a dedicated connection and write them straight
+    into the output file at their offset. Returns the number of bytes written.
+    """
+    req = build_get_request(host, path, {"Range": "bytes=%d-%d" % (start, end)})
+    sock = socket.create_connection((host, port), timeout=timeout)
+    try:
+        sock.sendall(req)
+        head_bytes, leftover = recv_until(sock, b"\r\n\r\n")
+        status, headers = parse_head(head_bytes)
+        if status != 206:
+            raise RuntimeError("segment %d-%d: expected 206, got %d" % (start, end, status))
+        served = parse_content_range(headers.get("content-range", ""))
+        if served is None or served[0] != start or served[1] != end:
+            raise RuntimeError("segment %d-%d: unexpected Content-Range %r"
+                               % (start, end, headers.get("content-range")))
+
+        expected = end - start + 1
+        offset = start
+        chunk = leftover
+        while True:
+            if chunk:
+                chunk = chunk[:start + expected - offset]
+                os.pwrite(fd, chunk, offset)
+                offset += len(chunk)
+            if offset - start >= expected:
+                break
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+        return offset - start
+    finally:
+        sock.close()
+
+def segmented_download(host, port, path, out_path, segments):
+    """
+    Download one file as `segments` concurrent byte ranges into a preallocated file.
+    Falls back to a single stream when the server does not answer the probe with 206.
+    """
+    started = time.perf_counter()
+    # Probe with a one-byte range: a 206 tells us the total size, a 200 means
+    # ranges are not supported and the probe response already is the whole file.
+    raw = fetch(host, port, path, {"Range": "bytes=0-0"})
+    status, reason, headers, body = parse_response(raw)
+
+    if status == 416:
+        # Only an empty resource cannot satisfy bytes=0-0; a plain GET is enough.
+        raw = fetch(host, port, path)
+        status, reason, headers, body = parse_response(raw)
+
+    if status == 200:
+        print("Server ignored Range; falling back to a single stream")
+        with open(out_path, "wb") as f:
+            f.write(body)
+        print("Saved:", out_path, "(%d bytes)" % len(body))
+        return
+
+    if status != 206:
+        print("HTTP %d %s" % (status, reason))
+        raise SystemExit(1)
+
+    served = parse_content_range(headers.get("content-range", ""))
+    if served is None:
+        raise SystemExit("Probe returned 206 without a usable Content-Range")
+    size = served[2]
+    ranges = split_ranges(size, segments)
+    print("Size: %d bytes, fetching %d segment(s) in parallel" % (size, len(ranges)))
+
+    fd = os.open(out_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o644)
+    try:
+        os.ftruncate(fd, size)
+        with ThreadPoolExecutor(max_workers=len(ranges)) as ex:
+            futures = [ex.submit(download_segment, host, port, path, fd, start, end)
+                       for start, end in ranges]
+            written = [fut.result() for fut in futures]
+        final_size = os.fstat(fd).st_size
+    finally:
+        os.close(fd)
+
+    for (start, end), count in zip(ranges, written):
+        if count != end - start + 1:
+            raise SystemExit("Segment %d-%d incomplete: %d of %d bytes"
+                             % (start, end, count, end - start + 1))
+    if final_size != size:
+        raise SystemExit("Length mismatch: expected %d bytes, file has %d" % (size, final_size))
+
+    elapsed = time.perf_counter() - started
+    print("Saved:", out_path, "(%d bytes in %.3fs, %d segments)" % (size, elapsed, len(ranges)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Simple HTTP client for the lab")
+    parser.add_argument("server_host", help="Server host (e.g., 127.0.0.1)")
+    parser.add_argument("server_port", type=int, help="Server port (e.g., 8000)")
+    parser.add_argument("url_path", help="URL path to GET (e.g., /, /index.html, /image.png)")
+    parser.add_argument("out_dir", help="Directory to save files (used for PNG/PDF); can be '.'")
+    parser.add_argument("--segments", type=int, default=1,
+                        help="Download a single file as N parallel byte ranges (default: 1 = one stream)")
+    args = parser.parse_args()
+
+    if args.segments > 1:
+        os.makedirs(args.out_dir, exist_ok=True)
+        out_path = os.path.join(args.out_dir, guess_output_filename(args.url_path))
+        segmented_download(args.server_host, args.server_port, args.url_path, out_path, args.segments)
+        return
+
+    raw = fetch(args.server_host, args.server_port, args.url_path)
     status, reason, headers, body = parse_response(raw)
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        body = decode_chunked(body)
     ctype = headers.get("content-type", "").lower()
 
     print("HTTP %d %s" % (status, reason))
@@ -0,0 +1,207 @@
+import argparse
+import os
+import sys
+import threading
+import time
+
+# Run from "Laboratory Work 2/": python client/contention_bench.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pool_bench import say  # noqa: E402
+from server.http_server import HTTPServer  # noqa: E402
+from server.ratelimit import RateLimitPolicy  # noqa: E402
+from server.shm import SharedState  # noqa: E402
+
+COUNTER_MODES = ("naive", "locked", "sketch", "shared")
+LIMITER_MODES = ("window", "gcra", "shared-window", "shared-gcra")
+
+
+class TimedLock:
+    """
+    Lock wrapper that adds up time spent blocked. The uncontended case is one
+    non-blocking acquire; the totals are updated while holding the lock, so they
+    need no lock of their own.
+    """
+
+    def __init__(self, lock):
+        self._lock = lock
+        self.acquired = 0
+        self.contended = 0
+        self.wait_s = 0.0
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self._lock.acquire(blocking=False):
+            self.acquired += 1
+            return True
+        if not blocking:
+            return False
+        start = time.perf_counter()
+        if not self._lock.acquire(True, timeout):
+            return False
+        self.wait_s += time.perf_counter() - start
+        self.acquired += 1
+        self.contended += 1
+        return True
+
+    def release(self):
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+
+def make_server(counter_mode, limiter_mode, rate, counter_delay, shm_name):
+    """An HTTPServer that is never started (no sockets), with every lock it uses timed."""
+    shared = None
+    if counter_mode == "shared" or limiter_mode.startswith("shared"):
+        shared = SharedState(shm_name, path_slots=16384, ip_slots=16384)
+    policy = RateLimitPolicy(default_limit=rate) if limiter_mode.endswith("gcra") else None
+    server = HTTPServer(counter_mode="locked" if counter_mode == "shared" else counter_mode,
+                        counter_delay=counter_delay, rate_limit=rate, shared_state=shared,
+                        rate_policy=policy, coalesce=False)
+    locks = []
+    for attr in ("_hits_lock", "_stats_lock", "_rate_limit_lock"):
+        setattr(server, attr, TimedLock(getattr(server, attr)))
+        locks.append(getattr(server, attr))
+    server._gcra._lock = TimedLock(server._gcra._lock)
+    locks.append(server._gcra._lock)
+    if shared is not None:
+        # The thread half of each striped lock; the fcntl half is uncontended in one process.
+        shared.locks._thread_locks = [TimedLock(lock) for lock in shared.locks._thread_locks]
+        locks.extend(shared.locks._thread_locks)
+    return server, shared, locks
+
+
+def run_case(op, mode, keys, threads, args):
+    name = f"contention-bench-{os.getpid()}"
+    counter_mode = mode if op != "limit" else "locked"
+    limiter_mode = mode if op == "limit" else "window"
+    server, shared, locks = make_server(counter_mode, limiter_mode, args.rate, args.counter_delay, name)
+    try:
+        if op == "limit":
+            names = [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(keys)]
+        else:
+            names = [f"/bench/p{i}.html" for i in range(keys)]
+        if op == "read":
+            # Counters exist before timing starts; reads then only look them up.
+            for key in names:
+                server.increment_hit(key)
+            for lock in locks:
+                lock.acquired = lock.contended = 0
+                lock.wait_s = 0.0
+
+        per_thread = max(1, args.ops // threads)
+        denied = [0] * threads
+        barrier = threading.Barrier(threads + 1)
+
+        def worker(index):
+            barrier.wait()
+            n = len(names)
+            if op == "increment":
+                for i in range(per_thread):
+                    server.increment_hit(names[(index + i * threads) % n])
+            elif op == "read":
+                for i in range(per_thread):
+                    server.get_hits_for_href(names[(index + i * threads) % n])
+            else:
+                route = "other" if limiter_mode.endswith("gcra") else None
+                blocked = 0
+                for i in range(per_thread):
+                    if not server.check_rate_limit(names[(index + i * threads) % n], route=route):
+                        blocked += 1
+                denied[index] = blocked
+
+        pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+        for t in pool:
+            t.start()
+        barrier.wait()
+        started = time.perf_counter()
+        for t in pool:
+            t.join()
+        elapsed = time.perf_counter() - started
+
+        total = per_thread * threads
+        if op == "increment":
+            # Every increment that a racing thread overwrote is missing from the sum.
+            lost = total - sum(server.get_hits_for_href(key) for key in names)
+        elif op == "limit":
+            # Denials callers saw vs. the server's own blocked counter.
+            counted = shared.rate_limit_blocked if limiter_mode == "shared-window" else server.rate_limit_blocked
+            lost = sum(denied) - counted
+        else:
+            lost = 0
+        return {
+            "ops": total,
+            "rps": total / elapsed,
+            "wait_ms": sum(lock.wait_s for lock in locks) * 1000,
+            "contended": sum(lock.contended for lock in locks) / max(1, sum(lock.acquired for lock in locks)),
+            "lost": lost,
+            "denied": sum(denied) / total if op == "limit" else None,
+        }
+    finally:
+        if shared is not None:
+            shared.close()
+            shared.unlink()
+
+
+def int_list(text):
+    return [int(x) for x in text.split(",") if x.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Lock contention of the hit counter and rate limiter modes (in-process, no sockets)")
+    parser.add_argument("--ops", type=int, default=20000, help="Operations per case, split across the threads")
+    parser.add_argument("--threads", type=int_list, default=[1, 2, 4, 8, 16, 32, 64],
+                        help="Comma-separated thread counts")
+    parser.add_argument("--paths", type=int_list, default=[1, 64, 4096],
+                        help="Comma-separated numbers of distinct URL paths (counter cases)")
+    parser.add_argument("--ips", type=int_list, default=[1, 64, 4096],
+                        help="Comma-separated numbers of distinct client IPs (limiter cases)")
+    parser.add_argument("--ops-kind", default="increment,read,limit",
+                        help="Which cases to run: increment, read, limit")
+    parser.add_argument("--counter-modes", default=",".join(COUNTER_MODES), help="Counter modes to compare")
+    parser.add_argument("--limiter-modes", default=",".join(LIMITER_MODES), help="Limiter modes to compare")
+    parser.add_argument("--rate", type=float, default=50.0, help="Rate limit per IP (req/s) for limiter cases")
+    parser.add_argument("--counter-delay", type=float, default=0.0,
+                        help="Server --counter-delay: sleep inside the read-modify-write (widens races)")
+    parser.add_argument("--switch-interval", type=float, default=None,
+                        help="sys.setswitchinterval() in seconds (smaller = more thread interleaving)")
+    parser.add_argument("--verbose", action="store_true", help="Keep the server's per-operation logs")
+    args = parser.parse_args()
+    if not args.verbose:
+        # Every counter/limiter call logs a line; the report goes to the real terminal.
+        sys.stdout = open(os.devnull, "w")
+    if args.switch_interval is not None:
+        sys.setswitchinterval(args.switch_interval)
+
+    kinds = [k.strip() for k in args.ops_kind.split(",") if k.strip()]
+    counter_modes = [m.strip() for m in args.counter_modes.split(",") if m.strip()]
+    limiter_modes = [m.strip() for m in args.limiter_modes.split(",") if m.strip()]
+
+    say("=== Lock Contention Bench ===")
+    say(f"{args.ops} ops per case, threads {args.threads}, counter delay {args.counter_delay}s, "
+        f"rate {args.rate:g}/s per IP")
+    say("wait_ms: total time threads spent blocked on server locks; contended: share of acquisitions that blocked")
+    say("lost: increments missing from the counters (increment) / denials missing from the blocked total (limit)")
+    say(f"\n{'op':<10} {'mode':<14} {'keys':>5} {'threads':>7} {'ops/s':>10} {'wait_ms':>10} "
+        f"{'contended':>10} {'lost':>7} {'denied':>7}")
+    for kind in kinds:
+        modes = limiter_modes if kind == "limit" else counter_modes
+        cardinalities = args.ips if kind == "limit" else args.paths
+        for mode in modes:
+            for keys in cardinalities:
+                for threads in args.threads:
+                    r = run_case(kind, mode, keys, threads, args)
+                    denied = f"{r['denied']:.0%}" if r["denied"] is not None else "-"
+                    say(f"{kind:<10} {mode:<14} {keys:>5} {threads:>7} {r['rps']:>10.0f} {r['wait_ms']:>10.1f} "
+                        f"{r['contended']:>10.1%} {r['lost']:>7} {denied:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Run from "Laboratory Work 2/": python client/cpu_bench.py
+LAB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, LAB)
+
+from bench import get, percentile  # noqa: E402
+from pool_bench import free_port  # noqa: E402
+
+
+def start_server(port, mode, args):
+    """A server process (not a thread here: our load generator would share its GIL)."""
+    cmd = [sys.executable, "-m", "server", "--port", str(port), "--root", args.root, "--workers", str(args.workers),
+           "--counter-mode", "locked", "--cpu-offload", mode]
+    if args.processes:
+        cmd += ["--cpu-processes", str(args.processes)]
+    if args.task == "burn":
+        cmd += ["--cpu-work", str(args.cpu_work)]
+    else:
+        # Without coalescing every request compresses the file itself.
+        cmd += ["--gzip", str(args.gzip_level), "--no-coalesce"]
+    server = subprocess.Popen(cmd, cwd=LAB, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError(f"server ({mode}) did not start")
+
+
+def cpu_seconds(pid):
+    """User + system CPU of a process and its live children (the offload pool)."""
+    ticks = os.sysconf("SC_CLK_TCK")
+    total = 0.0
+    pids = [pid]
+    try:
+        for tid in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{tid}/children") as f:
+                pids += [int(child) for child in f.read().split()]
+    except OSError:
+        pass
+    for p in pids:
+        try:
+            with open(f"/proc/{p}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            total += (int(fields[11]) + int(fields[12])) / ticks
+        except OSError:
+            pass
+    return total
+
+
+def run_load(port, concurrency, args):
+    headers = {"Accept-Encoding": "gzip"} if args.task == "gzip" else None
+
+    def client():
+        times = []
+        for _ in range(args.requests):
+            try:
+                times.append(get("127.0.0.1", port, args.path, args.timeout, headers=headers)[0])
+            except Exception:
+                times.append(None)
+        return times
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as ex:
+        results = [t for fut in [ex.submit(client) for _ in range(concurrency)] for t in fut.result()]
+    elapsed = time.perf_counter() - start
+    times = [t for t in results if t is not None]
+    return elapsed, times, len(results) - len(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU-bound request work on worker threads vs a process pool")
+    parser.add_argument("--task", choices=["burn", "gzip"], default="burn",
+                        help="burn: synthetic pure-Python work (--cpu-work); gzip: compress --path per request")
+    parser.add_argument("--cpu-work", type=int, default=20, help="Server --cpu-work units per request (burn)")
+    parser.add_argument("--gzip-level", type=int, default=9, help="Server --gzip level (gzip)")
+    parser.add_argument("--root", default="./content", help="Content root served by the test servers")
+    parser.add_argument("--path", default="/index.html", help="URL path to request")
+    parser.add_argument("--modes", default="thread,process", help="Server --cpu-offload modes to compare")
+    parser.add_argument("--processes", type=int, default=None, help="Server --cpu-processes (default: CPUs)")
+    parser.add_argument("--workers", type=int, default=16, help="Server --workers")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated client counts")
+    parser.add_argument("--requests", type=int, default=20, help="Requests per client, one after another")
+    parser.add_argument("--timeout", type=int, default=60, help="Socket timeout (s)")
+    args = parser.parse_args()
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    print("=== CPU Offload Bench ===")
+    work = f"{args.cpu_work} unit(s) of synthetic work" if args.task == "burn" else f"gzip -{args.gzip_level} of {args.path}"
+    print(f"Task: {work}    Server workers: {args.workers}    Requests per client: {args.requests}")
+    print(f"CPUs available: {cpus}")
+    if cpus < 2:
+        print("note: with one CPU a process pool cannot run work in parallel; expect only its overhead")
+    print("cores: server CPU time (pool processes included) per second of wall time")
+    print(f"\n{'mode':<8} {'clients':>7} {'req/s':>9} {'avg ms':>9} {'p50 ms':>9} {'p99 ms':>9} {'cores':>6} {'failed':>7}")
+    for mode in modes:
+        port = free_port()
+        server = start_server(port, mode, args)
+        try:
+            run_load(port, 2, args)  # warm-up
+            for concurrency in levels:
+                cpu_before = cpu_seconds(server.pid)
+                elapsed, times, failed = run_load(port, concurrency, args)
+                cores = (cpu_seconds(server.pid) - cpu_before) / elapsed
+                avg = sum(times) / len(times) if times else 0.0
+                print(f"{mode:<8} {concurrency:>7} {len(times) / elapsed:>9.1f} {avg * 1000:>9.2f} "
+                      f"{percentile(times, 0.5) * 1000:>9.2f} {percentile(times, 0.99) * 1000:>9.2f} "
+                      f"{cores:>6.2f} {failed:>7}")
+        finally:
+            server.send_signal(signal.SIGTERM)
+            try:
+                server.wait(15)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import argparse
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Run from "Laboratory Work 2/": python client/pack_bench.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bench import get  # noqa: E402
+from pool_bench import say, free_port  # noqa: E402
+from server.http_server import HTTPServer  # noqa: E402
+from server.pack import ContentPack, build_pack  # noqa: E402
+from server.pathing import set_root  # noqa: E402
+
+# open() calls made anywhere in this process, counted with an audit hook (3.8+).
+opens = [0]
+
+
+def count_opens(event, args):
+    if event == "open":
+        opens[0] += 1
+
+
+def make_tree(root, count, size):
+    """A flat-ish synthetic tree: `count` small HTML files spread over 10 directories."""
+    body = b"<p>" + b"x" * max(0, size - 7) + b"</p>"
+    for i in range(count):
+        directory = os.path.join(root, f"dir{i % 10}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"page{i:05d}.html"), "wb") as f:
+            f.write(body)
+
+
+def start_server(pack=None, workers=16):
+    port = free_port()
+    server = HTTPServer(host="127.0.0.1", port=port, max_workers=workers, counter_mode="locked", pack=pack)
+    threading.Thread(target=server.start, daemon=True).start()
+    for _ in range(50):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return port
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("server did not start")
+
+
+def run_pass(port, paths, concurrency, timeout):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as ex:
+        times = sorted(t for t, _ in ex.map(lambda p: get("127.0.0.1", port, p, timeout), paths))
+    return time.perf_counter() - started, times
+
+
+def bench_mode(name, paths, args, pack_path=None):
+    opens[0] = 0
+    started = time.perf_counter()
+    pack = ContentPack(pack_path) if pack_path else None
+    open_s = time.perf_counter() - started
+    port = start_server(pack, args.workers)
+    first, _ = run_pass(port, paths[:1], 1, args.timeout)
+    cold, _ = run_pass(port, paths, args.concurrency, args.timeout)
+    cold_opens = opens[0]
+    opens[0] = 0
+    warm_paths = (paths * (args.requests // len(paths) + 1))[:args.requests]
+    elapsed, times = run_pass(port, warm_paths, args.concurrency, args.timeout)
+    warm_opens = opens[0]
+    return {
+        "name": name,
+        "open_ms": open_s * 1000,
+        "first_ms": first * 1000,
+        "cold_s": cold,
+        "cold_opens": cold_opens,
+        "rps": len(warm_paths) / elapsed,
+        "p50_ms": times[len(times) // 2] * 1000,
+        "p95_ms": times[int(0.95 * (len(times) - 1))] * 1000,
+        "opens_per_req": warm_opens / len(warm_paths),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare directory serving with a memory-mapped content pack")
+    parser.add_argument("--root", default="./content", help="Content tree to serve and pack")
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="Instead of --root, generate this many small HTML files in a temp tree")
+    parser.add_argument("--file-size", type=int, default=2048, help="Size of each synthetic file (bytes)")
+    parser.add_argument("--requests", type=int, default=3000, help="Warm requests per mode")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent client connections")
+    parser.add_argument("--workers", type=int, default=16, help="Server worker threads")
+    parser.add_argument("--timeout", type=int, default=30, help="Socket timeout (s)")
+    parser.add_argument("--verbose", action="store_true", help="Keep the servers' request logs")
+    args = parser.parse_args()
+    if not args.verbose:
+        sys.stdout = open(os.devnull, "w")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = args.root
+        if args.synthetic:
+            root = os.path.join(tmp, "tree")
+            make_tree(root, args.synthetic, args.file_size)
+        set_root(root)
+        pack_path = os.path.join(tmp, "content.pack")
+        started = time.perf_counter()
+        info = build_pack(root, pack_path)
+        build_s = time.perf_counter() - started
+
+        index = ContentPack(pack_path)
+        suffixes = (".html", ".htm", ".png", ".pdf")
+        paths = [p for p in index.files if p.lower().endswith(suffixes)]
+        index.close()
+        if not paths:
+            say("No servable files under", root)
+            return
+
+        say("=== Content Pack Bench ===")
+        say(f"Tree: {os.path.abspath(root)}  ({len(paths)} servable files)")
+        say(f"Pack: {info['files']} files, {info['bytes'] / (1 << 20):.1f} MiB, built in {build_s:.2f}s")
+        sys.addaudithook(count_opens)
+        results = [bench_mode("directory", paths, args), bench_mode("pack", paths, args, pack_path)]
+
+    say(f"\n{'mode':<10} {'open_ms':>8} {'first_ms':>9} {'cold_pass_s':>12} {'cold_opens':>11} "
+        f"{'req/s':>8} {'p50_ms':>7} {'p95_ms':>7} {'opens/req':>10}")
+    for r in results:
+        say(f"{r['name']:<10} {r['open_ms']:>8.1f} {r['first_ms']:>9.1f} {r['cold_s']:>12.3f} {r['cold_opens']:>11} "
+            f"{r['rps']:>8.0f} {r['p50_ms']:>7.2f} {r['p95_ms']:>7.2f} {r['opens_per_req']:>10.2f}")
+    say("\nopen_ms: mapping the pack + loading its index; cold pass: first request to every file once.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Run from "Laboratory Work 2/": python client/pool_bench.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bench import get  # noqa: E402
+from server.http_server import HTTPServer  # noqa: E402
+from server.pathing import set_root  # noqa: E402
+from server.pool import AdaptivePool  # noqa: E402
+
+
+def say(*parts):
+    # Server threads print per-request logs to stdout; the report goes to the real terminal.
+    print(*parts, file=sys.__stdout__, flush=True)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port, workers, min_workers, delay):
+    server = HTTPServer(host="127.0.0.1", port=port, max_workers=workers,
+                        simulated_delay_seconds=delay, counter_mode="locked",
+                        min_workers=min_workers, pool_options={"idle_timeout": 1.0})
+    threading.Thread(target=server.start, daemon=True).start()
+    for _ in range(50):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return server
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("server did not start")
+
+
+def pool_threads(server):
+    if isinstance(server.executor, AdaptivePool):
+        return server.executor.stats()["size"]
+    return len(server.executor._threads)
+
+
+def run_phase(port, path, concurrency, timeout):
+    times = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as ex:
+        for fut in [ex.submit(get, "127.0.0.1", port, path, timeout) for _ in range(concurrency)]:
+            try:
+                times.append(fut.result()[0])
+            except Exception:
+                pass
+    return time.perf_counter() - start, sorted(times)
+
+
+def bench_config(name, workers, min_workers, args):
+    port = free_port()
+    server = start_server(port, workers, min_workers, args.delay)
+    results = []
+    for burst in args.bursts:
+        elapsed, times = run_phase(port, args.path, burst, args.timeout)
+        p95 = times[int(0.95 * (len(times) - 1))] if times else 0.0
+        peak = pool_threads(server)
+        time.sleep(args.idle)
+        results.append((burst, elapsed, p95, peak, pool_threads(server)))
+    say(f"\n--- {name} ---")
+    say(f"{'burst':>6} {'elapsed_s':>10} {'p95_s':>8} {'threads@end':>12} {'threads@idle':>13}")
+    for burst, elapsed, p95, peak, idle_threads in results:
+        say(f"{burst:>6} {elapsed:>10.3f} {p95:>8.3f} {peak:>12} {idle_threads:>13}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare fixed vs adaptive worker pools in-process")
+    parser.add_argument("--root", default="./content", help="Content root served by the test servers")
+    parser.add_argument("--path", default="/index.html", help="URL path to request")
+    parser.add_argument("--delay", type=float, default=0.2, help="Simulated per-request work (s)")
+    parser.add_argument("--min-workers", type=int, default=2, help="Small fixed pool / adaptive minimum")
+    parser.add_argument("--max-workers", type=int, default=32, help="Large fixed pool / adaptive maximum")
+    parser.add_argument("--bursts", type=int, nargs="+", default=[2, 16, 32, 4],
+                        help="Concurrent request bursts, run in order")
+    parser.add_argument("--idle", type=float, default=2.0, help="Idle gap after each burst (s)")
+    parser.add_argument("--timeout", type=int, default=30, help="Socket timeout (s)")
+    parser.add_argument("--verbose", action="store_true", help="Keep the servers' request logs")
+    args = parser.parse_args()
+    set_root(args.root)
+    if not args.verbose:
+        sys.stdout = open(os.devnull, "w")
+
+    say("=== Worker Pool Bench ===")
+    say(f"Path: {args.path}  Delay: {args.delay}s  Bursts: {args.bursts}  Idle gap: {args.idle}s")
+    bench_config(f"fixed {args.min_workers}", args.min_workers, None, args)
+    bench_config(f"fixed {args.max_workers}", args.max_workers, None, args)
+    bench_config(f"adaptive {args.min_workers}..{args.max_workers}", args.max_workers, args.min_workers, args)
+    say("\nthreads@idle shows memory held between bursts; elapsed/p95 show what each pool costs under load.")
+
+
+if __name__ == "__main__":
+    main()
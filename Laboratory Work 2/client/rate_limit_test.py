@@ -2,11 +2,17 @@ import time
 import socket
 import argparse
 import os
+import threading
+from collections import deque
 from urllib.parse import quote
 
 
-def send_request(host, port, path="/", timeout=5):
-    """Send a single GET request and return (status_code, elapsed_time)."""
+def send_request(host, port, path="/", timeout=5, source=None):
+    """
+    Send a single GET request and return (status_code, elapsed_time).
+    source binds the client end to that local address (e.g. 127.4.0.7) so the
+    server sees it as a different client IP.
+    """
     if not path.startswith("/"):
         path = "/" + path
     path = quote(path, safe="/%._-~")
@@ -19,7 +25,8 @@ def send_request(host, port, path="/", timeout=5):
     
     start = time.perf_counter()
     try:
-        s = socket.create_connection((host, port), timeout=timeout)
+        s = socket.create_connection((host, port), timeout=timeout,
+                                     source_address=(source, 0) if source else None)
         s.sendall(req)
         
         buf = b""
@@ -107,13 +114,251 @@ def test_rate_limit(host, port, path="/", requests_per_second=10, duration=5, na
     }
 
 
+# --- Many-client harness ---------------------------------------------------
+# Every address in 127.0.0.0/8 is loopback on Linux, so binding the client side
+# of each connection to a different one makes the server see thousands of
+# distinct client IPs from one machine (macOS only routes 127.0.0.1 by default).
+
+def hot_address(phase, index):
+    """Measured clients: 127.0.<phase+1>.<index+1>, fresh for every phase."""
+    return f"127.0.{phase + 1}.{index + 1}"
+
+
+def background_address(index):
+    """Background clients: 127.16.0.0 upwards, shared by all phases."""
+    return f"127.{16 + (index >> 16)}.{(index >> 8) & 255}.{index & 255}"
+
+
+class ReferenceLimiter:
+    """
+    What an ideal limiter with the server's settings should answer, replayed on
+    the client from send times. Client and server clocks see each request a few
+    ms apart, so a decision that would flip anywhere within +/- margin is
+    counted as borderline instead of judged.
+      window: exact sliding log, `limit` requests in any 1 s (--rate-limit)
+      gcra:   token bucket of rate `limit` and burst `limit` (--route-limits policy)
+    """
+
+    def __init__(self, model, limit, margin):
+        self.model = model
+        self.limit = limit
+        self.margin = margin
+        self.log = deque()
+        self.tat = 0.0
+
+    def _allows(self, t):
+        if self.model == "gcra":
+            return max(self.tat, t) - t <= max(0.0, self.limit - 1.0) / self.limit
+        return sum(1 for ts in self.log if ts > t - 1.0) < self.limit
+
+    def expect(self, t):
+        """True/False for a clear-cut decision at time t, None when borderline."""
+        early, late = self._allows(t - self.margin), self._allows(t + self.margin)
+        return early if early == late else None
+
+    def charge(self, t):
+        """Record a request the server allowed (the server's history, not ours)."""
+        if self.model == "gcra":
+            self.tat = max(self.tat, t) + 1.0 / self.limit
+        else:
+            self.log.append(t)
+            while self.log and self.log[0] <= t - 1.0 - self.margin:
+                self.log.popleft()
+
+
+def run_hot_client(args, address, schedule, results):
+    """Send at the given offsets (s) from one address, judging each answer."""
+    reference = ReferenceLimiter(args.model, args.limit, args.margin)
+    start = time.perf_counter()
+    for offset in schedule:
+        delay = start + offset - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        sent = time.perf_counter()
+        expected = reference.expect(sent)
+        status, elapsed = send_request(args.host, args.port, args.path, source=address)
+        results.append((status, elapsed, expected))
+        if status == 200:
+            reference.charge(sent)
+
+
+def hot_schedules(args):
+    """(kind, offsets) per measured client: steady ones under the limit, bursty ones over it in bursts."""
+    steady_interval = 1.0 / (args.limit * args.steady_fraction)
+    steady = [i * steady_interval for i in range(int(args.duration / steady_interval))]
+    burst_size = max(1, int(args.limit * args.burst_factor))
+    bursty = [start + i * 0.002 for start in range_float(0.0, args.duration, args.burst_period)
+              for i in range(burst_size)]
+    schedules = []
+    for i in range(args.steady + args.bursty):
+        # Staggered starts so clients do not all fire on the same tick.
+        shift = (i / max(1, args.steady + args.bursty)) * min(1.0, args.burst_period)
+        offsets = steady if i < args.steady else bursty
+        schedules.append(("steady" if i < args.steady else "bursty", [o + shift for o in offsets]))
+    return schedules
+
+
+def range_float(start, stop, step):
+    value = start
+    while value < stop:
+        yield value
+        value += step
+
+
+def run_background(args, clients, rps, duration, latencies, stop_at):
+    """Spread `rps` requests/s round-robin over `clients` background addresses."""
+    total = int(rps * duration)
+    start = time.perf_counter()
+
+    def worker(w):
+        for i in range(w, total, args.workers):
+            delay = start + i / rps - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            if time.perf_counter() > stop_at:
+                return
+            status, elapsed = send_request(args.host, args.port, args.path, source=background_address(i % clients))
+            latencies.append((status, elapsed))
+
+    threads = [threading.Thread(target=worker, args=(w,)) for w in range(args.workers)]
+    for t in threads:
+        t.start()
+    return threads
+
+
+def prime_clients(args, first, last):
+    """One request from each background address in [first, last), so the server tracks them all."""
+    def worker(w):
+        for i in range(first + w, last, args.workers):
+            send_request(args.host, args.port, args.path, source=background_address(i))
+
+    threads = [threading.Thread(target=worker, args=(w,)) for w in range(args.workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def run_phase(args, phase, clients, primed):
+    if clients > primed:
+        started = time.perf_counter()
+        prime_clients(args, primed, clients)
+        print(f"  primed {clients - primed} new client address(es) in {time.perf_counter() - started:.1f}s")
+
+    # Background load stays under the limit for every address.
+    bg_rps = min(args.background_rps, clients * args.limit * 0.5)
+    background = []
+    stop_at = time.perf_counter() + args.duration + 1.0
+    bg_threads = run_background(args, clients, bg_rps, args.duration, background, stop_at)
+
+    hot_results = {}
+    hot_threads = []
+    for i, (kind, schedule) in enumerate(hot_schedules(args)):
+        results = hot_results.setdefault(kind, [])
+        t = threading.Thread(target=run_hot_client, args=(args, hot_address(phase, i), schedule, results))
+        t.start()
+        hot_threads.append(t)
+    for t in hot_threads + bg_threads:
+        t.join()
+
+    row = {"clients": clients, "bg_rps": bg_rps}
+    all_latencies = [e for _, e in background]
+    for kind, results in hot_results.items():
+        all_latencies += [e for _, e, _ in results]
+        row[kind] = {
+            "sent": len(results),
+            "allowed": sum(1 for s, _, _ in results if s == 200),
+            # 429 where an ideal limiter allows / 200 where it would have refused.
+            "false_blocks": sum(1 for s, _, x in results if s == 429 and x is True),
+            "false_allows": sum(1 for s, _, x in results if s == 200 and x is False),
+            "borderline": sum(1 for _, _, x in results if x is None),
+            "errors": sum(1 for s, _, _ in results if s not in (200, 429)),
+        }
+    row["errors_bg"] = sum(1 for s, _ in background if s not in (200, 429))
+    row["blocked_bg"] = sum(1 for s, _ in background if s == 429)
+    row["p50"] = percentile(all_latencies, 0.50) * 1000
+    row["p95"] = percentile(all_latencies, 0.95) * 1000
+    row["p99"] = percentile(all_latencies, 0.99) * 1000
+    return row
+
+
+def run_harness(args):
+    print(f"\nRate Limiter Scalability")
+    print(f"Server: {args.host}:{args.port}  path {args.path}  (started with a limit of {args.limit:g}/s, "
+          f"model '{args.model}')")
+    print(f"Measured clients per phase: {args.steady} steady at {args.steady_fraction:.0%} of the limit, "
+          f"{args.bursty} bursty ({max(1, int(args.limit * args.burst_factor))} back-to-back every {args.burst_period:g}s)")
+    print(f"Background: up to {args.background_rps:g} req/s spread over the tracked clients; "
+          f"{args.duration}s per phase, {args.workers} sender threads")
+
+    rows = []
+    primed = 0
+    for phase, clients in enumerate(args.clients):
+        print(f"\n--- Phase {phase + 1}: {clients} tracked client(s) ---")
+        rows.append(run_phase(args, phase, clients, primed))
+        primed = max(primed, clients)
+        if args.pause:
+            time.sleep(args.pause)
+
+    print("\n" + "=" * 100)
+    print("RESULTS (false = disagrees with an ideal limiter; borderline decisions within "
+          f"±{args.margin * 1000:.0f} ms are not judged)")
+    print("=" * 100)
+    print(f"{'clients':>8} {'bg req/s':>8} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} "
+          f"{'steady ok':>10} {'false blk':>9} {'bursty ok':>10} {'false alw':>9} {'false blk':>9} "
+          f"{'border':>6} {'errors':>6}")
+    for r in rows:
+        steady = r.get("steady", {"sent": 0, "allowed": 0, "false_blocks": 0, "false_allows": 0, "borderline": 0, "errors": 0})
+        bursty = r.get("bursty", {"sent": 0, "allowed": 0, "false_blocks": 0, "false_allows": 0, "borderline": 0, "errors": 0})
+        print(f"{r['clients']:>8} {r['bg_rps']:>8.0f} {r['p50']:>7.2f} {r['p95']:>7.2f} {r['p99']:>7.2f} "
+              f"{steady['allowed']:>4}/{steady['sent']:<5} {steady['false_blocks'] + steady['false_allows']:>9} "
+              f"{bursty['allowed']:>4}/{bursty['sent']:<5} {bursty['false_allows']:>9} {bursty['false_blocks']:>9} "
+              f"{steady['borderline'] + bursty['borderline']:>6} "
+              f"{steady['errors'] + bursty['errors'] + r['errors_bg']:>6}")
+        if r["blocked_bg"]:
+            print(f"{'':>8} ⚠ {r['blocked_bg']} background request(s) blocked although each address stays under the limit")
+    print("=" * 100)
+
+
+def int_list(text):
+    return [int(x) for x in text.split(",") if x.strip()]
+
+
 def main():
     parser = argparse.ArgumentParser(description="Rate limit testing for HTTP server")
     parser.add_argument("--host", default=os.getenv("BENCH_HOST", "127.0.0.1"), help="Server host")
     parser.add_argument("--port", type=int, default=int(os.getenv("BENCH_PORT", "8000")), help="Server port")
     parser.add_argument("--path", default="/", help="Request path")
     parser.add_argument("--duration", type=int, default=5, help="Test duration in seconds")
+    parser.add_argument("--clients", type=int_list, default=None,
+                        help="Many-client mode: comma-separated tracked-client counts, one phase each "
+                             "(e.g. 10,100,1000,10000; needs the 127.0.0.0/8 loopback range)")
+    parser.add_argument("--limit", type=float, default=5.0, help="The server's per-IP limit (req/s)")
+    parser.add_argument("--model", choices=["window", "gcra"], default="window",
+                        help="Ideal limiter to judge against: window (--rate-limit) or gcra (--route-limits)")
+    parser.add_argument("--steady", type=int, default=5, help="Measured clients sending steadily under the limit")
+    parser.add_argument("--steady-fraction", type=float, default=0.8, help="Steady clients' rate as a fraction of the limit")
+    parser.add_argument("--bursty", type=int, default=5, help="Measured clients sending bursts over the limit")
+    parser.add_argument("--burst-factor", type=float, default=2.0, help="Burst size as a multiple of the limit")
+    parser.add_argument("--burst-period", type=float, default=2.0, help="Seconds between bursts")
+    parser.add_argument("--background-rps", type=float, default=200.0,
+                        help="Requests/s from the background clients (keeps them tracked)")
+    parser.add_argument("--workers", type=int, default=32, help="Sender threads for background traffic")
+    parser.add_argument("--margin", type=float, default=0.02,
+                        help="Clock tolerance (s) for judging decisions against the ideal limiter")
+    parser.add_argument("--pause", type=float, default=2.0, help="Idle seconds between phases")
     args = parser.parse_args()
+
+    if args.clients:
+        run_harness(args)
+        return
     
     print(f"\nRate Limit Testing")
     print(f"Server: {args.host}:{args.port}")
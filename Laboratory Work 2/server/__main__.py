@@ -1,6 +1,20 @@
 import argparse
+import multiprocessing
+import os
+import signal
 from .http_server import HTTPServer
 from .pathing import set_root
+from .persistence import HitStore
+from .shm import SharedState
+from .shaping import BandwidthShaper
+from .ratelimit import RateLimitPolicy, parse_route_map
+from .pack import ContentPack
+from .tracing import Tracer
+from .proxy import parse_trusted
+from .handoff import HandoffServer, take_over
+from .cpuwork import CPUOffload
+from .events import default_max_subscribers
+from .listeners import ListenSpec, open_listener, parse_listen, remove_socket_files, socket_label, systemd_sockets
 from pathlib import Path
 
 
@@ -8,33 +22,326 @@ def parse_args():
     p = argparse.ArgumentParser(description="Simple HTTP file server (lab)")
     p.add_argument("--host", default="127.0.0.1", help="Host to bind to")
     p.add_argument("--port", default=8000, type=int, help="Port to bind to")
+    p.add_argument("--listen", action="append", default=[], metavar="ADDR",
+                   help="Listener 'HOST:PORT' or 'unix:PATH', optionally with ',backlog=N,rcvbuf=BYTES,sndbuf=BYTES' "
+                        "(repeatable; replaces --host/--port)")
+    p.add_argument("--unix", action="append", default=[], metavar="PATH",
+                   help="Listen on a Unix domain socket (repeatable; same as --listen unix:PATH, so add "
+                        "--listen HOST:PORT to keep a TCP listener too)")
+    p.add_argument("--systemd", action="store_true",
+                   help="Also accept on sockets passed by systemd socket activation (LISTEN_FDS)")
+    p.add_argument("--backlog", default=128, type=int, help="Default accept queue length of each listener")
+    p.add_argument("--rcvbuf", default=0, type=int, help="Default SO_RCVBUF of each listener in bytes (0 = kernel default)")
+    p.add_argument("--sndbuf", default=0, type=int, help="Default SO_SNDBUF of each listener in bytes (0 = kernel default)")
     p.add_argument("--root", default="./content", help="Root directory to serve")
+    p.add_argument("--pack", default=None,
+                   help="Serve from a content pack built with 'python -m server.pack' instead of --root")
     p.add_argument("--workers", default=10, type=int, help="Max worker threads (bounded thread pool)")
+    p.add_argument("--min-workers", default=None, type=int,
+                   help="Enable the adaptive pool: scale between this and --workers threads")
+    p.add_argument("--grow-wait", default=0.05, type=float,
+                   help="Adaptive pool: add a thread once a queued connection waited this long (s)")
+    p.add_argument("--idle-timeout", default=5.0, type=float,
+                   help="Adaptive pool: retire a thread after this long without work (s)")
+    p.add_argument("--bulk-workers", default=0, type=int,
+                   help="Separate worker budget for large file downloads (0 = one shared pool)")
+    p.add_argument("--bulk-queue", default=None, type=int,
+                   help="Bulk requests allowed to wait for a bulk worker; more get 503 (default: 4 per bulk worker)")
+    p.add_argument("--bulk-threshold", default=256 * 1024, type=int,
+                   help="Files at least this many bytes use the bulk lane")
+    p.add_argument("--bw-global", default=0.0, type=float,
+                   help="Total send bandwidth for large responses in KiB/s (0 = unlimited)")
+    p.add_argument("--bw-per-conn", default=0.0, type=float,
+                   help="Send bandwidth per large response in KiB/s (0 = unlimited)")
+    p.add_argument("--bw-min-bytes", default=64 * 1024, type=int,
+                   help="Responses smaller than this are never shaped")
+    p.add_argument("--no-coalesce", action="store_true",
+                   help="Disable single-flight coalescing of concurrent reads/renders of the same resource")
+    p.add_argument("--memory-budget", default=0.0, type=float,
+                   help="Max MiB of response bodies buffered at once; beyond it requests wait, stream or get 503 (0 = unlimited)")
+    p.add_argument("--memory-wait", default=0.5, type=float,
+                   help="Seconds a request may wait for budget before streaming / 503")
     p.add_argument("--delay", default=0.0, type=float, help="Simulated work delay in seconds")
-    p.add_argument("--counter-mode", choices=["naive", "locked"], default="naive",
-                   help="Hit counter mode: naive (race) or locked (synchronized)")
+    p.add_argument("--cpu-work", default=0, type=int,
+                   help="Synthetic CPU-bound work per request, in units of 10k pure-Python loop iterations")
+    p.add_argument("--gzip", default=0, type=int, choices=range(0, 10), metavar="LEVEL",
+                   help="gzip HTML files for clients that accept it, at this level (1-9; 0 = off)")
+    p.add_argument("--cpu-offload", default="thread", choices=["thread", "process"],
+                   help="Run CPU-bound work (--cpu-work, --gzip) on the worker thread or in a process pool")
+    p.add_argument("--cpu-processes", default=None, type=int,
+                   help="Process pool size for --cpu-offload process (default: number of CPUs)")
+    p.add_argument("--keep-alive", default=0.0, type=float,
+                   help="Keep HTTP/1.1 connections open this many seconds for further requests (0 = close after each)")
+    p.add_argument("--http2", action="store_true",
+                   help="Also speak cleartext HTTP/2 (h2c): by prior knowledge or via \"Upgrade: h2c\"")
+    p.add_argument("--http2-workers", default=32, type=int,
+                   help="Threads answering HTTP/2 streams (shared by all HTTP/2 connections)")
+    p.add_argument("--http2-streams", default=100, type=int,
+                   help="Concurrent streams allowed per HTTP/2 connection (SETTINGS_MAX_CONCURRENT_STREAMS)")
+    p.add_argument("--trusted-proxies", default=None,
+                   help="Comma-separated proxy IPs/CIDRs whose X-Forwarded-For gives the client IP (see server.proxy)")
+    p.add_argument("--counter-mode", choices=["naive", "locked", "sketch", "shared"], default="naive",
+                   help="Hit counter mode: naive (race), locked (synchronized), sketch (bounded memory, approximate) "
+                        "or shared (shared memory across server processes)")
     p.add_argument("--counter-delay", default=0.0, type=float,
                    help="Extra delay during counter increment to force interleaving (seconds)")
+    p.add_argument("--sketch-width", default=2048, type=int, help="Count-Min sketch counters per row (sketch mode)")
+    p.add_argument("--sketch-depth", default=4, type=int, help="Count-Min sketch rows (sketch mode)")
+    p.add_argument("--top-k", default=32, type=int, help="Heavy-hitter paths tracked for stats (sketch mode)")
     p.add_argument("--rate-limit", default=0.0, type=float,
                    help="Rate limit per IP (requests/second, 0 = disabled)")
-    return p.parse_args()
+    p.add_argument("--route-limits", default=None,
+                   help="Per-IP budgets by route, cost units/s, e.g. 'listing=2,file=5,internal=1,other=10'")
+    p.add_argument("--route-costs", default=None,
+                   help="Base cost per request by route, e.g. 'listing=2' (default 1 each)")
+    p.add_argument("--cost-per-mib", default=0.0, type=float,
+                   help="Extra cost units per MiB of file sent (weights requests by size)")
+    p.add_argument("--global-rate-limit", default=0.0, type=float,
+                   help="Server-wide ceiling in cost units/s across all clients (0 = none)")
+    p.add_argument("--profile", action="store_true",
+                   help="Enable the /_profile endpoint (sampling profiler; loopback clients only unless --profile-token)")
+    p.add_argument("--profile-token", default=None,
+                   help="Allow /_profile from anywhere when called with ?token=<this value>")
+    p.add_argument("--profile-sample-rate", default=0.0, type=float,
+                   help="Run this fraction of requests under cProfile (read via /_profile?mode=cprofile)")
+    p.add_argument("--events-interval", default=1.0, type=float,
+                   help="Seconds between live stats events on /_events (Server-Sent Events)")
+    p.add_argument("--events-max", default=None, type=int,
+                   help="Max /_events subscribers; each holds a worker (default: a quarter of --workers, "
+                        "or of --bulk-workers when set)")
+    p.add_argument("--trace", action="store_true",
+                   help="Record per-request spans; export Chrome trace JSON from /_trace (same access rules as /_profile)")
+    p.add_argument("--trace-buffer", default=65536, type=int,
+                   help="Trace ring buffer size in events (oldest are overwritten)")
+    p.add_argument("--hits-file", default=None,
+                   help="Persist hit counters to this append-only log (default: in-memory only)")
+    p.add_argument("--flush-interval", default=5.0, type=float,
+                   help="Seconds between write-behind flushes of buffered hit deltas")
+    p.add_argument("--flush-threshold", default=1000, type=int,
+                   help="Flush early once this many hit increments are buffered")
+    p.add_argument("--shm-name", default="http-lab-state",
+                   help="Shared memory segment for counters and rate limits (shared mode)")
+    p.add_argument("--processes", default=1, type=int,
+                   help="Server processes sharing the port via SO_REUSEPORT (use with --counter-mode shared)")
+    p.add_argument("--drain-timeout", default=8.0, type=float,
+                   help="On SIGTERM, stop accepting and let in-flight requests finish for up to this many seconds")
+    p.add_argument("--handoff-socket", default=None,
+                   help="Unix socket for hot restarts: a new server started with the same path takes over "
+                        "the listening socket from the running one, which then drains")
+    args = p.parse_args()
+    try:
+        args.route_limits = parse_route_map(args.route_limits)
+        args.route_costs = parse_route_map(args.route_costs)
+        defaults = {"backlog": args.backlog, "rcvbuf": args.rcvbuf, "sndbuf": args.sndbuf}
+        args.listen = [parse_listen(text, **defaults) for text in args.listen]
+        args.listen += [ListenSpec(path=path, **defaults) for path in args.unix]
+    except ValueError as e:
+        p.error(str(e))
+    if not args.listen and not args.systemd:
+        args.listen = [ListenSpec(args.host, args.port, **defaults)]
+    if args.processes > 1 and args.hits_file:
+        p.error("--hits-file is per process; use it with --processes 1")
+    if args.processes > 1 and args.cpu_offload == "process":
+        p.error("--cpu-offload process needs --processes 1 (extra server processes cannot start a pool)")
+    if args.processes > 1 and args.handoff_socket:
+        p.error("--handoff-socket hands over one process's listening sockets; use it with --processes 1")
+    return args
+
+
+def serve(args, listeners, takeover=None):
+    """
+    Build and run one server process (called once per --processes). `listeners`
+    are opened once for all processes (Unix sockets, systemd); TCP listeners are
+    bound here, per process, with SO_REUSEPORT when there are several.
+    """
+    set_root(args.root)
+
+    hits_store = None
+    if args.hits_file:
+        hits_store = HitStore(args.hits_file, flush_interval=args.flush_interval,
+                              flush_threshold=args.flush_threshold)
+
+    shared_state = None
+    if args.counter_mode == "shared":
+        shared_state = SharedState(args.shm_name)
+
+    rate_policy = None
+    if args.route_limits or args.route_costs or args.cost_per_mib > 0 or args.global_rate_limit > 0:
+        rate_policy = RateLimitPolicy(
+            default_limit=args.rate_limit,
+            route_limits=args.route_limits,
+            route_costs=args.route_costs,
+            bytes_per_unit=int((1 << 20) / args.cost_per_mib) if args.cost_per_mib > 0 else 0,
+            global_limit=args.global_rate_limit,
+        )
+
+    pack = ContentPack(args.pack) if args.pack else None
+    cpu = CPUOffload(args.cpu_offload, args.cpu_processes)
+
+    shaper = None
+    if args.bw_global > 0 or args.bw_per_conn > 0:
+        shaper = BandwidthShaper(global_rate=args.bw_global * 1024, per_connection_rate=args.bw_per_conn * 1024,
+                                 min_bytes=args.bw_min_bytes)
+
+    # Hot restart: our hit log stays on hold until the previous process has written its last deltas.
+    if takeover is not None and hits_store is not None:
+        hits_store.hold()
+
+    server = HTTPServer(
+        host=args.host,
+        port=args.port,
+        max_workers=args.workers,
+        simulated_delay_seconds=args.delay,
+        counter_mode=args.counter_mode,
+        counter_delay=args.counter_delay,
+        rate_limit=args.rate_limit,
+        hits_store=hits_store,
+        sketch_width=args.sketch_width,
+        sketch_depth=args.sketch_depth,
+        top_k=args.top_k,
+        shared_state=shared_state,
+        reuse_port=args.processes > 1,
+        min_workers=args.min_workers,
+        pool_options={"grow_wait": args.grow_wait, "idle_timeout": args.idle_timeout},
+        bulk_workers=args.bulk_workers,
+        bulk_threshold=args.bulk_threshold,
+        bulk_queue=args.bulk_queue,
+        shaper=shaper,
+        rate_policy=rate_policy,
+        coalesce=not args.no_coalesce,
+        pack=pack,
+        profile=args.profile or args.profile_token is not None or args.profile_sample_rate > 0,
+        profile_token=args.profile_token,
+        profile_sample_rate=args.profile_sample_rate,
+        memory_budget=int(args.memory_budget * (1 << 20)),
+        memory_wait=args.memory_wait,
+        tracer=Tracer(args.trace_buffer) if args.trace else None,
+        keep_alive_timeout=args.keep_alive,
+        trusted_proxies=parse_trusted(args.trusted_proxies),
+        drain_timeout=args.drain_timeout,
+        http2=args.http2,
+        http2_workers=args.http2_workers,
+        http2_max_streams=args.http2_streams,
+        events_interval=args.events_interval,
+        events_max_subscribers=args.events_max,
+        cpu_work=args.cpu_work,
+        gzip_level=args.gzip,
+        cpu_offload=cpu,
+    )
+    # docker stop sends SIGTERM: stop accepting, finish in-flight requests, then flush hits.
+    signal.signal(signal.SIGTERM, lambda signum, frame: server.request_drain())
+
+    handoff = None
+
+    def offer_handoff():
+        nonlocal handoff
+        handoff = HandoffServer(args.handoff_socket, server.listeners, on_ready=server.request_drain)
+
+    def previous_exited():
+        if hits_store is not None:
+            totals = hits_store.load()
+            server.absorb_restored(totals)
+            hits_store.release()
+        offer_handoff()
+
+    if takeover is not None:
+        print(f"[HANDOFF] took over {len(takeover.listeners)} listening socket(s) from pid {takeover.previous_pid}")
+        server.listeners = takeover.listeners
+        server.on_listening = lambda: takeover.ready(previous_exited)
+    else:
+        server.listeners = listeners + [open_listener(spec, reuse_port=args.processes > 1)
+                                        for spec in args.listen if spec.path is None]
+        if args.handoff_socket:
+            server.on_listening = offer_handoff
+    try:
+        server.start()
+    finally:
+        if hits_store is not None:
+            hits_store.close()
+        if handoff is not None:
+            # Only now may the new process read the hit log back.
+            handoff.finish()
+        if multiprocessing.parent_process() is None and (handoff is None or handoff.control is None):
+            # Our socket files, unless a new process serves them now.
+            remove_socket_files(spec.path for spec in args.listen if spec.path is not None)
+        if shared_state is not None:
+            shared_state.close()
+        if pack is not None:
+            pack.close()
+        cpu.close()
 
 
 if __name__ == "__main__":
     args = parse_args()
-    set_root(args.root)
-    
+
+    # Hot restart: if a server is running on the handoff socket, take its listening
+    # sockets instead of binding. Otherwise open the listeners every process shares.
+    try:
+        takeover = take_over(args.handoff_socket) if args.handoff_socket else None
+    except OSError as e:  # includes a timeout waiting for the old process
+        raise SystemExit(f"[HANDOFF] taking over from {args.handoff_socket} failed: {e}")
+    inherited, shared_listeners = [], []
+    if takeover is None:
+        try:
+            inherited = systemd_sockets() if args.systemd else []
+            if args.systemd and not inherited:
+                raise OSError("--systemd: no sockets were passed to this process (LISTEN_PID/LISTEN_FDS)")
+            shared_listeners = inherited + [open_listener(spec) for spec in args.listen if spec.path is not None]
+        except OSError as e:
+            raise SystemExit(f"[LISTEN] {e}")
+
     print("=" * 80)
     print("HTTP FILE SERVER - Laboratory Work 2")
     print("=" * 80)
-    print(f"Root Directory    : {Path(args.root).resolve()}")
-    print(f"Listening on      : {args.host}:{args.port}")
-    print(f"Worker Threads    : {args.workers}")
+    if args.pack:
+        print(f"Content Pack      : {Path(args.pack).resolve()} (memory-mapped; --root not read)")
+    else:
+        print(f"Root Directory    : {Path(args.root).resolve()}")
+    if takeover is not None:
+        print(f"Listening on      : {', '.join(socket_label(s) for s in takeover.listeners)} "
+              f"(taken over from pid {takeover.previous_pid})")
+    else:
+        endpoints = [spec.describe() for spec in args.listen] + [f"{socket_label(s)} (systemd)" for s in inherited]
+        print(f"Listening on      : {endpoints[0]}")
+        for endpoint in endpoints[1:]:
+            print(f"                    {endpoint}")
+    print(f"Worker Threads    : {args.workers}" + (f" x {args.processes} processes" if args.processes > 1 else ""))
+    if args.min_workers is not None and args.min_workers < args.workers:
+        print(f"Adaptive Pool     : {args.min_workers}..{args.workers} threads "
+              f"(grow after {args.grow_wait}s queue wait, shrink after {args.idle_timeout}s idle)")
+    if args.bulk_workers > 0:
+        print(f"Bulk Lane         : {args.bulk_workers} workers for files >= {args.bulk_threshold} bytes "
+              f"(latency lane keeps all {args.workers}; "
+              f"{args.bulk_queue if args.bulk_queue is not None else 4 * args.bulk_workers} may queue)")
+    if args.bw_global > 0 or args.bw_per_conn > 0:
+        print(f"Bandwidth Shaping : global {args.bw_global or 'unlimited'} KiB/s, "
+              f"per-conn {args.bw_per_conn or 'unlimited'} KiB/s (responses >= {args.bw_min_bytes} bytes)")
+    if args.memory_budget > 0:
+        print(f"Memory Budget     : {args.memory_budget} MiB of in-flight response bodies "
+              f"(wait {args.memory_wait}s, then stream, then 503)")
     print(f"Request Delay     : {args.delay}s (simulated work)")
+    if args.cpu_work > 0 or args.gzip:
+        tasks = [f"{args.cpu_work} unit(s) of synthetic work"] if args.cpu_work > 0 else []
+        tasks += [f"gzip level {args.gzip} for HTML"] if args.gzip else []
+        pool = (f"{args.cpu_processes or os.cpu_count()} worker process(es)" if args.cpu_offload == "process"
+                else "on worker threads (shares the GIL)")
+        print(f"CPU Work          : {', '.join(tasks)}; {pool}")
+    if args.keep_alive > 0:
+        print(f"Keep-Alive        : {args.keep_alive}s idle timeout (a waiting connection holds its worker)")
+    if args.http2:
+        print(f"HTTP/2            : h2c (prior knowledge + Upgrade), {args.http2_streams} streams per connection, "
+              f"{args.http2_workers} stream workers")
+    if args.trusted_proxies:
+        print(f"Trusted Proxies   : {args.trusted_proxies} (client IP from X-Forwarded-For)")
+    print(f"Coalescing        : {'Disabled' if args.no_coalesce else 'Enabled (single-flight per file/listing)'}")
     print("-" * 80)
     print(f"COUNTER MODE      : {args.counter_mode.upper()}")
     if args.counter_mode == "naive":
         print(f"                    ⚠️  RACE CONDITION POSSIBLE (no synchronization)")
+    elif args.counter_mode == "sketch":
+        print(f"                    ≈ Approximate: {args.sketch_depth}x{args.sketch_width} Count-Min + top-{args.top_k}")
+    elif args.counter_mode == "shared":
+        print(f"                    ✓ Shared memory '{args.shm_name}' (striped locks, {args.processes} process(es))")
     else:
         print(f"                    ✓ Thread-safe (using locks)")
     print(f"Counter Delay     : {args.counter_delay}s (for forcing race interleaving)")
@@ -42,15 +349,34 @@ if __name__ == "__main__":
     print(f"RATE LIMITING     : {args.rate_limit} req/s per IP" if args.rate_limit > 0 else "RATE LIMITING     : Disabled")
     if args.rate_limit > 0:
         print(f"                    ✓ Enabled (thread-safe)")
+    if args.route_limits or args.route_costs or args.cost_per_mib > 0 or args.global_rate_limit > 0:
+        print(f"                    per-route limits {args.route_limits or '-'}, costs {args.route_costs or '-'}, "
+              f"{args.cost_per_mib} per MiB, global {args.global_rate_limit or 'none'}")
+    if args.profile or args.profile_token or args.profile_sample_rate > 0:
+        print("-" * 80)
+        print(f"PROFILING         : /_profile enabled ({'token required' if args.profile_token else 'loopback only'})")
+        if args.profile_sample_rate > 0:
+            print(f"                    cProfile on {args.profile_sample_rate:.1%} of requests")
+    if args.trace:
+        print("-" * 80)
+        print(f"TRACING           : /_trace (Chrome trace JSON, last {args.trace_buffer} events; "
+              f"{'token required' if args.profile_token else 'loopback only'})")
+    events_max = args.events_max or default_max_subscribers(args.bulk_workers or args.workers)
+    print(f"LIVE STATS        : /_events (Server-Sent Events), one snapshot every {args.events_interval:g}s "
+          f"shared by up to {events_max} subscribers")
+    print("-" * 80)
+    if args.hits_file:
+        print(f"HIT PERSISTENCE   : {args.hits_file}")
+        print(f"                    flush every {args.flush_interval}s or {args.flush_threshold} increments")
+    else:
+        print("HIT PERSISTENCE   : Disabled (in-memory only)")
+    print(f"SHUTDOWN          : SIGTERM drains in-flight requests for up to {args.drain_timeout}s")
+    if args.handoff_socket:
+        print(f"                    hot restart via {args.handoff_socket} (start a new server with the same path)")
     print("=" * 80)
-    
-    server = HTTPServer(
-        host=args.host,
-        port=args.port,
-        max_workers=args.workers,
-        simulated_delay_seconds=args.delay,
-        counter_mode=args.counter_mode,
-        counter_delay=args.counter_delay,
-        rate_limit=args.rate_limit,
-    )
-    server.start()
+
+    # Extra processes are daemonic: when this one exits (SIGTERM included) they are
+    # terminated too, and each flushes its own state on the way out.
+    for _ in range(args.processes - 1):
+        multiprocessing.Process(target=serve, args=(args, shared_listeners), daemon=True).start()
+    serve(args, shared_listeners, takeover)
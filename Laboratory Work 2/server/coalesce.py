@@ -0,0 +1,73 @@
+import threading
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Request coalescing for concurrent misses on the same key.
+    Keys are hashable; by convention (kind, path, ...) tuples, e.g. ("file", path).
+
+    The first caller of do(key, fn) runs fn(); callers that arrive with the same
+    key while it is still running block until it finishes and receive the same
+    result (or exception) instead of repeating the disk read or render. Nothing is
+    cached afterwards: the next call once the flight has landed runs fn() again,
+    so a result is only shared with requests that arrived while it was produced.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict = {}
+        self.executed = 0
+        self.coalesced = 0
+        self.max_waiters = 0
+
+    def do(self, key, fn):
+        """Return (result, shared): shared is True when another caller did the work."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                self.executed += 1
+                self.max_waiters = max(self.max_waiters, call.waiters)
+            call.done.set()
+            if call.waiters:
+                label = " ".join(str(part) for part in key[:2]) if isinstance(key, tuple) else key
+                print(f"[COALESCE] {label} shared with {call.waiters} waiting request(s)")
+        return call.result, False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "executed": self.executed,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls),
+                "max_waiters": self.max_waiters,
+            }
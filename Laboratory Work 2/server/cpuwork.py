@@ -0,0 +1,71 @@
+import gzip
+import multiprocessing
+import os
+import signal
+from concurrent.futures import ProcessPoolExecutor
+
+# Loop iterations in one --cpu-work unit.
+BURN_UNIT = 10_000
+
+# What --gzip compresses: text compresses well; PNG and PDF bodies are compressed already.
+GZIP_TYPES = ("text/html",)
+# Larger files are sent as they are rather than compressed in one piece in memory.
+GZIP_MAX_BYTES = 8 << 20
+
+
+# Tasks are module-level functions of plain arguments so a process pool can pickle
+# them: only a number or a file path goes out, only the result comes back.
+def burn(units: int) -> int:
+    """Synthetic CPU-bound work in pure Python (holds the GIL throughout)."""
+    total = 0
+    for i in range(units * BURN_UNIT):
+        total = (total + i * i) % 1000003
+    return total
+
+
+def gzip_file(path: str, level: int = 6) -> bytes:
+    """The gzip encoding of a file's content (mtime 0, so the same file gives the same bytes)."""
+    with open(path, "rb") as f:
+        return gzip.compress(f.read(), compresslevel=level, mtime=0)
+
+
+def _ready() -> int:
+    return os.getpid()
+
+
+def _init_worker():
+    # Ctrl-C reaches the whole process group; the server shuts the pool down itself.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class CPUOffload:
+    """
+    Where CPU-bound request work runs: "thread" calls the task on the connection's
+    worker thread (competing with every other worker for the GIL); "process" sends
+    it to a pool of worker processes, each with its own interpreter and GIL, while
+    the worker thread waits on the result.
+    """
+
+    def __init__(self, mode: str = "thread", processes: int | None = None):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"unknown CPU offload mode {mode!r}")
+        self.mode = mode
+        self.processes = processes or os.cpu_count() or 1
+        self.pool = None
+        if mode == "process":
+            # spawn: children do not inherit this process's threads, locks or sockets.
+            self.pool = ProcessPoolExecutor(max_workers=self.processes,
+                                            mp_context=multiprocessing.get_context("spawn"),
+                                            initializer=_init_worker)
+            # Start every worker now instead of on the first requests.
+            for future in [self.pool.submit(_ready) for _ in range(self.processes)]:
+                future.result()
+
+    def run(self, fn, *args):
+        if self.pool is None:
+            return fn(*args)
+        return self.pool.submit(fn, *args).result()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,137 @@
+import heapq
+import json
+import os
+import threading
+import time
+from collections import deque
+from operator import itemgetter
+
+
+def default_max_subscribers(workers: int) -> int:
+    """
+    Subscriber cap for a pool of `workers` threads. Every open stream keeps one of
+    them, so subscribers may take at most a quarter of the pool that serves them.
+    """
+    return max(1, workers // 4)
+
+
+def format_event(event: str, event_id: int, data: dict) -> bytes:
+    """One Server-Sent Events message (text/event-stream)."""
+    payload = json.dumps(data, separators=(",", ":"))
+    return f"id: {event_id}\nevent: {event}\ndata: {payload}\n\n".encode("utf-8")
+
+
+class EventHub:
+    """
+    Live statistics for /_events subscribers, computed once per tick for all of them.
+
+    `sample` returns the server's running totals ({"requests", "rate_limited",
+    "pool"}); reading them is cheap and sorts nothing. A single aggregator thread
+    wakes every `interval` seconds, turns the totals into deltas since the previous
+    tick, adds the busiest paths of the tick (counted by record() while anyone is
+    subscribed) and encodes the event once. Each subscriber only copies the encoded
+    bytes out of a short ring of recent events, so N dashboards cost N socket
+    writes per tick instead of N aggregations. A subscriber that falls further
+    behind than the ring is told how many events it missed.
+    """
+
+    def __init__(self, sample, interval: float = 1.0, top: int = 10, history: int = 32,
+                 max_subscribers: int = 2):
+        self.sample = sample
+        self.interval = interval
+        self.top = top
+        self.max_subscribers = max_subscribers
+        self.subscribers = 0
+        self.published = 0
+        # Hits per path since the last tick; only filled while someone is watching.
+        self._window: dict[str, int] = {}
+        self._window_lock = threading.Lock()
+        # (id, encoded event) of the latest ticks, newest last.
+        self._events = deque(maxlen=history)
+        self._last_id = 0
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def record(self, key: str):
+        if self.subscribers:
+            with self._window_lock:
+                self._window[key] = self._window.get(key, 0) + 1
+
+    def subscribe(self) -> bool:
+        """Reserve a subscriber slot (False when full); the aggregator starts with the first one."""
+        with self._cond:
+            if self.subscribers >= self.max_subscribers:
+                return False
+            self.subscribers += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="events", daemon=True)
+                self._thread.start()
+        return True
+
+    def unsubscribe(self):
+        with self._cond:
+            self.subscribers -= 1
+            left = self.subscribers
+        print(f"[EVENTS] subscriber left ({left} watching)")
+
+    def stream(self, stop=lambda: False):
+        """
+        Event-stream body for one subscriber (after subscribe()): a "hello" event with
+        the running totals, then every "stats" event published from now on. Ends once
+        stop() is true (checked every tick), e.g. while the server drains; browsers
+        reconnect by themselves after `retry`.
+        """
+        with self._cond:
+            last = self._last_id
+        hello = {"pid": os.getpid(), "interval_s": self.interval, "totals": self.sample()}
+        yield b"retry: 2000\n" + format_event("hello", last, hello)
+        while True:
+            with self._cond:
+                while self._last_id == last and not stop() and not self._stop.is_set():
+                    self._cond.wait(self.interval)
+                if stop() or self._stop.is_set():
+                    return
+                pending = [data for event_id, data in self._events if event_id > last]
+                missed = self._last_id - last - len(pending)
+                last = self._last_id
+            if missed:
+                yield f": missed {missed} event(s)\n\n".encode("ascii")
+            # Sent as one piece: one write per tick per subscriber.
+            yield b"".join(pending)
+
+    def close(self):
+        """End every stream and the aggregator (on drain): subscribers return at once."""
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    def _run(self):
+        then, before = time.monotonic(), self.sample()
+        deadline = then
+        while True:
+            deadline += self.interval
+            if self._stop.wait(max(0.0, deadline - time.monotonic())):
+                return
+            now, current = time.monotonic(), self.sample()
+            with self._window_lock:
+                window, self._window = self._window, {}
+            if self.subscribers:
+                elapsed = now - then
+                requests = current["requests"] - before["requests"]
+                event = {
+                    "t": round(time.time(), 3),
+                    "interval_s": round(elapsed, 3),
+                    "requests": requests,
+                    "rps": round(requests / elapsed, 1) if elapsed > 0 else 0.0,
+                    "rate_limited": current["rate_limited"] - before["rate_limited"],
+                    "top_paths": heapq.nlargest(self.top, window.items(), key=itemgetter(1)),
+                    "pool": current["pool"],
+                    "totals": {"requests": current["requests"], "rate_limited": current["rate_limited"]},
+                }
+                with self._cond:
+                    self._last_id += 1
+                    self._events.append((self._last_id, format_event("stats", self._last_id, event)))
+                    self.published += 1
+                    self._cond.notify_all()
+            then, before = now, current
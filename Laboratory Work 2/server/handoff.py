@@ -0,0 +1,135 @@
+import os
+import socket
+import threading
+
+# Listening sockets one handoff can carry.
+MAX_LISTENERS = 16
+
+
+class HandoffServer:
+    """
+    Old-process side of a hot restart: offers the listening sockets over a Unix socket.
+
+    A new process connects to `path` and sends "TAKE <pid>"; the listening sockets'
+    file descriptors are passed back with SCM_RIGHTS (socket.send_fds), so both
+    processes now accept from the same kernel queues and no connection is refused
+    in between. Once the new process answers "READY" (it is accepting), this side
+    calls `on_ready` (normally the server's request_drain) and keeps the control
+    connection open until finish() reports "DONE", i.e. until the last hits were
+    persisted, so the new process knows when to read them back.
+    """
+
+    def __init__(self, path: str, listeners: list[socket.socket], on_ready):
+        self.path = path
+        self.listeners = listeners
+        self.on_ready = on_ready
+        self.control: socket.socket | None = None
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(path)
+        self._sock.listen(1)
+        self._thread = threading.Thread(target=self._run, name="handoff", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:  # closed by finish()
+                return
+            try:
+                conn.settimeout(10)
+                request = conn.recv(64).decode("ascii", "replace").split()
+                if len(request) != 2 or request[0] != "TAKE":
+                    conn.close()
+                    continue
+                socket.send_fds(conn, [str(os.getpid()).encode()], [s.fileno() for s in self.listeners])
+                if conn.recv(16) != b"READY":
+                    # The new process died before accepting; keep serving and wait for another.
+                    conn.close()
+                    continue
+            except OSError as e:
+                print(f"[HANDOFF] handoff failed: {e}")
+                conn.close()
+                continue
+            conn.settimeout(None)
+            print(f"[HANDOFF] listening socket(s) taken over by pid {request[1]}; draining")
+            self.control = conn
+            # The path now belongs to the new process, which binds it again for the next restart.
+            self._sock.close()
+            self.on_ready()
+            return
+
+    def finish(self):
+        """Tell the new process this one is done (after persisting), or clean up if none came."""
+        if self.control is not None:
+            try:
+                self.control.sendall(b"DONE")
+            except OSError:
+                pass
+            self.control.close()
+            return
+        self._sock.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class Takeover:
+    """New-process side of a hot restart, as returned by take_over()."""
+
+    def __init__(self, listeners: list[socket.socket], control: socket.socket, previous_pid: int):
+        self.listeners = listeners
+        self.control = control
+        self.previous_pid = previous_pid
+
+    def ready(self, on_done):
+        """Report that we accept connections; `on_done` runs once the old process has exited."""
+        self.control.sendall(b"READY")
+
+        def wait():
+            try:
+                # "DONE" after the old process persisted its counters, or EOF if it died.
+                self.control.recv(16)
+            except OSError:
+                pass
+            self.control.close()
+            on_done()
+
+        threading.Thread(target=wait, name="handoff-wait", daemon=True).start()
+
+
+def take_over(path: str, timeout: float = 5.0) -> Takeover | None:
+    """
+    Ask a running server for its listening sockets; None when there is none (cold start).
+    A handoff that fails halfway raises OSError; the old server keeps serving, since
+    it only drains once we report READY.
+    """
+    control = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    control.settimeout(timeout)
+    try:
+        control.connect(path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        control.close()
+        return None
+    fds = []
+    try:
+        control.sendall(f"TAKE {os.getpid()}".encode())
+        message, fds, _, _ = socket.recv_fds(control, 64, MAX_LISTENERS)
+        if not fds:
+            raise OSError(f"no listening socket received from {path}")
+        try:
+            previous_pid = int(message.decode("ascii"))
+        except (UnicodeDecodeError, ValueError):
+            raise OSError(f"malformed handoff message from {path}: {message[:64]!r}") from None
+    except OSError:
+        for fd in fds:
+            os.close(fd)
+        control.close()
+        raise
+    control.settimeout(None)
+    return Takeover([socket.socket(fileno=fd) for fd in fds], control, previous_pid)
@@ -0,0 +1,387 @@
+"""
+HPACK header compression for HTTP/2 (RFC 7541): static and dynamic tables,
+prefix-coded integers, and the canonical Huffman code for string literals.
+
+Header names and values are str; octets are mapped 1:1 through latin-1, as the
+HTTP/1.1 parser does.
+"""
+
+# RFC 7541 Appendix A: index 1..61.
+STATIC_TABLE = (
+    (":authority", ""),
+    (":method", "GET"),
+    (":method", "POST"),
+    (":path", "/"),
+    (":path", "/index.html"),
+    (":scheme", "http"),
+    (":scheme", "https"),
+    (":status", "200"),
+    (":status", "204"),
+    (":status", "206"),
+    (":status", "304"),
+    (":status", "400"),
+    (":status", "404"),
+    (":status", "500"),
+    ("accept-charset", ""),
+    ("accept-encoding", "gzip, deflate"),
+    ("accept-language", ""),
+    ("accept-ranges", ""),
+    ("accept", ""),
+    ("access-control-allow-origin", ""),
+    ("age", ""),
+    ("allow", ""),
+    ("authorization", ""),
+    ("cache-control", ""),
+    ("content-disposition", ""),
+    ("content-encoding", ""),
+    ("content-language", ""),
+    ("content-length", ""),
+    ("content-location", ""),
+    ("content-range", ""),
+    ("content-type", ""),
+    ("cookie", ""),
+    ("date", ""),
+    ("etag", ""),
+    ("expect", ""),
+    ("expires", ""),
+    ("from", ""),
+    ("host", ""),
+    ("if-match", ""),
+    ("if-modified-since", ""),
+    ("if-none-match", ""),
+    ("if-range", ""),
+    ("if-unmodified-since", ""),
+    ("last-modified", ""),
+    ("link", ""),
+    ("location", ""),
+    ("max-forwards", ""),
+    ("proxy-authenticate", ""),
+    ("proxy-authorization", ""),
+    ("range", ""),
+    ("referer", ""),
+    ("refresh", ""),
+    ("retry-after", ""),
+    ("server", ""),
+    ("set-cookie", ""),
+    ("strict-transport-security", ""),
+    ("transfer-encoding", ""),
+    ("user-agent", ""),
+    ("vary", ""),
+    ("via", ""),
+    ("www-authenticate", ""),
+)
+
+HUFFMAN_CODES = (
+    0x1ff8, 0x7fffd8, 0xfffffe2, 0xfffffe3, 0xfffffe4, 0xfffffe5, 0xfffffe6, 0xfffffe7,
+    0xfffffe8, 0xffffea, 0x3ffffffc, 0xfffffe9, 0xfffffea, 0x3ffffffd, 0xfffffeb, 0xfffffec,
+    0xfffffed, 0xfffffee, 0xfffffef, 0xffffff0, 0xffffff1, 0xffffff2, 0x3ffffffe, 0xffffff3,
+    0xffffff4, 0xffffff5, 0xffffff6, 0xffffff7, 0xffffff8, 0xffffff9, 0xffffffa, 0xffffffb,
+    0x14, 0x3f8, 0x3f9, 0xffa, 0x1ff9, 0x15, 0xf8, 0x7fa,
+    0x3fa, 0x3fb, 0xf9, 0x7fb, 0xfa, 0x16, 0x17, 0x18,
+    0x0, 0x1, 0x2, 0x19, 0x1a, 0x1b, 0x1c, 0x1d,
+    0x1e, 0x1f, 0x5c, 0xfb, 0x7ffc, 0x20, 0xffb, 0x3fc,
+    0x1ffa, 0x21, 0x5d, 0x5e, 0x5f, 0x60, 0x61, 0x62,
+    0x63, 0x64, 0x65, 0x66, 0x67, 0x68, 0x69, 0x6a,
+    0x6b, 0x6c, 0x6d, 0x6e, 0x6f, 0x70, 0x71, 0x72,
+    0xfc, 0x73, 0xfd, 0x1ffb, 0x7fff0, 0x1ffc, 0x3ffc, 0x22,
+    0x7ffd, 0x3, 0x23, 0x4, 0x24, 0x5, 0x25, 0x26,
+    0x27, 0x6, 0x74, 0x75, 0x28, 0x29, 0x2a, 0x7,
+    0x2b, 0x76, 0x2c, 0x8, 0x9, 0x2d, 0x77, 0x78,
+    0x79, 0x7a, 0x7b, 0x7ffe, 0x7fc, 0x3ffd, 0x1ffd, 0xffffffc,
+    0xfffe6, 0x3fffd2, 0xfffe7, 0xfffe8, 0x3fffd3, 0x3fffd4, 0x3fffd5, 0x7fffd9,
+    0x3fffd6, 0x7fffda, 0x7fffdb, 0x7fffdc, 0x7fffdd, 0x7fffde, 0xffffeb, 0x7fffdf,
+    0xffffec, 0xffffed, 0x3fffd7, 0x7fffe0, 0xffffee, 0x7fffe1, 0x7fffe2, 0x7fffe3,
+    0x7fffe4, 0x1fffdc, 0x3fffd8, 0x7fffe5, 0x3fffd9, 0x7fffe6, 0x7fffe7, 0xffffef,
+    0x3fffda, 0x1fffdd, 0xfffe9, 0x3fffdb, 0x3fffdc, 0x7fffe8, 0x7fffe9, 0x1fffde,
+    0x7fffea, 0x3fffdd, 0x3fffde, 0xfffff0, 0x1fffdf, 0x3fffdf, 0x7fffeb, 0x7fffec,
+    0x1fffe0, 0x1fffe1, 0x3fffe0, 0x1fffe2, 0x7fffed, 0x3fffe1, 0x7fffee, 0x7fffef,
+    0xfffea, 0x3fffe2, 0x3fffe3, 0x3fffe4, 0x7ffff0, 0x3fffe5, 0x3fffe6, 0x7ffff1,
+    0x3ffffe0, 0x3ffffe1, 0xfffeb, 0x7fff1, 0x3fffe7, 0x7ffff2, 0x3fffe8, 0x1ffffec,
+    0x3ffffe2, 0x3ffffe3, 0x3ffffe4, 0x7ffffde, 0x7ffffdf, 0x3ffffe5, 0xfffff1, 0x1ffffed,
+    0x7fff2, 0x1fffe3, 0x3ffffe6, 0x7ffffe0, 0x7ffffe1, 0x3ffffe7, 0x7ffffe2, 0xfffff2,
+    0x1fffe4, 0x1fffe5, 0x3ffffe8, 0x3ffffe9, 0xffffffd, 0x7ffffe3, 0x7ffffe4, 0x7ffffe5,
+    0xfffec, 0xfffff3, 0xfffed, 0x1fffe6, 0x3fffe9, 0x1fffe7, 0x1fffe8, 0x7ffff3,
+    0x3fffea, 0x3fffeb, 0x1ffffee, 0x1ffffef, 0xfffff4, 0xfffff5, 0x3ffffea, 0x7ffff4,
+    0x3ffffeb, 0x7ffffe6, 0x3ffffec, 0x3ffffed, 0x7ffffe7, 0x7ffffe8, 0x7ffffe9, 0x7ffffea,
+    0x7ffffeb, 0xffffffe, 0x7ffffec, 0x7ffffed, 0x7ffffee, 0x7ffffef, 0x7fffff0, 0x3ffffee,
+    0x3fffffff,
+)
+
+HUFFMAN_LENGTHS = (
+    13, 23, 28, 28, 28, 28, 28, 28, 28, 24, 30, 28, 28, 30, 28, 28,
+    28, 28, 28, 28, 28, 28, 30, 28, 28, 28, 28, 28, 28, 28, 28, 28,
+    6, 10, 10, 12, 13, 6, 8, 11, 10, 10, 8, 11, 8, 6, 6, 6,
+    5, 5, 5, 6, 6, 6, 6, 6, 6, 6, 7, 8, 15, 6, 12, 10,
+    13, 6, 7, 7, 7, 7, 7, 7, 7, 7, 7, 7, 7, 7, 7, 7,
+    7, 7, 7, 7, 7, 7, 7, 7, 8, 7, 8, 13, 19, 13, 14, 6,
+    15, 5, 6, 5, 6, 5, 6, 6, 6, 5, 7, 7, 6, 6, 6, 5,
+    6, 7, 6, 5, 5, 6, 7, 7, 7, 7, 7, 15, 11, 14, 13, 28,
+    20, 22, 20, 20, 22, 22, 22, 23, 22, 23, 23, 23, 23, 23, 24, 23,
+    24, 24, 22, 23, 24, 23, 23, 23, 23, 21, 22, 23, 22, 23, 23, 24,
+    22, 21, 20, 22, 22, 23, 23, 21, 23, 22, 22, 24, 21, 22, 23, 23,
+    21, 21, 22, 21, 23, 22, 23, 23, 20, 22, 22, 22, 23, 22, 22, 23,
+    26, 26, 20, 19, 22, 23, 22, 25, 26, 26, 26, 27, 27, 26, 24, 25,
+    19, 21, 26, 27, 27, 26, 27, 24, 21, 21, 26, 26, 28, 27, 27, 27,
+    20, 24, 20, 21, 22, 21, 21, 23, 22, 22, 25, 25, 24, 24, 26, 23,
+    26, 27, 26, 26, 27, 27, 27, 27, 27, 28, 27, 27, 27, 27, 27, 26,
+    30,
+)
+
+# Sizes count each entry as name + value + 32 octets (RFC 7541 section 4.1).
+ENTRY_OVERHEAD = 32
+DEFAULT_TABLE_SIZE = 4096
+
+_STATIC_INDEX: dict = {}
+_STATIC_NAME_INDEX: dict = {}
+for _i, (_name, _value) in enumerate(STATIC_TABLE, start=1):
+    _STATIC_INDEX.setdefault((_name, _value), _i)
+    _STATIC_NAME_INDEX.setdefault(_name, _i)
+
+# Decoding: (bit length, code) -> symbol; 256 is EOS.
+_HUFFMAN_DECODE = {(length, code): symbol
+                   for symbol, (code, length) in enumerate(zip(HUFFMAN_CODES, HUFFMAN_LENGTHS))}
+_HUFFMAN_MIN_LENGTH = min(HUFFMAN_LENGTHS)
+
+
+class HPACKError(ValueError):
+    """A header block that cannot be decoded (HTTP/2 COMPRESSION_ERROR)."""
+
+
+def huffman_encode(data: bytes) -> bytes:
+    bits = 0
+    count = 0
+    for byte in data:
+        bits = (bits << HUFFMAN_LENGTHS[byte]) | HUFFMAN_CODES[byte]
+        count += HUFFMAN_LENGTHS[byte]
+    padding = -count % 8
+    # Pad with the most significant bits of EOS (all ones).
+    bits = (bits << padding) | ((1 << padding) - 1)
+    return (bits).to_bytes((count + padding) // 8, "big")
+
+
+def huffman_encoded_length(data: bytes) -> int:
+    return (sum(HUFFMAN_LENGTHS[byte] for byte in data) + 7) // 8
+
+
+def huffman_decode(data: bytes) -> bytes:
+    out = bytearray()
+    code = 0
+    length = 0
+    for byte in data:
+        for shift in range(7, -1, -1):
+            code = (code << 1) | ((byte >> shift) & 1)
+            length += 1
+            if length < _HUFFMAN_MIN_LENGTH:
+                continue
+            symbol = _HUFFMAN_DECODE.get((length, code))
+            if symbol is None:
+                if length > 30:
+                    raise HPACKError("invalid Huffman code")
+                continue
+            if symbol == 256:
+                raise HPACKError("EOS symbol in Huffman string")
+            out.append(symbol)
+            code = 0
+            length = 0
+    # Leftover bits must be a prefix of EOS (all ones), shorter than one octet.
+    if length > 7 or code != (1 << length) - 1:
+        raise HPACKError("invalid Huffman padding")
+    return bytes(out)
+
+
+def encode_integer(value: int, prefix_bits: int, first_byte: int = 0) -> bytes:
+    """Prefix-coded integer (section 5.1); first_byte carries the pattern bits above the prefix."""
+    limit = (1 << prefix_bits) - 1
+    if value < limit:
+        return bytes([first_byte | value])
+    out = bytearray([first_byte | limit])
+    value -= limit
+    while value >= 128:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def decode_integer(data: bytes, pos: int, prefix_bits: int) -> tuple[int, int]:
+    """(value, position after it) for an integer whose first octet is data[pos]."""
+    limit = (1 << prefix_bits) - 1
+    value = data[pos] & limit
+    pos += 1
+    if value < limit:
+        return value, pos
+    shift = 0
+    while True:
+        if pos >= len(data):
+            raise HPACKError("truncated integer")
+        byte = data[pos]
+        pos += 1
+        value += (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, pos
+        if shift > 28:
+            raise HPACKError("integer too large")
+
+
+def encode_string(text: str, huffman: bool = True) -> bytes:
+    raw = text.encode("latin-1")
+    if huffman and huffman_encoded_length(raw) < len(raw):
+        packed = huffman_encode(raw)
+        return encode_integer(len(packed), 7, 0x80) + packed
+    return encode_integer(len(raw), 7) + raw
+
+
+def decode_string(data: bytes, pos: int) -> tuple[str, int]:
+    if pos >= len(data):
+        raise HPACKError("truncated string")
+    huffman = data[pos] & 0x80
+    length, pos = decode_integer(data, pos, 7)
+    if pos + length > len(data):
+        raise HPACKError("truncated string")
+    raw = data[pos:pos + length]
+    if huffman:
+        raw = huffman_decode(raw)
+    return raw.decode("latin-1"), pos + length
+
+
+class _DynamicTable:
+    """Entries newest first; index 62 is the newest (after the static table)."""
+
+    def __init__(self, max_size: int = DEFAULT_TABLE_SIZE):
+        self.max_size = max_size
+        self.size = 0
+        self.entries: list[tuple[str, str]] = []
+
+    def add(self, name: str, value: str):
+        size = len(name) + len(value) + ENTRY_OVERHEAD
+        self.entries.insert(0, (name, value))
+        self.size += size
+        self._evict()
+
+    def resize(self, max_size: int):
+        self.max_size = max_size
+        self._evict()
+
+    def _evict(self):
+        while self.size > self.max_size and self.entries:
+            name, value = self.entries.pop()
+            self.size -= len(name) + len(value) + ENTRY_OVERHEAD
+
+    def get(self, index: int) -> tuple[str, str]:
+        if 1 <= index <= len(STATIC_TABLE):
+            return STATIC_TABLE[index - 1]
+        position = index - len(STATIC_TABLE) - 1
+        if 0 <= position < len(self.entries):
+            return self.entries[position]
+        raise HPACKError(f"header index {index} out of range")
+
+
+class Encoder:
+    """
+    Header block encoder for one connection direction.
+
+    Exact static/dynamic matches are sent as one index; other fields are added
+    to the dynamic table so repeats (content-type, server, cache headers) cost
+    an index next time, except values that change on every response, which are
+    sent without indexing so they do not evict the useful entries. Credentials
+    are marked never-indexed.
+    """
+
+    NO_INDEX = frozenset({":path", "content-length", "date", "etag", "last-modified", "content-range",
+                          "x-handler-elapsed", "x-worker-thread"})
+    NEVER_INDEX = frozenset({"authorization", "cookie", "set-cookie", "proxy-authorization"})
+
+    def __init__(self, max_size: int = DEFAULT_TABLE_SIZE, huffman: bool = True):
+        self.table = _DynamicTable(max_size)
+        self.huffman = huffman
+        self._pending_sizes: list[int] = []
+
+    def set_max_size(self, max_size: int):
+        """Apply the peer's SETTINGS_HEADER_TABLE_SIZE; signalled at the start of the next block."""
+        if max_size != self.table.max_size or self._pending_sizes:
+            self._pending_sizes.append(max_size)
+            self.table.resize(max_size)
+
+    def _find(self, name: str, value: str) -> tuple[int, bool]:
+        """(index, exact): an index with the same name and value, else one with the same name, else 0."""
+        index = _STATIC_INDEX.get((name, value))
+        if index:
+            return index, True
+        name_index = _STATIC_NAME_INDEX.get(name, 0)
+        for position, entry in enumerate(self.table.entries):
+            if entry[0] == name:
+                if entry[1] == value:
+                    return len(STATIC_TABLE) + 1 + position, True
+                name_index = name_index or len(STATIC_TABLE) + 1 + position
+        return name_index, False
+
+    def encode(self, headers) -> bytes:
+        out = bytearray()
+        if self._pending_sizes:
+            # The smallest size reached must be signalled, then the final one.
+            for size in sorted({min(self._pending_sizes), self._pending_sizes[-1]}):
+                out += encode_integer(size, 5, 0x20)
+            self._pending_sizes.clear()
+        for name, value in headers:
+            name = name.lower()
+            index, exact = self._find(name, value)
+            if exact:
+                out += encode_integer(index, 7, 0x80)
+                continue
+            if name in self.NEVER_INDEX:
+                out += encode_integer(index, 4, 0x10)
+            elif name in self.NO_INDEX:
+                out += encode_integer(index, 4, 0x00)
+            else:
+                out += encode_integer(index, 6, 0x40)
+                self.table.add(name, value)
+            if not index:
+                out += encode_string(name, self.huffman)
+            out += encode_string(value, self.huffman)
+        return bytes(out)
+
+
+class Decoder:
+    """Header block decoder for one connection direction."""
+
+    def __init__(self, max_size: int = DEFAULT_TABLE_SIZE, max_header_list_size: int = 64 * 1024):
+        self.table = _DynamicTable(max_size)
+        # SETTINGS_HEADER_TABLE_SIZE we announced: the peer may not resize beyond it.
+        self.max_allowed_size = max_size
+        self.max_header_list_size = max_header_list_size
+
+    def decode(self, data: bytes) -> list[tuple[str, str]]:
+        headers = []
+        total = 0
+        pos = 0
+        while pos < len(data):
+            byte = data[pos]
+            if byte & 0x80:  # indexed field
+                index, pos = decode_integer(data, pos, 7)
+                if index == 0:
+                    raise HPACKError("index 0")
+                name, value = self.table.get(index)
+            elif byte & 0xE0 == 0x20:  # dynamic table size update
+                if headers:
+                    raise HPACKError("table size update after a header field")
+                size, pos = decode_integer(data, pos, 5)
+                if size > self.max_allowed_size:
+                    raise HPACKError(f"table size {size} above the announced {self.max_allowed_size}")
+                self.table.resize(size)
+                continue
+            else:
+                indexing = byte & 0xC0 == 0x40
+                index, pos = decode_integer(data, pos, 6 if indexing else 4)
+                if index:
+                    name = self.table.get(index)[0]
+                else:
+                    name, pos = decode_string(data, pos)
+                value, pos = decode_string(data, pos)
+                if indexing:
+                    self.table.add(name, value)
+            total += len(name) + len(value) + ENTRY_OVERHEAD
+            if total > self.max_header_list_size:
+                raise HPACKError("header list too large")
+            headers.append((name, value))
+        return headers
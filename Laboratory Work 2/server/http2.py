@@ -0,0 +1,520 @@
+import base64
+import socket
+import struct
+import threading
+import time
+from .hpack import Decoder, Encoder, HPACKError
+from .request import HTTPRequest
+
+# Client connection preface (RFC 9113 section 3.4); _read_head() stops after its first line.
+PREFACE = b"PRI * HTTP/2.0\r\n\r\nSM\r\n\r\n"
+PREFACE_HEAD = PREFACE[:18]
+
+# Frame types
+DATA, HEADERS, PRIORITY, RST_STREAM, SETTINGS, PUSH_PROMISE, PING, GOAWAY, WINDOW_UPDATE, CONTINUATION = range(10)
+
+# Flags
+END_STREAM = 0x1
+ACK = 0x1
+END_HEADERS = 0x4
+PADDED = 0x8
+PRIORITY_FLAG = 0x20
+
+# Settings
+HEADER_TABLE_SIZE = 0x1
+ENABLE_PUSH = 0x2
+MAX_CONCURRENT_STREAMS = 0x3
+INITIAL_WINDOW_SIZE = 0x4
+MAX_FRAME_SIZE = 0x5
+MAX_HEADER_LIST_SIZE = 0x6
+
+# Error codes
+NO_ERROR = 0x0
+PROTOCOL_ERROR = 0x1
+INTERNAL_ERROR = 0x2
+FLOW_CONTROL_ERROR = 0x3
+FRAME_SIZE_ERROR = 0x6
+REFUSED_STREAM = 0x7
+CANCEL = 0x8
+COMPRESSION_ERROR = 0x9
+
+DEFAULT_WINDOW = 65535
+DEFAULT_FRAME_SIZE = 16384
+MAX_WINDOW = 2 ** 31 - 1
+
+# HTTP/1.1 headers that describe the connection, not the response (RFC 9113 section 8.2.2).
+CONNECTION_HEADERS = frozenset({"connection", "keep-alive", "proxy-connection", "transfer-encoding", "upgrade"})
+
+
+def frame(ftype: int, flags: int, stream_id: int, payload: bytes = b"") -> bytes:
+    return b"".join((struct.pack(">I", len(payload))[1:], bytes((ftype, flags)), struct.pack(">I", stream_id), payload))
+
+
+def pack_settings(settings: dict) -> bytes:
+    return b"".join(struct.pack(">HI", key, value) for key, value in settings.items())
+
+
+def unpack_settings(payload: bytes) -> list[tuple[int, int]]:
+    return [struct.unpack_from(">HI", payload, offset) for offset in range(0, len(payload) - len(payload) % 6, 6)]
+
+
+class H2Error(Exception):
+    """A connection-level protocol error: answered with GOAWAY and a close."""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+
+
+class FrameReader:
+    """Reads frames from a socket, starting with bytes that were already received."""
+
+    def __init__(self, sock, data: bytes = b""):
+        self.sock = sock
+        self.buffer = bytearray(data)
+
+    def fill(self, size: int) -> bool:
+        """Buffer at least `size` bytes; False on EOF. A socket timeout propagates with the buffer intact."""
+        while len(self.buffer) < size:
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                return False
+            self.buffer += chunk
+        return True
+
+    def take(self, size: int) -> bytes:
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def read_frame(self, max_size: int):
+        """(type, flags, stream_id, payload), or None on EOF."""
+        if not self.fill(9):
+            return None
+        length = int.from_bytes(self.buffer[:3], "big")
+        if length > max_size:
+            raise H2Error(FRAME_SIZE_ERROR, f"frame of {length} bytes")
+        if not self.fill(9 + length):
+            return None
+        head = self.take(9)
+        stream_id = struct.unpack(">I", head[5:9])[0] & 0x7FFFFFFF
+        return head[3], head[4], stream_id, self.take(length)
+
+
+def strip_padding(flags: int, payload: bytes) -> bytes:
+    if not flags & PADDED:
+        return payload
+    if not payload or payload[0] >= len(payload):
+        raise H2Error(PROTOCOL_ERROR, "bad padding")
+    return payload[1:len(payload) - payload[0]]
+
+
+def is_h2c_upgrade(head: bytes) -> bool:
+    """Whether an HTTP/1.1 request head asks to switch to cleartext HTTP/2 (RFC 7540 section 3.2)."""
+    lowered = bytes(head[:8192]).lower()
+    return (b"\r\nupgrade: h2c" in lowered and b"\r\nhttp2-settings:" in lowered
+            and b"\r\ncontent-length:" not in lowered and b"\r\ntransfer-encoding:" not in lowered)
+
+
+class _Stream:
+    __slots__ = ("stream_id", "window", "cancelled")
+
+    def __init__(self, stream_id: int, window: int):
+        self.stream_id = stream_id
+        # How much DATA the peer lets us send on this stream.
+        self.window = window
+        self.cancelled = False
+
+
+class H2Connection:
+    """
+    One cleartext HTTP/2 connection, multiplexing requests onto the server's routing.
+
+    The connection's worker thread reads frames. Each request stream is answered
+    by a task on the server's HTTP/2 stream pool, which turns the header list
+    into an HTTP/1.1-style request for server.handle_request() and sends the
+    result back as HEADERS and DATA frames. Frames of different streams
+    interleave on the socket, so a slow or large response does not hold up the
+    others (no head-of-line blocking above TCP). Sending respects the peer's
+    connection and stream flow-control windows; request bodies are not read
+    (their DATA is acknowledged and dropped, as on HTTP/1.1).
+    """
+
+    def __init__(self, server, conn, addr, data: bytes = b"", upgrade: bytes | None = None):
+        self.server = server
+        self.conn = conn
+        self.addr = addr
+        self.reader = FrameReader(conn, data)
+        self.upgrade = upgrade
+        self.encoder = Encoder()
+        self.decoder = Decoder()
+        self.streams: dict[int, _Stream] = {}
+        self.last_stream_id = 0
+        self.served = 0
+        # Peer settings that shape what we send.
+        self.peer_initial_window = DEFAULT_WINDOW
+        self.peer_max_frame = DEFAULT_FRAME_SIZE
+        self.conn_window = DEFAULT_WINDOW
+        self.max_streams = server.http2_max_streams
+        self.closed = False
+        self.goaway_sent = False
+        self.goaway_received = False
+        # Guards windows and the stream table; stream tasks wait on it for window updates.
+        self._flow = threading.Condition()
+        # One frame (or HEADERS + CONTINUATION sequence) at a time on the socket; also
+        # orders header blocks as the HPACK encoder produced them.
+        self._write_lock = threading.Lock()
+
+    # --- Writing ---
+    def send(self, data: bytes):
+        with self._write_lock:
+            self.conn.sendall(data)
+
+    def send_headers(self, stream_id: int, headers, end_stream: bool):
+        with self._write_lock:
+            block = self.encoder.encode(headers)
+            size = self.peer_max_frame
+            first, rest = block[:size], block[size:]
+            flags = (END_STREAM if end_stream else 0) | (0 if rest else END_HEADERS)
+            frames = [frame(HEADERS, flags, stream_id, first)]
+            while rest:
+                piece, rest = rest[:size], rest[size:]
+                frames.append(frame(CONTINUATION, 0 if rest else END_HEADERS, stream_id, piece))
+            self.conn.sendall(b"".join(frames))
+
+    def send_data(self, stream: _Stream, data, end_stream: bool, transfer=None):
+        view = memoryview(data)
+        while True:
+            with self._flow:
+                while view and (stream.window <= 0 or self.conn_window <= 0):
+                    if stream.cancelled or self.closed:
+                        raise OSError("stream closed while waiting for flow-control window")
+                    self._flow.wait(0.5)
+                if stream.cancelled or self.closed:
+                    raise OSError("stream closed")
+                size = min(len(view), stream.window, self.conn_window, self.peer_max_frame)
+                stream.window -= size
+                self.conn_window -= size
+            if transfer is not None:
+                # Paced before taking the write lock, so other streams keep sending meanwhile.
+                transfer.pace(size)
+            last = size == len(view)
+            self.send(frame(DATA, END_STREAM if last and end_stream else 0, stream.stream_id, view[:size]))
+            view = view[size:]
+            if last:
+                return
+
+    def reset(self, stream_id: int, code: int):
+        try:
+            self.send(frame(RST_STREAM, 0, stream_id, struct.pack(">I", code)))
+        except OSError:
+            pass
+
+    def goaway(self, code: int = NO_ERROR):
+        if self.goaway_sent:
+            return
+        self.goaway_sent = True
+        try:
+            self.send(frame(GOAWAY, 0, 0, struct.pack(">II", self.last_stream_id, code)))
+        except OSError:
+            pass
+
+    # --- Reading ---
+    def serve(self):
+        settings = {MAX_CONCURRENT_STREAMS: self.max_streams, MAX_HEADER_LIST_SIZE: self.decoder.max_header_list_size}
+        try:
+            if self.upgrade is not None:
+                request = HTTPRequest(self.upgrade)
+                self.apply_settings(base64.urlsafe_b64decode(request.headers.get("http2-settings", "") + "=="))
+                self.send(b"HTTP/1.1 101 Switching Protocols\r\nConnection: Upgrade\r\nUpgrade: h2c\r\n\r\n")
+            self.send(frame(SETTINGS, 0, 0, pack_settings(settings)))
+            self.conn.settimeout(0.5)
+            if not self._read_preface():
+                return
+            # Idle until a stream opens, so a drain closes it right away.
+            self.server.mark_busy(self.conn, False)
+            if self.upgrade is not None:
+                # The upgrading request is stream 1, already half-closed by the client.
+                headers = [(":method", request.method), (":path", request.uri), (":scheme", "http"),
+                           (":authority", request.headers.get("host", ""))]
+                headers += [(name, value) for name, value in request.headers.items()
+                            if name not in ("host", "http2-settings") and name not in CONNECTION_HEADERS]
+                self.open_stream(1, headers)
+            self._loop()
+        except H2Error as e:
+            print(f"[H2] {self.addr[0]}: {e} -> GOAWAY")
+            self.goaway(e.code)
+        except (OSError, ValueError):
+            pass
+        finally:
+            self._close()
+
+    def _read_preface(self) -> bool:
+        idle_since = time.monotonic()
+        while True:
+            try:
+                if not self.reader.fill(len(PREFACE)):
+                    return False
+                break
+            except socket.timeout:
+                if time.monotonic() - idle_since > 10:
+                    return False
+        if self.reader.take(len(PREFACE)) != PREFACE:
+            raise H2Error(PROTOCOL_ERROR, "bad connection preface")
+        return True
+
+    def _loop(self):
+        idle_timeout = self.server.keep_alive_timeout or 30.0
+        idle_since = time.monotonic()
+        while True:
+            with self._flow:
+                active = len(self.streams)
+            if self.server.draining and not self.goaway_sent:
+                # Finish what was started, refuse anything newer.
+                self.goaway()
+            if active == 0:
+                if self.goaway_sent or self.goaway_received:
+                    return
+                if time.monotonic() - idle_since > idle_timeout:
+                    self.goaway()
+                    return
+            else:
+                idle_since = time.monotonic()
+            try:
+                item = self.reader.read_frame(DEFAULT_FRAME_SIZE)
+            except socket.timeout:
+                continue
+            if item is None:
+                return
+            idle_since = time.monotonic()
+            self.handle_frame(*item)
+
+    def handle_frame(self, ftype, flags, stream_id, payload):
+        if ftype == HEADERS:
+            block = self._header_block(flags, stream_id, payload)
+            self._on_headers(stream_id, block)
+        elif ftype == DATA:
+            if stream_id == 0:
+                raise H2Error(PROTOCOL_ERROR, "DATA on stream 0")
+            # Request bodies are not read; give the window back so the peer is not stalled.
+            if payload:
+                update = struct.pack(">I", len(payload))
+                frames = frame(WINDOW_UPDATE, 0, 0, update)
+                if not flags & END_STREAM:
+                    frames += frame(WINDOW_UPDATE, 0, stream_id, update)
+                self.send(frames)
+        elif ftype == SETTINGS:
+            if stream_id != 0:
+                raise H2Error(PROTOCOL_ERROR, "SETTINGS on a stream")
+            if not flags & ACK:
+                self.apply_settings(payload)
+                self.send(frame(SETTINGS, ACK, 0))
+        elif ftype == WINDOW_UPDATE:
+            if len(payload) != 4:
+                raise H2Error(FRAME_SIZE_ERROR, "WINDOW_UPDATE size")
+            increment = struct.unpack(">I", payload)[0] & 0x7FFFFFFF
+            with self._flow:
+                if stream_id == 0:
+                    self.conn_window += increment
+                    if self.conn_window > MAX_WINDOW:
+                        raise H2Error(FLOW_CONTROL_ERROR, "connection window overflow")
+                elif stream_id in self.streams:
+                    stream = self.streams[stream_id]
+                    stream.window += increment
+                    if stream.window > MAX_WINDOW:
+                        stream.cancelled = True
+                        self.reset(stream_id, FLOW_CONTROL_ERROR)
+                self._flow.notify_all()
+        elif ftype == PING:
+            if len(payload) != 8:
+                raise H2Error(FRAME_SIZE_ERROR, "PING size")
+            if not flags & ACK:
+                self.send(frame(PING, ACK, 0, payload))
+        elif ftype == RST_STREAM:
+            with self._flow:
+                stream = self.streams.get(stream_id)
+                if stream is not None:
+                    stream.cancelled = True
+                self._flow.notify_all()
+        elif ftype == GOAWAY:
+            self.goaway_received = True
+        elif ftype in (PUSH_PROMISE, CONTINUATION):
+            raise H2Error(PROTOCOL_ERROR, f"unexpected frame type {ftype}")
+        # PRIORITY and unknown frame types are ignored.
+
+    def _header_block(self, flags, stream_id, payload) -> bytes:
+        """The complete header block of a HEADERS frame, including any CONTINUATION frames."""
+        if stream_id == 0:
+            raise H2Error(PROTOCOL_ERROR, "HEADERS on stream 0")
+        payload = strip_padding(flags, payload)
+        if flags & PRIORITY_FLAG:
+            payload = payload[5:]
+        block = bytearray(payload)
+        while not flags & END_HEADERS:
+            while True:
+                try:
+                    item = self.reader.read_frame(DEFAULT_FRAME_SIZE)
+                    break
+                except socket.timeout:
+                    continue
+            if item is None:
+                raise OSError("connection closed inside a header block")
+            ftype, flags, continued_id, payload = item
+            if ftype != CONTINUATION or continued_id != stream_id:
+                raise H2Error(PROTOCOL_ERROR, "header block interrupted")
+            block += payload
+            if len(block) > self.decoder.max_header_list_size * 2:
+                raise H2Error(PROTOCOL_ERROR, "header block too large")
+        return bytes(block)
+
+    def _on_headers(self, stream_id, block):
+        try:
+            headers = self.decoder.decode(block)
+        except HPACKError as e:
+            raise H2Error(COMPRESSION_ERROR, str(e))
+        if stream_id <= self.last_stream_id:
+            # Trailers of a request whose body we ignore, or a reused stream id.
+            if stream_id % 2 == 0 or stream_id in self.streams:
+                return
+            raise H2Error(PROTOCOL_ERROR, f"stream {stream_id} reused")
+        if stream_id % 2 == 0:
+            raise H2Error(PROTOCOL_ERROR, "client stream ids are odd")
+        self.last_stream_id = stream_id
+        if self.goaway_sent:
+            self.reset(stream_id, REFUSED_STREAM)
+            return
+        with self._flow:
+            full = len(self.streams) >= self.max_streams
+        if full:
+            self.reset(stream_id, REFUSED_STREAM)
+            return
+        self.open_stream(stream_id, headers)
+
+    def open_stream(self, stream_id, headers):
+        stream = _Stream(stream_id, self.peer_initial_window)
+        with self._flow:
+            self.streams[stream_id] = stream
+            if len(self.streams) == 1:
+                self.server.mark_busy(self.conn, True)
+        self.server.http2_executor.submit(self.run_stream, stream, headers)
+
+    def apply_settings(self, payload: bytes):
+        if len(payload) % 6:
+            raise H2Error(FRAME_SIZE_ERROR, "SETTINGS size")
+        for key, value in unpack_settings(payload):
+            if key == HEADER_TABLE_SIZE:
+                with self._write_lock:
+                    self.encoder.set_max_size(min(value, 4096))
+            elif key == INITIAL_WINDOW_SIZE:
+                if value > MAX_WINDOW:
+                    raise H2Error(FLOW_CONTROL_ERROR, "initial window too large")
+                with self._flow:
+                    delta = value - self.peer_initial_window
+                    self.peer_initial_window = value
+                    for stream in self.streams.values():
+                        stream.window += delta
+                    self._flow.notify_all()
+            elif key == MAX_FRAME_SIZE:
+                if not DEFAULT_FRAME_SIZE <= value <= 2 ** 24 - 1:
+                    raise H2Error(PROTOCOL_ERROR, "bad max frame size")
+                self.peer_max_frame = value
+
+    # --- Streams ---
+    def run_stream(self, stream: _Stream, headers):
+        response = None
+        # Bandwidth shaping (if enabled) paces this stream's DATA like an HTTP/1.1 response body.
+        transfer = self.server.shaper.transfer() if self.server.shaper is not None else None
+        try:
+            raw = self.request_bytes(headers)
+            if raw is None:
+                self.reset(stream.stream_id, PROTOCOL_ERROR)
+                return
+            with self.server.span("handle", stream=stream.stream_id):
+                response = self.server.handle_request(raw, self.addr)
+            if isinstance(response, (bytes, bytearray, memoryview)):
+                head, _, body = bytes(response).partition(b"\r\n\r\n")
+                pieces = None
+            else:
+                # Rendered Response: the head is the first piece, body pieces follow unframed.
+                response = iter(response)
+                head, body, pieces = next(response), b"", response
+            status, response_headers = self.response_headers(head)
+            if raw.startswith(b"HEAD "):
+                # A response to HEAD has no content, whatever the handler produced.
+                body, pieces = b"", None
+            with self.server.span("send", stream=stream.stream_id):
+                self.send_headers(stream.stream_id, [(":status", status)] + response_headers,
+                                  end_stream=not body and pieces is None)
+                if body:
+                    self.send_data(stream, body, end_stream=True, transfer=transfer)
+                elif pieces is not None:
+                    # Each piece is sent as it is produced (an event stream must not wait
+                    # for the next one); an empty DATA frame ends the stream.
+                    for piece in pieces:
+                        if piece:
+                            self.send_data(stream, piece, end_stream=False, transfer=transfer)
+                    self.send_data(stream, b"", end_stream=True)
+            self.served += 1
+        except OSError:
+            if not stream.cancelled and not self.closed:
+                self.reset(stream.stream_id, CANCEL)
+        except Exception as e:
+            print(f"[H2] stream {stream.stream_id} failed: {e!r}")
+            self.reset(stream.stream_id, INTERNAL_ERROR)
+        finally:
+            if transfer is not None:
+                transfer.close()
+            if response is not None and hasattr(response, "close"):
+                # Runs the Response's on_close (memory budget, coalescing) if it was cut short.
+                response.close()
+            with self._flow:
+                self.streams.pop(stream.stream_id, None)
+                if not self.streams:
+                    self.server.mark_busy(self.conn, False)
+                self._flow.notify_all()
+
+    @staticmethod
+    def request_bytes(headers) -> bytes | None:
+        """The request head server.handle_request() parses, with HTTP/2 as its version."""
+        pseudo = {}
+        lines = []
+        cookies = []
+        for name, value in headers:
+            if name.startswith(":"):
+                pseudo[name] = value
+            elif name == "cookie":
+                cookies.append(value)
+            elif name not in CONNECTION_HEADERS:
+                lines.append(f"{name}: {value}\r\n")
+        method, path = pseudo.get(":method"), pseudo.get(":path")
+        if not method or not path or " " in path:
+            return None
+        if ":authority" in pseudo:
+            lines.insert(0, f"host: {pseudo[':authority']}\r\n")
+        if cookies:
+            lines.append(f"cookie: {'; '.join(cookies)}\r\n")
+        return f"{method} {path} HTTP/2\r\n{''.join(lines)}\r\n".encode("latin-1")
+
+    @staticmethod
+    def response_headers(head: bytes) -> tuple[str, list[tuple[str, str]]]:
+        lines = bytes(head).split(b"\r\n")
+        status = lines[0].split(b" ", 2)[1].decode("ascii")
+        headers = []
+        for line in lines[1:]:
+            name, sep, value = line.partition(b":")
+            if not sep:
+                continue
+            name = name.decode("latin-1").strip().lower()
+            if name not in CONNECTION_HEADERS:
+                headers.append((name, value.decode("latin-1").strip()))
+        return status, headers
+
+    def _close(self):
+        with self._flow:
+            self.closed = True
+            self._flow.notify_all()
+            # Stream tasks notice `closed` at their next frame and finish.
+            deadline = time.monotonic() + 5
+            while self.streams and time.monotonic() < deadline:
+                self._flow.wait(0.5)
+        print(f"[H2] connection from {self.addr[0]} closed after {self.served} stream(s)")
@@ -1,11 +1,33 @@
 import os
+import heapq
 import mimetypes
+import stat
 import time 
 import threading 
+import hmac
+import json
+import resource
+import tracemalloc
+from urllib.parse import unquote, parse_qs
 from .tcp_server import TCPServer
-from .request import HTTPRequest
-from .pathing import resolve_safe
-from .listing import directory_to_links
+from .request import HTTPRequest, parse_byte_range, accepts_encoding
+from .pathing import resolve_safe, normalize_url_path
+from .listing import (iter_directory_links, iter_directory_json, cached_scan, parse_listing_query,
+                      listing_format, LISTING_FORMATS)
+from .response import Response
+from .proxy import forwarded_client, is_trusted
+from .sketch import CountMinSketch, TopK
+from .interning import PathTable
+from .pool import AdaptivePool
+from .ratelimit import GCRALimiter
+from .coalesce import SingleFlight
+from .profiling import SamplingProfiler, RequestProfiler
+from .memory import MemoryBudget, SharedReservation, iter_file, allocation_report
+from .events import EventHub, default_max_subscribers
+from .cpuwork import CPUOffload, GZIP_MAX_BYTES, GZIP_TYPES, burn, gzip_file
+
+# Read size for file bodies sent on the streaming path.
+STREAM_CHUNK = 64 * 1024
 
 
 class HTTPServer(TCPServer):
@@ -16,10 +38,15 @@ class HTTPServer(TCPServer):
 
     status_codes = {
         200: 'OK',
+        206: 'Partial Content',
         400: 'Bad Request',
+        403: 'Forbidden',
         404: 'Not Found',
+        409: 'Conflict',
+        416: 'Range Not Satisfiable',
         429: 'Too Many Requests',
         501: 'Not Implemented',
+        503: 'Service Unavailable',
     }
 
     mime_overrides = {
@@ -30,49 +57,188 @@ class HTTPServer(TCPServer):
     }
 
     def __init__(self, host='127.0.0.1', port=8000, max_workers=10, simulated_delay_seconds=0.0,
-                 counter_mode: str = "naive", counter_delay: float = 0.0, rate_limit: float = 0.0):
+                 counter_mode: str = "naive", counter_delay: float = 0.0, rate_limit: float = 0.0,
+                 hits_store=None, sketch_width: int = 2048, sketch_depth: int = 4, top_k: int = 32,
+                 shared_state=None, reuse_port=False, min_workers=None, pool_options=None,
+                 bulk_workers: int = 0, bulk_threshold: int = 256 * 1024, shaper=None,
+                 rate_policy=None, coalesce: bool = True, pack=None, profile: bool = False,
+                 profile_token: str | None = None, profile_sample_rate: float = 0.0,
+                 memory_budget: int = 0, memory_wait: float = 0.5, tracer=None,
+                 keep_alive_timeout: float = 0.0, trusted_proxies=None, drain_timeout: float = 10.0,
+                 http2: bool = False, http2_workers: int = 32, http2_max_streams: int = 100,
+                 bulk_queue=None, events_interval: float = 1.0, events_max_subscribers: int | None = None,
+                 cpu_work: int = 0, gzip_level: int = 0, cpu_offload=None):
         # Initialize parent with bounded thread pool configuration.
-        super().__init__(host=host, port=port, max_workers=max_workers)
+        super().__init__(host=host, port=port, max_workers=max_workers, reuse_port=reuse_port,
+                         min_workers=min_workers, pool_options=pool_options, bulk_workers=bulk_workers,
+                         shaper=shaper, tracer=tracer, keep_alive_timeout=keep_alive_timeout,
+                         drain_timeout=drain_timeout, http2=http2, http2_workers=http2_workers,
+                         http2_max_streams=http2_max_streams, bulk_queue=bulk_queue)
+        # Files at least this large go to the bulk lane (when bulk_workers > 0).
+        self.bulk_threshold = bulk_threshold
         # Optional artificial delay to simulate per-request work time (not the race demo).
         self.simulated_delay_seconds = simulated_delay_seconds
-        # Per-path hit counters (shared across threads in this process).
-        self.hits: dict[str, int] = {}
+        # Per-path hit counters (shared across threads in this process). The naive
+        # mode keeps a plain dict for the race demo; the synchronized modes intern
+        # each path to an ID with its counter in a compact array (see PathTable).
+        self.hits: dict[str, int] | PathTable = {} if counter_mode == "naive" else PathTable()
+        # Cross-process backend (see shm.SharedState): when given, hits, totals and
+        # rate-limit windows live in shared memory that every local server process
+        # attaches to, so counting and limiting are global rather than per process.
+        self.shared = shared_state
+        if self.shared is not None:
+            self.hits = self.shared.hits
         # Lock used by the lock-based counter mode.
         self._hits_lock = threading.Lock()
-        # Counter settings: 'naive' exhibits races; 'locked' protects increments.
+        # Counter settings: 'naive' exhibits races; 'locked' protects increments;
+        # 'sketch' bounds memory with an approximate Count-Min sketch + top-K summary.
         self.counter_mode = counter_mode
+        self.sketch = None
+        self.top_paths = None
+        if self.counter_mode == "sketch":
+            self.sketch = CountMinSketch(width=sketch_width, depth=sketch_depth)
+            self.top_paths = TopK(k=top_k)
         # Delay inserted between read and write in increment to force interlacing.
         self.counter_delay = counter_delay
         self.total_requests = 0
         self._stats_lock = threading.Lock()
 
+        # Optional write-behind persistence (see persistence.HitStore). Totals from
+        # previous runs are restored once here; requests only buffer deltas in memory.
+        self.hits_store = hits_store
+        self.restored_hits = 0
+        self._restored_totals: dict[str, int] = {}
+        if self.hits_store is not None:
+            restored = self.hits_store.load()
+            if self.shared is None:
+                self.hits.update(restored)
+                self.restored_hits = sum(restored.values())
+                self._restored_totals = restored
+            elif self.shared.created:
+                # Only the process that created the segment seeds it from disk.
+                for key, count in restored.items():
+                    self.shared.add_hit(key, delta=count)
+                self.restored_hits = sum(restored.values())
+            self.hits_store.start()
+
         # Rate limiting: track request timestamps per IP
         self.rate_limit = rate_limit  
         self.rate_limit_window = {}  
         self._rate_limit_lock = threading.Lock()
         self.rate_limit_blocked = 0 
+        # Optional route-aware, cost-weighted policy (see ratelimit.RateLimitPolicy).
+        # When set, requests are parsed and classified before being charged.
+        self.rate_policy = rate_policy
+        self._gcra = GCRALimiter()
+        self.rate_limit_blocked_by = {}
+
+        # Single-flight coalescing: concurrent requests for the same file or listing
+        # share one disk read / render instead of each doing it (see coalesce.SingleFlight).
+        self.flights = SingleFlight() if coalesce else None
+
+        # Optional memory-mapped content pack (see pack.ContentPack): when set, GETs
+        # are answered from its index and mapping instead of the --root directory.
+        self.pack = pack
+
+        # Opt-in profiling: /_profile (sampling, or the cProfile aggregate) exists only
+        # when `profile` is set, and answers loopback clients or holders of the token.
+        self.profile_enabled = profile
+        self.profile_token = profile_token
+        self._profile_lock = threading.Lock()
+        self.request_profiler = RequestProfiler(profile_sample_rate) if profile_sample_rate > 0 else None
+
+        # In-flight response memory (see memory.MemoryBudget): file bodies reserve their
+        # size until sent. Over budget, a request waits up to memory_wait, then streams
+        # in STREAM_CHUNK pieces, and is refused with 503 only if even that cannot fit.
+        self.memory = MemoryBudget(memory_budget)
+        self.memory_wait = memory_wait
+        self._last_snapshot = None
+
+        # Reverse proxies (ip_network list, see proxy.parse_trusted) whose
+        # X-Forwarded-For is believed: behind one, the client IP used for rate
+        # limiting and logs is the forwarded one instead of the proxy's.
+        self.trusted_proxies = trusted_proxies or []
+
+        # Live statistics over Server-Sent Events (/_events, see events.EventHub): one
+        # aggregator per process computes each tick's snapshot for every subscriber.
+        # Each subscriber holds a worker of the lane /_events runs in (bulk if enabled),
+        # so by default they may take only a quarter of it.
+        self.events = EventHub(self.event_sample, interval=events_interval,
+                               max_subscribers=events_max_subscribers
+                               or default_max_subscribers(bulk_workers or max_workers))
+
+        # CPU-bound request work (see cpuwork.CPUOffload): cpu_work units of synthetic
+        # pure-Python work per request, and gzip (level 1-9, 0 = off) of HTML files
+        # for clients that accept it. Both run where cpu_offload says: on the worker
+        # thread, or in a process pool that is sent only the work size or file path.
+        self.cpu_work = cpu_work
+        self.gzip_level = gzip_level
+        self.cpu = cpu_offload or CPUOffload("thread")
+
+        # Request tracing (see tracing.Tracer): the shared locks are wrapped so that
+        # contended acquisitions show up as "wait <lock>" spans on the timeline.
+        if self.tracer is not None:
+            self._hits_lock = self.tracer.lock(self._hits_lock, "hits")
+            self._stats_lock = self.tracer.lock(self._stats_lock, "stats")
+            self._rate_limit_lock = self.tracer.lock(self._rate_limit_lock, "rate limit")
 
     # --- Counter utilities ---
+    def absorb_restored(self, totals: dict[str, int]):
+        """
+        Add hits persisted after this process restored its counters, i.e. the
+        final flush of the process it replaced in a hot restart.
+        """
+        if self.shared is not None:
+            # Both processes counted into the same segment already.
+            return
+        with self._hits_lock:
+            added = 0
+            for key, count in totals.items():
+                delta = count - self._restored_totals.get(key, 0)
+                if delta > 0:
+                    self.hits[key] = self.hits.get(key, 0) + delta
+                    added += delta
+            self._restored_totals = totals
+            self.restored_hits += added
+        print(f"[RESTORE] absorbed {added} hit(s) counted by the previous process")
+
     def _normalize_key_from_url(self, url_path: str) -> str:
-        part = url_path.split('?', 1)[0].split('#', 1)[0]
-        from urllib.parse import unquote
-        part = unquote(part)
-        if not part.startswith('/'):
-            part = '/' + part
-        return part
-
-    def increment_hit(self, url_path: str):
+        return normalize_url_path(url_path)
+
+    def increment_hit(self, url_path: str, exists: bool = True):
         key = self._normalize_key_from_url(url_path)
         with self._stats_lock:
             self.total_requests += 1
-        
-        if self.counter_mode == "locked":
+        self.events.record(key)
+
+        if self.shared is not None:
+            self.shared.add_request()
+            if not exists:
+                # The path table has a fixed number of slots: junk URIs (scans, typos)
+                # must not claim them, or real files stop being counted once it fills.
+                missing = self.shared.add_missing()
+                print(f"[COUNTER:SHARED] '{key}': not found, no path slot ({missing} missing so far, pid {os.getpid()})")
+                return
+            previous, new_val = self.shared.add_hit(key, delay=self.counter_delay)
+            print(f"[COUNTER:SHARED] '{key}': {previous} → {new_val} (pid {os.getpid()})")
+        elif self.counter_mode == "sketch":
+            # Every request lands in the fixed-size sketch; only paths that exist on
+            # disk get an exact entry, so unique junk URIs cannot grow self.hits.
             with self._hits_lock:
-                previous = self.hits.get(key, 0)
+                estimate = self.sketch.add(key)
+                self.top_paths.offer(key, estimate)
+                if exists:
+                    self.hits.add(self.hits.intern(key))
+            print(f"[COUNTER:SKETCH] '{key}': ~{estimate}{'' if exists else ' (not found, sketch only)'}")
+            if not exists:
+                return
+        elif self.counter_mode == "locked":
+            path_id = self.hits.intern(key)
+            with self._hits_lock:
+                previous = self.hits.value(path_id)
                 if self.counter_delay and self.counter_delay > 0:
                     time.sleep(self.counter_delay)  
-                self.hits[key] = previous + 1
-                new_val = self.hits[key]
+                new_val = self.hits.add(path_id)
             print(f"[COUNTER:LOCKED] '{key}': {previous} → {new_val}")
         else:
             previous = self.hits.get(key, 0)
@@ -82,18 +248,50 @@ class HTTPServer(TCPServer):
             new_val = self.hits[key]
             print(f"[COUNTER:NAIVE]  '{key}': {previous} → {new_val} (⚠️ race possible)")
 
+        if self.hits_store is not None:
+            self.hits_store.record(key)
+
     def get_hits_for_href(self, href: str) -> int:
         key = self._normalize_key_from_url(href)
+        if self.sketch is not None and key not in self.hits:
+            return self.sketch.estimate(key)
         return self.hits.get(key, 0)
+
+    def get_hits_for_hrefs(self, hrefs) -> list[int]:
+        """Batch form of get_hits_for_href, used for all rows of a listing at once."""
+        keys = [self._normalize_key_from_url(h) for h in hrefs]
+        if self.shared is not None:
+            counts = [self.shared.get_hits(k) for k in keys]
+        elif isinstance(self.hits, PathTable):
+            counts = self.hits.counts_for(keys)
+        else:
+            counts = [self.hits.get(k, 0) for k in keys]
+        if self.sketch is not None:
+            counts = [c if k in self.hits else self.sketch.estimate(k) for k, c in zip(keys, counts)]
+        return counts
     
     # --- Rate limiting utilities ---
-    def check_rate_limit(self, client_ip: str) -> bool:
+    def check_rate_limit(self, client_ip: str, route: str | None = None, cost: float = 1.0) -> bool:
         """
         Thread-safe rate limiter using sliding window.
         Returns True if request is allowed, False if rate limit exceeded.
+        With a rate policy, route/cost select the per-route, cost-weighted check.
         """
+        if route is not None and self.rate_policy is not None:
+            return self._check_rate_policy(client_ip, route, cost)
+
         if self.rate_limit <= 0:
             return True  
+
+        if self.shared is not None:
+            # Global across processes: a sliding-window counter in shared memory.
+            allowed, usage = self.shared.rate_limit_allow(client_ip, self.rate_limit)
+            if allowed:
+                print(f"[RATE-LIMIT:SHARED] {client_ip}: {usage:.1f}/{int(self.rate_limit)} ✓ allowed")
+            else:
+                print(f"[RATE-LIMIT:SHARED] {client_ip}: {usage:.1f}/{int(self.rate_limit)} ✗ BLOCKED "
+                      f"(total blocked: {self.shared.rate_limit_blocked})")
+            return allowed
         
         current_time = time.time()
         window_size = 1.0 
@@ -119,19 +317,120 @@ class HTTPServer(TCPServer):
                 print(f"[RATE-LIMIT] {client_ip}: {len(timestamps)}/{int(self.rate_limit)} ✗ BLOCKED (total blocked: {self.rate_limit_blocked})")
                 return False
     
+    # --- Scheduling ---
+    def _coalesced(self, key, produce):
+        """Run produce() once per key across concurrent requests (or always, if disabled)."""
+        if self.flights is None:
+            return produce()
+        result, _shared = self.flights.do(key, produce)
+        return result
+
+    def classify(self, data):
+        """
+        Lane for a request, decided after path resolution: regular files of at
+        least bulk_threshold bytes are "bulk"; listings, small files, internal
+        endpoints and anything unparsable stay in the "latency" lane.
+        """
+        try:
+            request = HTTPRequest(data)
+        except ValueError:
+            return "latency"
+        if request.uri.split("?", 1)[0] == "/_events":
+            # An event stream holds its worker for as long as the dashboard stays open.
+            return "bulk"
+        if request.uri.startswith("/_"):
+            return "latency"
+        st = self._stat_target(request.uri)
+        if st is not None and stat.S_ISREG(st.st_mode) and st.st_size >= self.bulk_threshold:
+            return "bulk"
+        return "latency"
+
+    def _stat_target(self, uri):
+        """stat() of what a URI would serve (pack entry or file under the root), or None."""
+        if self.pack is not None:
+            return self.pack.stat(uri)
+        candidate = resolve_safe(uri)
+        if candidate is None:
+            return None
+        try:
+            return candidate.stat()
+        except OSError:
+            return None
+
+    def _check_rate_policy(self, client_ip: str, route: str, cost: float) -> bool:
+        limiter = self.shared if self.shared is not None else self._gcra
+        limit = self.rate_policy.limit_for(route)
+        scope, wait, allowed = route, 0.0, True
+        if limit > 0:
+            allowed, wait = limiter.gcra_allow(f"{client_ip} {route}", limit, cost)
+        if allowed and self.rate_policy.global_limit > 0:
+            # Server-wide ceiling, charged only for requests the client could afford.
+            scope = "global"
+            allowed, wait = limiter.gcra_allow("*", self.rate_policy.global_limit, cost)
+            if not allowed and limit > 0:
+                # Not served, so not the client's to pay for: a busy server must not
+                # use up the allowance of clients that stayed within their own limit.
+                limiter.gcra_refund(f"{client_ip} {route}", limit, cost)
+        if allowed:
+            print(f"[RATE-LIMIT] {client_ip} {route}: cost {cost:.2f} ✓ allowed")
+            return True
+        with self._rate_limit_lock:
+            self.rate_limit_blocked += 1
+            self.rate_limit_blocked_by[scope] = self.rate_limit_blocked_by.get(scope, 0) + 1
+        print(f"[RATE-LIMIT] {client_ip} {route}: cost {cost:.2f} ✗ BLOCKED by {scope} limit "
+              f"(retry in {wait:.2f}s, total blocked: {self.rate_limit_blocked})")
+        return False
+
+    def event_sample(self) -> dict:
+        """Running totals for /_events; plain reads, nothing is sorted or copied."""
+        if self.shared is not None:
+            requests = self.shared.total_requests
+            blocked = self.shared.rate_limit_blocked if self.rate_policy is None else self.rate_limit_blocked
+        else:
+            requests, blocked = self.total_requests, self.rate_limit_blocked
+        return {"requests": requests, "rate_limited": blocked, "pool": self.worker_stats()}
+
     def print_stats(self):
         """Print hit counter statistics for analysis."""
         print("\n" + "=" * 80)
         print("HIT COUNTER STATISTICS")
         print("=" * 80)
         print(f"Mode              : {self.counter_mode.upper()}")
-        print(f"Total Requests    : {self.total_requests}")
-        print(f"Unique Paths      : {len(self.hits)}")
-        total_hits = sum(self.hits.values())
+        total_requests = self.total_requests
+        if self.shared is not None:
+            total_requests = self.shared.total_requests
+            print(f"Shared State      : /dev/shm/{self.shared.name} "
+                  f"(this process: {self.total_requests} requests, pid {os.getpid()})")
+            if self.rate_limit > 0:
+                print(f"Rate-Limit Blocks : {self.shared.rate_limit_blocked} (all processes), "
+                      f"{self.shared.tracked_clients()} active clients")
+        print(f"Total Requests    : {total_requests}")
+        if self.rate_policy is not None:
+            blocked = ", ".join(f"{k} {v}" for k, v in sorted(self.rate_limit_blocked_by.items())) or "none"
+            print(f"Rate Policy       : {self.rate_policy.describe()}")
+            print(f"                    blocked {self.rate_limit_blocked} ({blocked})")
+        existing_only = self.sketch is not None or self.shared is not None
+        print(f"Unique Paths      : {len(self.hits)}{' (existing files only)' if existing_only else ''}")
+        if isinstance(self.hits, PathTable):
+            print(f"Counter Storage   : interned path IDs, {self.hits.memory_bytes} bytes array('Q')")
+        # Hits restored from disk were not requested in this run; leave them out of the loss check.
+        total_hits = sum(self.hits.values()) - self.restored_hits
+        if self.shared is not None:
+            # Requests for missing paths were counted, just not per path.
+            total_hits += self.shared.missing_requests
+            print(f"Missing Paths     : {self.shared.missing_requests} request(s), no path slot used")
+        if self.sketch is not None:
+            # The sketch sees every counted request, including ones for missing paths.
+            total_hits = self.sketch.total
+            print(f"Sketch            : {self.sketch.depth}x{self.sketch.width} "
+                  f"({self.sketch.memory_bytes // 1024} KiB), top-{self.top_paths.k} tracked")
         print(f"Total Recorded Hits: {total_hits}")
-        if self.total_requests > 0:
-            loss_pct = ((self.total_requests - total_hits) / self.total_requests) * 100
-            print(f"Lost Updates      : {self.total_requests - total_hits} ({loss_pct:.1f}%)")
+        if self.hits_store is not None:
+            print(f"Restored Hits     : {self.restored_hits} (from {self.hits_store.log_path})")
+            print(f"Store Flushes     : {self.hits_store.flushes} ({self.hits_store.compactions} compactions)")
+        if total_requests > 0:
+            loss_pct = ((total_requests - total_hits) / total_requests) * 100
+            print(f"Lost Updates      : {total_requests - total_hits} ({loss_pct:.1f}%)")
             if loss_pct > 5:
                 print(f"                    ⚠️  SIGNIFICANT DATA LOSS - Race condition detected!")
             elif loss_pct > 0:
@@ -139,8 +438,51 @@ class HTTPServer(TCPServer):
             else:
                 print(f"                    ✓ No data loss - Synchronization working!")
         print("-" * 80)
-        print("Top 5 paths by hits:")
-        sorted_hits = sorted(self.hits.items(), key=lambda x: x[1], reverse=True)[:5]
+        if isinstance(self.executor, AdaptivePool):
+            pool = self.executor.stats()
+            print(f"Worker Pool       : adaptive {pool['size']} threads (min {pool['min']}, max {pool['max']}, "
+                  f"peak {pool['peak']}), {pool['busy']} busy, {pool['queued']} queued")
+            print(f"Pool Decisions    : {pool['grows']} grows, {pool['shrinks']} shrinks; queue wait "
+                  f"avg {pool['avg_queue_wait_s'] * 1000:.1f}ms max {pool['max_queue_wait_s'] * 1000:.1f}ms")
+            for ts, action, size, reason in pool["recent_decisions"][-5:]:
+                print(f"  {time.strftime('%H:%M:%S', time.localtime(ts))} {action:<6} -> {size:3d}  {reason}")
+        else:
+            print(f"Worker Pool       : fixed {self.max_workers} threads")
+        if self.bulk_executor is not None:
+            print(f"Lanes             : latency {self.lane_counts['latency']} reqs | bulk {self.lane_counts['bulk']} reqs "
+                  f"(>= {self.bulk_threshold} bytes, {self.bulk_workers} workers: "
+                  f"{self.bulk_active} active, {self.bulk_queued}/{self.bulk_queue} queued, "
+                  f"{self.bulk_rejected} rejected)")
+        if self.shaper is not None and self.shaper.enabled:
+            bw = self.shaper.stats()
+            limits = []
+            if self.shaper.global_rate > 0:
+                limits.append(f"global {self.shaper.global_rate / 1024:.0f} KiB/s")
+            if self.shaper.per_connection_rate > 0:
+                limits.append(f"per-conn {self.shaper.per_connection_rate / 1024:.0f} KiB/s")
+            print(f"Bandwidth Shaping : {', '.join(limits)} for responses >= {self.shaper.min_bytes} bytes")
+            print(f"                    {bw['active']} active, {bw['shaped_transfers']} shaped transfers "
+                  f"({bw['shaped_bytes'] // 1024} KiB), {bw['unshaped_bytes'] // 1024} KiB unshaped")
+            print(f"                    achieved per transfer: avg {bw['avg_transfer_rate'] / 1024:.0f} KiB/s, "
+                  f"max {bw['max_transfer_rate'] / 1024:.0f} KiB/s; last 10s: {bw['recent_bytes_10s'] / 10 / 1024:.0f} KiB/s")
+        mem = self.memory.stats()
+        print(f"Response Memory   : {mem['current'] // 1024} KiB in flight, peak {mem['peak'] // 1024} KiB"
+              + (f" of {mem['limit'] // 1024} KiB budget; {mem['waited']} waited, {mem['streamed']} streamed, "
+                 f"{mem['rejected']} rejected (503)" if mem['limit'] else " (no budget)"))
+        if self.pack is not None:
+            print(f"Content Pack      : {self.pack.path} ({len(self.pack.files)} files, "
+                  f"{self.pack.size / (1 << 20):.1f} MiB mapped)")
+        if self.flights is not None:
+            flights = self.flights.stats()
+            print(f"Coalescing        : {flights['coalesced']} requests shared a result, "
+                  f"{flights['executed']} reads/renders done (max {flights['max_waiters']} waiting on one)")
+        print("-" * 80)
+        if self.top_paths is not None:
+            print("Top 5 paths by hits (approximate):")
+            sorted_hits = self.top_paths.top(5)
+        else:
+            print("Top 5 paths by hits:")
+            sorted_hits = heapq.nlargest(5, self.hits.items(), key=lambda x: x[1])
         for path, count in sorted_hits:
             print(f"  {count:4d} hits: {path}")
         print("=" * 80 + "\n")
@@ -151,24 +493,119 @@ class HTTPServer(TCPServer):
         """
         # Extract client IP from address tuple
         client_ip = addr[0] if addr else "unknown"
+        parsed = None
+        if self.trusted_proxies and is_trusted(client_ip, self.trusted_proxies):
+            # The limiter must charge the real client, so a proxied request is
+            # parsed before the rate-limit check to read its forwarded address.
+            parsed = self._parse(data)
+            if parsed is not None:
+                client_ip = forwarded_client(parsed.headers.get("x-forwarded-for"), client_ip, self.trusted_proxies)
         
         # Check rate limit first (before parsing request)
-        if not self.check_rate_limit(client_ip):
-            return self.HTTP_429_handler()
+        if self.rate_policy is None:
+            with self.span("rate limit"):
+                allowed = self.check_rate_limit(client_ip)
+            if not allowed:
+                # Behind a proxy the request is already parsed: keep its pooled connection.
+                return self._persist_if_wanted(self.HTTP_429_handler(), parsed)
         
-        try:
-            request = HTTPRequest(data)
-        except ValueError:
+        request = parsed if parsed is not None else self._parse(data)
+
+        if self.rate_policy is not None:
+            # Route-aware limits need the parsed request and the resolved target.
+            with self.span("rate limit"):
+                route, cost = self.rate_policy.assess(request, stat_target=self._stat_target)
+                allowed = self.check_rate_limit(client_ip, route=route, cost=cost)
+            if not allowed:
+                return self._persist_if_wanted(self.HTTP_429_handler(), request)
+
+        if request is None:
             return self.HTTP_400_handler()
+        request.client_ip = client_ip
+        request.keep_alive = self._wants_keep_alive(request)
 
         try:
             handler = getattr(self, 'handle_%s' % request.method)
         except AttributeError:
             handler = self.HTTP_501_handler
 
-        response = handler(request)
+        profile = None
+        if self.request_profiler is not None and not request.uri.startswith("/_"):
+            profile = self.request_profiler.start()
+        with self.span(request.method, uri=request.uri):
+            try:
+                response = handler(request)
+            except BaseException:
+                if profile is not None:
+                    self.request_profiler.stop(profile)
+                raise
+        if isinstance(response, Response):
+            if profile is not None:
+                # Listings, file reads and generators run while the body is sent:
+                # keep profiling until the last piece has been written.
+                response.on_close = self._profiled_close(profile, response.on_close)
+            return self.render_response(response, request)
+        if profile is not None:
+            self.request_profiler.stop(profile)
+
+        return self._persist_if_wanted(response, request)
+
+    def _profiled_close(self, profile, on_close):
+        def close():
+            try:
+                if on_close is not None:
+                    on_close()
+            finally:
+                self.request_profiler.stop(profile)
+        return close
+
+    def _drain(self):
+        # Open event streams would keep their workers until the drain deadline.
+        self.events.close()
+        super()._drain()
 
-        return response
+    def _wants_keep_alive(self, request) -> bool:
+        # Persistent connections need HTTP/1.1, a client that did not ask to close,
+        # and no request body (nothing here reads one; it would be taken as the next request).
+        # While draining, every response says close so clients reconnect elsewhere.
+        return (self.keep_alive_timeout > 0 and not self.draining
+                and request.http_version.upper() == "HTTP/1.1"
+                and request.headers.get("connection", "").lower() != "close"
+                and "content-length" not in request.headers
+                and "transfer-encoding" not in request.headers)
+
+    def _persist_if_wanted(self, response: bytes, request) -> bytes:
+        """A pre-built (Content-Length framed) response, switched to keep-alive when the request allows it."""
+        if request is None or not self._wants_keep_alive(request):
+            return response
+        head, sep, body = response.partition(b"\r\n\r\n")
+        return head.replace(b"\r\nConnection: close", b"\r\nConnection: keep-alive") + sep + body
+
+    def _parse(self, data):
+        with self.span("parse"):
+            try:
+                return HTTPRequest(data)
+            except ValueError:
+                return None
+
+    def render_response(self, response: Response, request=None):
+        """Head + framed body of a Response, as an iterator of bytes for the send path."""
+        chunked = response.chunked
+        extra = dict(response.headers)
+        if not chunked:
+            extra["Content-Length"] = str(response.length)
+        elif request is not None and request.http_version.upper() in ("HTTP/1.0", "HTTP/2"):
+            # No chunked encoding before HTTP/1.1: the closing connection ends the body.
+            # HTTP/2 frames the body itself (DATA frames, END_STREAM).
+            chunked = False
+        else:
+            extra["Transfer-Encoding"] = "chunked"
+        if chunked or not response.chunked:
+            # Framed body: the end of the response is known without closing.
+            if request is not None and request.keep_alive:
+                extra["Connection"] = "keep-alive"
+        head = b"".join([self.response_line(status_code=response.status), self.response_headers(extra), b"\r\n"])
+        return response.wire(head, chunked=chunked)
 
     def HTTP_400_handler(self):
         response_body = b"<h1>400 Bad Request</h1>"
@@ -183,6 +620,17 @@ class HTTPServer(TCPServer):
 
         return b"".join([response_line, response_headers, blank_line, response_body])
     
+    def HTTP_403_handler(self):
+        response_body = b"<h1>403 Forbidden</h1>"
+        extra = {
+            "Content-Length": str(len(response_body)),
+            "Connection": "close",
+        }
+        response_line = self.response_line(status_code=403)
+        response_headers = self.response_headers(extra)
+        blank_line = b"\r\n"
+        return b"".join([response_line, response_headers, blank_line, response_body])
+
     def HTTP_404_handler(self):
         response_body = b"<h1>404 Not Found</h1>"
         extra = {
@@ -194,6 +642,29 @@ class HTTPServer(TCPServer):
         blank_line = b"\r\n"
         return b"".join([response_line, response_headers, blank_line, response_body])
 
+    def HTTP_409_handler(self, message):
+        response_body = f"<h1>409 Conflict</h1><p>{message}</p>".encode()
+        extra = {
+            "Content-Length": str(len(response_body)),
+            "Connection": "close",
+        }
+        response_line = self.response_line(status_code=409)
+        response_headers = self.response_headers(extra)
+        blank_line = b"\r\n"
+        return b"".join([response_line, response_headers, blank_line, response_body])
+
+    def HTTP_416_handler(self, size):
+        response_body = b"<h1>416 Range Not Satisfiable</h1>"
+        extra = {
+            "Content-Length": str(len(response_body)),
+            "Content-Range": f"bytes */{size}",
+            "Connection": "close",
+        }
+        response_line = self.response_line(status_code=416)
+        response_headers = self.response_headers(extra)
+        blank_line = b"\r\n"
+        return b"".join([response_line, response_headers, blank_line, response_body])
+
     def HTTP_429_handler(self):
         response_body = b"<h1>429 Too Many Requests</h1><p>Rate limit exceeded. Please slow down.</p>"
         extra = {
@@ -218,6 +689,21 @@ class HTTPServer(TCPServer):
 
         return b"".join([response_line, response_headers, blank_line, response_body])
 
+    def busy_response(self):
+        return self.HTTP_503_handler()
+
+    def HTTP_503_handler(self, retry_after: int = 1):
+        response_body = b"<h1>503 Service Unavailable</h1><p>Server is busy sending other responses. Retry shortly.</p>"
+        extra = {
+            "Content-Length": str(len(response_body)),
+            "Connection": "close",
+            "Retry-After": str(retry_after),
+        }
+        response_line = self.response_line(status_code=503)
+        response_headers = self.response_headers(extra)
+        blank_line = b"\r\n"
+        return b"".join([response_line, response_headers, blank_line, response_body])
+
 
     def handle_GET(self, request):
         start = time.perf_counter()
@@ -237,24 +723,69 @@ class HTTPServer(TCPServer):
             blank_line = b"\r\n"
             return b"".join([response_line, response_headers, blank_line, response_body])
 
+        if request.uri.split("?", 1)[0] == "/_profile" and self.profile_enabled:
+            return self.handle_profile(request)
+        if request.uri.split("?", 1)[0] == "/_memory":
+            return self.handle_memory(request)
+        if request.uri.split("?", 1)[0] == "/_events":
+            return self.handle_events(request)
+        if request.uri.split("?", 1)[0] == "/_trace" and self.tracer is not None:
+            return self.handle_trace(request)
+        if request.uri == "/_health":
+            # Liveness probe for load balancers (see proxy.py): no delay, no hit counted.
+            return Response(200, {"Content-Type": "text/plain; charset=utf-8", "Cache-Control": "no-store",
+                                  "Connection": "close"}, b"ok\n")
+
         if self.simulated_delay_seconds and self.simulated_delay_seconds > 0:
-            time.sleep(self.simulated_delay_seconds)
+            with self.span("simulated delay"):
+                time.sleep(self.simulated_delay_seconds)
+        if self.cpu_work > 0:
+            with self.span("cpu work", offload=self.cpu.mode):
+                self.cpu.run(burn, self.cpu_work)
 
-        candidate = resolve_safe(request.uri)
-        if candidate is None:
-            return self.HTTP_404_handler()
+        request_path, _, query = (request.uri if request.uri else "/").partition("?")
+        if self.pack is not None:
+            # Served from the pack index alone: no path resolution or filesystem calls.
+            candidate = None
+            st = self.pack.stat(request_path)
+        else:
+            candidate = resolve_safe(request.uri)
+            if candidate is None:
+                return self.HTTP_404_handler()
+            try:
+                st = candidate.stat()
+            except OSError:
+                st = None
 
         # Increment hit counter for both directories and files (post path resolution).
-        self.increment_hit(request.uri if request.uri else "/")
-        if candidate.is_dir():
-            response_body = directory_to_links(
-                candidate,
-                request.uri if request.uri else "/",
-                get_hits=self.get_hits_for_href,
-            )
+        with self.span("increment hit"):
+            self.increment_hit(request.uri if request.uri else "/", exists=st is not None)
+        if st is not None and stat.S_ISDIR(st.st_mode):
+            # The directory scan is the shared part (cached while the directory is
+            # unchanged, coalesced when it is not); it runs after the page head has
+            # been sent, and each request streams its own page of rows, with current
+            # hit counts, as they are rendered.
+            if self.pack is not None:
+                entries = self.pack.listing(request_path)
+                listing_stat = lambda name: self.pack.child_stat(request_path, name)
+            else:
+                entries = lambda: self._coalesced(("listing", str(candidate)), lambda: cached_scan(candidate))
+                listing_stat = None
+            fmt = listing_format(query, request.headers.get("accept"))
+            if fmt == "html":
+                response_body = iter_directory_links(candidate, request_path or "/",
+                                                     get_hits_batch=self.get_hits_for_hrefs,
+                                                     entries=entries, stat=listing_stat,
+                                                     **parse_listing_query(query))
+            else:
+                response_body = iter_directory_json(candidate, request_path or "/",
+                                                    get_hits_batch=self.get_hits_for_hrefs,
+                                                    entries=entries, ndjson=fmt == "ndjson", stat=listing_stat,
+                                                    **parse_listing_query(query))
             extra_headers = {
-                "Content-Type": "text/html; charset=utf-8",
-                "Content-Length": str(len(response_body)),
+                "Content-Type": LISTING_FORMATS[fmt],
+                # Same URL, different bodies by Accept: caches must key on it too.
+                "Vary": "Accept",
                 "Connection": "close",
                 "Server": "Crude Server",
                 "X-Worker-Thread": worker_name,
@@ -263,40 +794,237 @@ class HTTPServer(TCPServer):
                 "Pragma": "no-cache",
                 "Expires": "0",
             }
+            return Response(200, extra_headers, response_body)
 
-            response_line = self.response_line(status_code=200)
-            response_headers = self.response_headers(extra_headers)
-            blank_line = b"\r\n"
-            return b"".join([response_line, response_headers, blank_line, response_body])
-
-        if candidate.exists() and candidate.is_file():
-            suffix = candidate.suffix.lower()
+        if st is not None and stat.S_ISREG(st.st_mode):
+            name = candidate.name if candidate is not None else unquote(request_path).rsplit("/", 1)[-1]
+            suffix = os.path.splitext(name)[1].lower()
             allowed_suffixes = {'.html', '.htm', '.png', '.pdf'}
             if suffix not in allowed_suffixes:
                 return self.HTTP_404_handler()
             content_type = (
                 self.mime_overrides.get(suffix)
-                or mimetypes.guess_type(str(candidate))[0]
+                or mimetypes.guess_type(name)[0]
                 or "application/octet-stream"
             )
-            with open(candidate, "rb") as f:
-                body = f.read()
+            file_size = st.st_size
+            try:
+                byte_range = parse_byte_range(request.headers.get("range"), file_size)
+            except ValueError:
+                return self.HTTP_416_handler(file_size)
+
+            def read_body():
+                with open(candidate, "rb") as f:
+                    if byte_range is None:
+                        return f.read()
+                    f.seek(byte_range[0])
+                    return f.read(byte_range[1] - byte_range[0] + 1)
+
+            if (self.gzip_level and byte_range is None and candidate is not None
+                    and content_type.split(";")[0] in GZIP_TYPES
+                    and file_size <= GZIP_MAX_BYTES and accepts_encoding(request.headers.get("accept-encoding"), "gzip")):
+                def gzip_reserved():
+                    # The file is read and compressed in memory: reserve its size, once per flight.
+                    if not self.memory.acquire(file_size, timeout=self.memory_wait):
+                        return None
+                    try:
+                        return (self.cpu.run(gzip_file, str(candidate), self.gzip_level),
+                                SharedReservation(self.memory, file_size))
+                    except BaseException:
+                        self.memory.release(file_size)
+                        raise
+
+                with self.span("gzip", offload=self.cpu.mode):
+                    compressed = self._coalesced(("gzip", str(candidate), st.st_mtime_ns, file_size), gzip_reserved)
+                if compressed is not None:
+                    body, reservation = compressed
+                    reservation.hold()
+                    return Response(200, {
+                        "Content-Type": content_type,
+                        "Content-Encoding": "gzip",
+                        "Vary": "Accept-Encoding",
+                        "Connection": "close",
+                        "Server": "Crude Server",
+                        "X-Worker-Thread": worker_name,
+                        "X-Handler-Elapsed": f"{time.perf_counter() - start:.3f}s",
+                    }, body, on_close=reservation.release)
+                # No room to compress: send the file as it is (streamed or 503 below if need be).
+                print(f"[MEMORY] no budget to gzip {request_path}; sending it uncompressed")
+
+            length = byte_range[1] - byte_range[0] + 1 if byte_range is not None else file_size
+
+            def read_reserved():
+                # Runs once per flight: the leader reserves the buffer for everyone sharing it.
+                if not self.memory.acquire(length, timeout=self.memory_wait):
+                    return None
+                try:
+                    return read_body(), SharedReservation(self.memory, length)
+                except BaseException:
+                    # No Response will give it back (file gone or unreadable since the stat).
+                    self.memory.release(length)
+                    raise
+
+            on_close = None
+            if self.pack is not None:
+                # A view of the mapping; sent straight from the page cache, never copied,
+                # so it holds no response memory of its own.
+                body = self.pack.read(request_path, *(byte_range or (0, None)))
+            elif (buffered := self._coalesced(("file", str(candidate), st.st_mtime_ns, file_size, byte_range),
+                                              read_reserved)) is not None:
+                # mtime/size in the key keep a rewrite of the file from joining an older read.
+                body, reservation = buffered
+                reservation.hold()
+                on_close = reservation.release
+            elif self.memory.acquire(STREAM_CHUNK, timeout=self.memory_wait):
+                # No room to buffer the whole body: send it in fixed chunks instead.
+                on_close = lambda: self.memory.release(STREAM_CHUNK)
+                try:
+                    self.memory.record("streamed")
+                    print(f"[MEMORY] streaming {length} bytes of {request_path} "
+                          f"({self.memory.current}/{self.memory.limit} bytes in flight)")
+                    body = iter_file(candidate, byte_range[0] if byte_range else 0, length, STREAM_CHUNK)
+                except BaseException:
+                    on_close()
+                    raise
+            else:
+                self.memory.record("rejected")
+                print(f"[MEMORY] 503 for {request_path}: budget exhausted "
+                      f"({self.memory.current}/{self.memory.limit} bytes in flight)")
+                return self.HTTP_503_handler()
 
             extra_headers = {
                 "Content-Type": content_type,
-                "Content-Length": str(len(body)),
+                "Accept-Ranges": "bytes",
                 "Connection": "close",
                 "Server": "Crude Server",
                 "X-Worker-Thread": worker_name,
                 "X-Handler-Elapsed": f"{time.perf_counter() - start:.3f}s",
             }
-            response_line = self.response_line(status_code=200)
-            response_headers = self.response_headers(extra_headers)
-            blank_line = b"\r\n"
-            return b"".join([response_line, response_headers, blank_line, body])
+            if self.gzip_level and content_type.split(";")[0] in GZIP_TYPES:
+                # The same URL is also served gzip-encoded to clients that accept it.
+                extra_headers["Vary"] = "Accept-Encoding"
+            status_code = 200
+            if byte_range is not None:
+                status_code = 206
+                extra_headers["Content-Range"] = f"bytes {byte_range[0]}-{byte_range[1]}/{file_size}"
+            # Head and body are sent as separate pieces (no joined copy of the body), and
+            # the reservation is returned once the last byte has been written.
+            return Response(status_code, extra_headers, body, length=length, on_close=on_close)
 
         return self.HTTP_404_handler()
 
+    def _internal_access_ok(self, request, params) -> bool:
+        """Diagnostics that cost or reveal something: token holders, else local (loopback or Unix socket) clients."""
+        if self.profile_token:
+            return hmac.compare_digest(params.get("token", ""), self.profile_token)
+        return request.client_ip in ("127.0.0.1", "::1") or request.client_ip.startswith("unix:")
+
+    def handle_memory(self, request):
+        """
+        /_memory                      budget usage (current/peak/limit, fallbacks) as JSON
+        /_memory?trace=start[&frames=N] | trace=stop    toggle tracemalloc
+        /_memory?snapshot=1[&limit=15]  top allocation sites, and growth since the last snapshot
+        The tracemalloc actions follow the /_profile access rules.
+        """
+        params = {k: v[0] for k, v in parse_qs(request.uri.partition("?")[2]).items()}
+        if ("trace" in params or "snapshot" in params) and not self._internal_access_ok(request, params):
+            return self.HTTP_403_handler()
+        action = params.get("trace")
+        if action == "start" and not tracemalloc.is_tracing():
+            frames = int(params["frames"]) if params.get("frames", "").isdigit() else 1
+            tracemalloc.start(max(1, frames))
+            print("[MEMORY] tracemalloc started")
+        elif action == "stop" and tracemalloc.is_tracing():
+            tracemalloc.stop()
+            self._last_snapshot = None
+            print("[MEMORY] tracemalloc stopped")
+
+        info = {
+            "budget": self.memory.stats(),
+            "max_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "tracemalloc": {"tracing": tracemalloc.is_tracing()},
+        }
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            info["tracemalloc"].update(current_kib=current // 1024, peak_kib=peak // 1024)
+            if params.get("snapshot") == "1":
+                limit = int(params["limit"]) if params.get("limit", "").isdigit() else 15
+                report, self._last_snapshot = allocation_report(tracemalloc.take_snapshot(), self._last_snapshot, limit)
+                info["tracemalloc"].update(report)
+        body = json.dumps(info, indent=2).encode("utf-8")
+        return Response(200, {"Content-Type": "application/json", "Cache-Control": "no-store",
+                              "Connection": "close"}, body)
+
+    def handle_events(self, request):
+        """
+        /_events  Server-Sent Events: "hello" with the running totals, then a "stats"
+        event every tick with deltas (requests, req/s, rate-limit blocks), the tick's
+        busiest paths and worker utilization. 503 once max_subscribers are watching.
+        """
+        if not self.events.subscribe():
+            return self.HTTP_503_handler(retry_after=5)
+        print(f"[EVENTS] {request.client_ip} subscribed ({self.events.subscribers} watching)")
+        # flush_size=1: every event goes out as soon as it is published.
+        return Response(200, {"Content-Type": "text/event-stream", "Cache-Control": "no-store",
+                              "Connection": "close"},
+                        self.events.stream(stop=lambda: self.draining), flush_size=1,
+                        on_close=self.events.unsubscribe)
+
+    def handle_trace(self, request):
+        """
+        /_trace[?clear=1]  recorded spans as Chrome Trace Event JSON (chrome://tracing,
+        ui.perfetto.dev); clear=1 empties the buffer after exporting it.
+        Follows the /_profile access rules.
+        """
+        params = {k: v[0] for k, v in parse_qs(request.uri.partition("?")[2]).items()}
+        if not self._internal_access_ok(request, params):
+            return self.HTTP_403_handler()
+        body = self.tracer.dumps().encode("utf-8")
+        if params.get("clear") == "1":
+            self.tracer.clear()
+            print(f"[TRACE] buffer exported and cleared (requested by {request.client_ip})")
+        return Response(200, {"Content-Type": "application/json", "Cache-Control": "no-store",
+                              "Content-Disposition": 'attachment; filename="trace.json"',
+                              "Connection": "close"}, body)
+
+    def handle_profile(self, request):
+        """
+        /_profile?seconds=N[&interval_ms=5][&idle=1]  sample all threads for N s (max 60)
+        /_profile?mode=cprofile[&sort=tottime]        per-request cProfile aggregate
+        Plain-text responses; the sampling one is collapsed stacks for flame graphs.
+        """
+        params = {k: v[0] for k, v in parse_qs(request.uri.partition("?")[2]).items()}
+        if not self._internal_access_ok(request, params):
+            return self.HTTP_403_handler()
+
+        if params.get("mode") == "cprofile":
+            if self.request_profiler is None:
+                return self.HTTP_409_handler("Per-request profiling is off (start with --profile-sample-rate).")
+            body = self.request_profiler.report(sort=params.get("sort", "cumulative"))
+            extra = {"X-Profiled-Requests": str(self.request_profiler.profiled)}
+        else:
+            try:
+                seconds = min(60.0, max(0.1, float(params.get("seconds", 5))))
+                interval = min(1.0, max(0.001, float(params.get("interval_ms", 5)) / 1000))
+            except ValueError:
+                return self.HTTP_400_handler()
+            # One sampler at a time: two would double the overhead and see each other.
+            if not self._profile_lock.acquire(blocking=False):
+                return self.HTTP_409_handler("A profile is already being taken.")
+            try:
+                print(f"[PROFILE] sampling for {seconds:g}s every {interval * 1000:g}ms (requested by {request.client_ip})")
+                profiler = SamplingProfiler(interval=interval, include_idle=params.get("idle") == "1").run(seconds)
+            finally:
+                self._profile_lock.release()
+            body = profiler.collapsed()
+            extra = {"X-Profile-Samples": str(profiler.samples), "X-Profile-Seconds": f"{seconds:g}"}
+        extra.update({
+            "Content-Type": "text/plain; charset=utf-8",
+            "Cache-Control": "no-store",
+            "Connection": "close",
+        })
+        return Response(200, extra, body.encode("utf-8"))
+
     def response_line(self, status_code):
         """Returns response line"""
         reason = self.status_codes[status_code]
@@ -0,0 +1,93 @@
+import threading
+from array import array
+from collections.abc import MutableMapping
+
+
+class PathTable(MutableMapping):
+    """
+    Compact exact hit counters keyed by normalized URL path.
+
+    Each path is interned once and given a small integer ID; its counter lives in
+    an array('Q') slot indexed by that ID, so the table holds one string per path
+    and 8 bytes per counter instead of a dict of str -> int objects.
+
+    It behaves like the plain dict it replaces (get / [] / items / update), so
+    `self.hits[key] = previous + 1` keeps working. Hot paths can skip the mapping
+    layer: intern() once, then add() / value() by ID, and counts_for() answers a
+    whole batch of keys in one call.
+
+    Interning is serialized by an internal lock; callers decide how to protect
+    the read-modify-write of a counter (that is what the counter modes are about).
+    """
+
+    def __init__(self, initial_capacity: int = 64):
+        self._ids: dict[str, int] = {}
+        self._paths: list[str] = []
+        self.counts = array("Q", bytes(8 * initial_capacity))
+        self._intern_lock = threading.Lock()
+
+    # --- ID-based fast path ---
+    def intern(self, key: str) -> int:
+        path_id = self._ids.get(key)
+        if path_id is not None:
+            return path_id
+        with self._intern_lock:
+            path_id = self._ids.get(key)
+            if path_id is None:
+                path_id = len(self._paths)
+                if path_id >= len(self.counts):
+                    # Double the buffer; amortized O(1) like list growth.
+                    self.counts.extend(array("Q", bytes(8 * len(self.counts))))
+                self._paths.append(key)
+                self._ids[key] = path_id
+            return path_id
+
+    def id_of(self, key: str) -> int | None:
+        return self._ids.get(key)
+
+    def add(self, path_id: int, delta: int = 1) -> int:
+        value = self.counts[path_id] + delta
+        self.counts[path_id] = value
+        return value
+
+    def value(self, path_id: int) -> int:
+        return self.counts[path_id]
+
+    def counts_for(self, keys) -> list[int]:
+        """Counters for many keys at once (0 for keys never interned)."""
+        ids = self._ids
+        counts = self.counts
+        return [counts[i] if (i := ids.get(key)) is not None else 0 for key in keys]
+
+    @property
+    def memory_bytes(self) -> int:
+        return self.counts.itemsize * len(self.counts)
+
+    # --- MutableMapping interface (drop-in for dict[str, int]) ---
+    def __getitem__(self, key: str) -> int:
+        path_id = self._ids.get(key)
+        if path_id is None:
+            raise KeyError(key)
+        return self.counts[path_id]
+
+    def __setitem__(self, key: str, value: int):
+        self.counts[self.intern(key)] = value
+
+    def __delitem__(self, key: str):
+        raise TypeError("interned paths cannot be removed")
+
+    def __contains__(self, key) -> bool:
+        return key in self._ids
+
+    def __iter__(self):
+        return iter(self._paths[:len(self._ids)])
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def items(self):
+        counts = self.counts
+        return [(path, counts[i]) for i, path in enumerate(self._paths[:len(self._ids)])]
+
+    def values(self):
+        return self.counts[:len(self._ids)].tolist()
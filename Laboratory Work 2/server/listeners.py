@@ -0,0 +1,143 @@
+import os
+import socket
+import stat
+
+# systemd passes activated sockets as consecutive fds starting here (sd_listen_fds(3)).
+SD_LISTEN_FDS_START = 3
+
+
+class ListenSpec:
+    """
+    One listening socket to open: TCP on host:port, or a Unix domain socket at `path`.
+
+    backlog is the accept queue length passed to listen(); rcvbuf/sndbuf set
+    SO_RCVBUF/SO_SNDBUF on the listening socket, which accepted connections
+    inherit (0 keeps the kernel default).
+    """
+
+    def __init__(self, host: str | None = None, port: int | None = None, path: str | None = None,
+                 backlog: int = 128, rcvbuf: int = 0, sndbuf: int = 0):
+        self.host = host
+        self.port = port
+        self.path = path
+        self.backlog = backlog
+        self.rcvbuf = rcvbuf
+        self.sndbuf = sndbuf
+
+    @property
+    def label(self) -> str:
+        if self.path is not None:
+            return f"unix:{self.path}"
+        return f"[{self.host}]:{self.port}" if ":" in self.host else f"{self.host}:{self.port}"
+
+    def describe(self) -> str:
+        options = [f"backlog {self.backlog}"]
+        if self.rcvbuf:
+            options.append(f"rcvbuf {self.rcvbuf}")
+        if self.sndbuf:
+            options.append(f"sndbuf {self.sndbuf}")
+        return f"{self.label} ({', '.join(options)})"
+
+
+def parse_listen(text: str, backlog: int = 128, rcvbuf: int = 0, sndbuf: int = 0) -> ListenSpec:
+    """
+    'HOST:PORT', '[::1]:PORT' or 'unix:PATH', optionally followed by
+    ',backlog=N', ',rcvbuf=BYTES', ',sndbuf=BYTES' (defaults from the arguments).
+    """
+    address, *options = text.split(",")
+    settings = {"backlog": backlog, "rcvbuf": rcvbuf, "sndbuf": sndbuf}
+    for option in options:
+        key, sep, value = option.partition("=")
+        key = key.strip()
+        if not sep or key not in settings or not value.strip().isdigit():
+            raise ValueError(f"bad listener option {option!r} in {text!r} (backlog=, rcvbuf=, sndbuf=)")
+        settings[key] = int(value)
+    if address.startswith("unix:"):
+        if not address[5:]:
+            raise ValueError(f"missing socket path in {text!r}")
+        return ListenSpec(path=address[5:], **settings)
+    host, sep, port = address.rpartition(":")
+    if not sep or not port.isdigit():
+        raise ValueError(f"expected HOST:PORT or unix:PATH, got {address!r}")
+    return ListenSpec(host=host.strip("[]") or "0.0.0.0", port=int(port), **settings)
+
+
+def open_listener(spec: ListenSpec, reuse_port: bool = False) -> socket.socket:
+    if spec.path is not None:
+        _remove_stale_socket(spec.path)
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    else:
+        family = socket.AF_INET6 if ":" in spec.host else socket.AF_INET
+        s = socket.socket(family, socket.SOCK_STREAM)
+        # allow the socket to reuse the same address immediately after the program closed
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    # Buffer sizes must be set before listen() so accepted sockets start with them
+    # (and, for TCP, so the window scale offered in the handshake matches).
+    if spec.rcvbuf:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, spec.rcvbuf)
+    if spec.sndbuf:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, spec.sndbuf)
+    try:
+        s.bind(spec.path if spec.path is not None else (spec.host, spec.port))
+        s.listen(spec.backlog)
+    except OSError:
+        s.close()
+        raise
+    return s
+
+
+def _remove_stale_socket(path: str):
+    """Unlink a socket file left by a server that is gone; refuse if one still answers on it."""
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise OSError(f"{path} exists and is not a socket")
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except ConnectionRefusedError:
+        os.unlink(path)
+        return
+    finally:
+        probe.close()
+    raise OSError(f"{path} is in use by a running server (use --handoff-socket to replace it)")
+
+
+def remove_socket_files(paths):
+    for path in paths:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+def systemd_sockets() -> list[socket.socket]:
+    """
+    Listening sockets passed by systemd socket activation (LISTEN_PID/LISTEN_FDS).
+
+    The variables are removed afterwards so processes started from this one do
+    not take the sockets for theirs, and the fds are made non-inheritable.
+    """
+    pid = os.environ.pop("LISTEN_PID", None)
+    count = os.environ.pop("LISTEN_FDS", None)
+    os.environ.pop("LISTEN_FDNAMES", None)
+    if pid != str(os.getpid()) or not count:
+        return []
+    sockets = []
+    for fd in range(SD_LISTEN_FDS_START, SD_LISTEN_FDS_START + int(count)):
+        os.set_inheritable(fd, False)
+        sockets.append(socket.socket(fileno=fd))
+    return sockets
+
+
+def socket_label(s: socket.socket) -> str:
+    name = s.getsockname()
+    if s.family == socket.AF_UNIX:
+        return f"unix:{name}"
+    if s.family == socket.AF_INET6:
+        return f"[{name[0]}]:{name[1]}"
+    return f"{name[0]}:{name[1]}"
@@ -1,17 +1,173 @@
+import json
+import os
+import threading
+from collections import OrderedDict
 from pathlib import Path
 from html import escape
 from datetime import datetime
-from urllib.parse import quote, unquote
+from urllib.parse import quote, unquote, parse_qs, urlencode
 
 
-def directory_to_links(dir_path, request_path, get_hits=None):
+SORT_KEYS = ("name", "mtime", "size")
+LISTING_FORMATS = {
+    "html": "text/html; charset=utf-8",
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+}
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+
+def parse_listing_query(query):
+    """'page=2&limit=100&sort=mtime&order=desc' -> listing options, clamped to sane values."""
+    params = parse_qs(query or "")
+
+    def first_int(name, default):
+        try:
+            return int(params.get(name, [default])[0])
+        except ValueError:
+            return default
+
+    sort = params.get("sort", ["name"])[0]
+    return {
+        "page": max(1, first_int("page", 1)),
+        "limit": min(MAX_PAGE_SIZE, max(1, first_int("limit", DEFAULT_PAGE_SIZE))),
+        "sort": sort if sort in SORT_KEYS else "name",
+        "descending": params.get("order", ["asc"])[0] == "desc",
+    }
+
+
+def listing_format(query, accept=None):
+    """
+    Representation for a listing: ?format=html|json|ndjson wins, otherwise the
+    Accept header's highest-q supported type, otherwise HTML (so browsers, which
+    accept */*, keep getting the styled page).
+    """
+    requested = parse_qs(query or "").get("format", [""])[0]
+    if requested in LISTING_FORMATS:
+        return requested
+    best, best_q = "html", 0.0
+    for item in (accept or "").split(","):
+        media, *params = [part.strip() for part in item.split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        for name, content_type in LISTING_FORMATS.items():
+            if media == content_type.split(";")[0] and q > best_q:
+                best, best_q = name, q
+    return best
+
+
+def _entry_is_dir(entry):
+    try:
+        return entry.is_dir()
+    except OSError:
+        return False
+
+
+def scan_directory(dir_path):
+    """
+    The disk side of a listing: [(name, is_dir)] sorted directories first, then by
+    name. os.scandir reports the entry type from the directory itself (d_type), so
+    this is one pass over the directory with no per-entry stat(); modification
+    times are looked up later, only for the rows actually rendered.
+    """
+    with os.scandir(dir_path) as it:
+        entries = [(entry.name, _entry_is_dir(entry)) for entry in it]
+    entries.sort(key=lambda e: (not e[1], e[0].lower()))
+    return entries
+
+
+# Scans keyed by directory path, reused while the directory's own mtime (which
+# changes whenever an entry is added, removed or renamed) stays the same.
+_scan_cache: OrderedDict = OrderedDict()
+_scan_cache_lock = threading.Lock()
+_SCAN_CACHE_SIZE = 64
+
+
+def cached_scan(dir_path):
+    """scan_directory(dir_path), reusing the previous scan if the directory is unchanged."""
+    key = str(dir_path)
+    mtime = os.stat(dir_path).st_mtime_ns
+    with _scan_cache_lock:
+        cached = _scan_cache.get(key)
+        if cached is not None and cached[0] == mtime:
+            _scan_cache.move_to_end(key)
+            return cached[1]
+    entries = scan_directory(dir_path)
+    with _scan_cache_lock:
+        _scan_cache[key] = (mtime, entries)
+        _scan_cache.move_to_end(key)
+        while len(_scan_cache) > _SCAN_CACHE_SIZE:
+            _scan_cache.popitem(last=False)
+    return entries
+
+
+def _stat(dir_path, name):
+    try:
+        return os.stat(os.path.join(dir_path, name))
+    except OSError:
+        return None
+
+
+def _modified(st):
+    return datetime.fromtimestamp(st.st_mtime).strftime("%Y-%m-%d %H:%M") if st is not None else ""
+
+
+def sort_entries(dir_path, entries, sort="name", descending=False, stat=None):
+    """
+    Order a scan for display; mtime/size orders stat every entry, name order stats
+    none. stat(name), if given, replaces os.stat of dir_path/name (e.g. a content pack).
+    """
+    if sort == "name":
+        if not descending:
+            return entries
+        ordered = entries[::-1]
+    else:
+        index = 8 if sort == "mtime" else 6  # os.stat_result: st_mtime, st_size
+        keyed = []
+        for name, is_dir in entries:
+            st = stat(name) if stat is not None else _stat(dir_path, name)
+            keyed.append((st[index] if st is not None else 0, name.lower(), name, is_dir))
+        keyed.sort(reverse=descending)
+        ordered = [(name, is_dir) for _, _, name, is_dir in keyed]
+    # Directories stay first whichever way the rest is ordered (the sort is stable).
+    return sorted(ordered, key=lambda e: not e[1])
+
+
+def directory_to_links(dir_path, request_path, get_hits=None, get_hits_batch=None, **options):
+    """The whole listing as one bytes object (see iter_directory_links)."""
+    return b"".join(iter_directory_links(dir_path, request_path, get_hits=get_hits,
+                                         get_hits_batch=get_hits_batch, **options))
+
+
+def iter_directory_links(dir_path, request_path, get_hits=None, get_hits_batch=None,
+                         entries=None, batch_rows=256, page=1, limit=None, sort="name",
+                         descending=False, stat=None):
     """
     A styled HTML directory listing for dir_path.
     request_path is the URL path (e.g., "/books/") used for link prefixes.
     get_hits is an optional callable that accepts an href (string) and returns
     an integer number of requests recorded for that path. When provided, the
     listing renders a "Hits" column.
+    get_hits_batch, if given, takes a list of hrefs and returns their counts in
+    the same order; the listing then looks up `batch_rows` rows per call.
+    entries is a scan_directory() result, or a callable returning one, to render
+    instead of scanning dir_path. page/limit select one page of rows (limit=None
+    shows them all) and sort/descending order them (see sort_entries, which also
+    describes `stat`).
+    Yields the HTML as UTF-8 chunks: the page head first (before the directory is
+    scanned), then the table rows in batches, then the page links, so the
+    response can be streamed while the rows are still produced.
     """
+    if get_hits_batch is None and get_hits is not None:
+        get_hits_batch = lambda hrefs: [get_hits(h) for h in hrefs]
+    show_hits = get_hits_batch is not None
+
     title = f"Directory listing for {escape(unquote(request_path))}"
 
     crumbs = [('<a href="/">/</a>', "/")]
@@ -27,51 +183,21 @@ def directory_to_links(dir_path, request_path, get_hits=None):
             crumbs[-1] = (escape(parts[-1]), crumbs[-1][1])
     breadcrumb_html = " / ".join(label for label, _ in crumbs)
     
+    req = request_path or "/"
+    req = req if req.endswith("/") else req + "/"
+    current_href = quote(req, safe='/')
+
+    base_decoded = unquote(request_path if request_path else "/")
+    base_decoded = base_decoded if base_decoded.endswith("/") else base_decoded + "/"
+
     current_hits_html = ""
-    if get_hits:
-        req = request_path or "/"
-        req = req if req.endswith("/") else req + "/"
+    if show_hits:
         current_hits_html = (
             f"<div style='font-size:12px;margin:6px 0 10px 2px'>"
-            f"This directory hits: {get_hits(quote(req, safe='/'))}"
+            f"This directory hits: {get_hits_batch([current_href])[0]}"
             f"</div>"
         )
 
-    rows = []
-    
-    if request_path != "/":
-        base_decoded = unquote(request_path if request_path else "/")
-        base_decoded = base_decoded if base_decoded.endswith("/") else base_decoded + "/"
-        parent_decoded = base_decoded.rstrip("/").rsplit("/", 1)[0]
-        if parent_decoded == "":
-            parent_decoded = "/"
-        parent_href = quote(parent_decoded if parent_decoded.endswith("/") else parent_decoded + "/", safe="/")
-        rows.append({
-            "name": "..",
-            "href": parent_href,
-            "modified": "",
-            "is_dir": True,
-            "hits": "",  
-        })
-
-    for entry in sorted(dir_path.iterdir(), key=lambda p: (not p.is_dir(), p.name.lower())):
-        name = entry.name + ("/" if entry.is_dir() else "")
-        base_decoded = unquote(request_path if request_path else "/")
-        base_decoded = base_decoded if base_decoded.endswith("/") else base_decoded + "/"
-        href = quote(base_decoded + name, safe="/")
-        try:
-            stat = entry.stat()
-            modified = datetime.fromtimestamp(stat.st_mtime).strftime("%Y-%m-%d %H:%M")
-        except Exception:
-            modified = ""
-        rows.append({
-            "name": name,
-            "href": href,
-            "modified": modified,
-            "is_dir": entry.is_dir(),
-            "hits": (get_hits(href) if get_hits else 0),
-        })
-
     lines = [
         "<!doctype html>",
         "<html><head>",
@@ -100,6 +226,7 @@ def directory_to_links(dir_path, request_path, get_hits=None):
         ".name{display:flex;gap:10px;align-items:center;}\n"
         ".badge{display:inline-block;padding:2px 6px;border:2px solid #1a1333;background:#fde68a;"
         "border-radius:4px;font-size:10px;}\n"
+        ".pager{font-size:10px;margin-top:12px;color:#374151}\n"
         "</style>",
         "</head><body>",
         f"<div class=\"wrap\">",
@@ -107,32 +234,149 @@ def directory_to_links(dir_path, request_path, get_hits=None):
         f"<div class=\"crumbs\">{breadcrumb_html}</div>",
         current_hits_html,
         "<table>",
-        ("<thead><tr><th>Name</th><th>Last Modified</th><th>Hits</th></tr></thead>" if get_hits else "<thead><tr><th>Name</th><th>Last Modified</th></tr></thead>"),
+        ("<thead><tr><th>Name</th><th>Last Modified</th><th>Hits</th></tr></thead>" if show_hits else "<thead><tr><th>Name</th><th>Last Modified</th></tr></thead>"),
         "<tbody>",
     ]
 
-    for r in rows:
-        icon = "📁" if r["is_dir"] else "📄"
-        name_html = f"{icon} <a href=\"{escape(r['href'])}\">{escape(r['name'])}</a>"
-        if r["is_dir"]:
-            name_html += " <span class=\"badge\">DIR</span>"
-
-        if get_hits:
-            lines.append(
-                "<tr>"
-                f"<td class=\"name\">{name_html}</td>"
-                f"<td>{escape(r['modified'])}</td>"
-                f"<td>{escape(str(r['hits']))}</td>"
-                "</tr>"
-            )
+    yield "\n".join(lines).encode("utf-8")
+
+    if request_path != "/":
+        parent_decoded = base_decoded.rstrip("/").rsplit("/", 1)[0]
+        if parent_decoded == "":
+            parent_decoded = "/"
+        parent_href = quote(parent_decoded if parent_decoded.endswith("/") else parent_decoded + "/", safe="/")
+        yield ("\n" + _render_row("..", parent_href, "", True, "", show_hits)).encode("utf-8")
+
+    total, shown = _select_page(dir_path, entries, page, limit, sort, descending, stat)
+    for batch in _iter_rows(dir_path, shown, base_decoded, get_hits_batch, batch_rows, stat):
+        rows = [
+            _render_row(name + ("/" if is_dir else ""), href, _modified(st), is_dir, count, show_hits)
+            for name, is_dir, href, st, count in batch
+        ]
+        yield ("\n" + "\n".join(rows)).encode("utf-8")
+
+    footer = ["", "</tbody></table>"]
+    if limit and total > limit:
+        footer.append(_render_pager(current_href, page, limit, total, sort, descending))
+    footer += ["</div>", "</body></html>"]
+    yield "\n".join(footer).encode("utf-8")
+
+
+def iter_directory_json(dir_path, request_path, get_hits_batch=None, entries=None, batch_rows=256,
+                        page=1, limit=None, sort="name", descending=False, ndjson=False, stat=None):
+    """
+    The same listing as iter_directory_links, as compact JSON for scripts:
+
+        {"path": "/books/", "hits": 12, "page": 1, "limit": 500, "total": 2,
+         "sort": "name", "order": "asc", "entries": [
+           {"name": "a/", "href": "/books/a/", "type": "dir", "size": null, "mtime": 1761382440, "hits": 3}, ...]}
+
+    With ndjson=True the first line is that object without "entries" and every
+    entry follows on its own line. Either way entries are streamed in batches.
+    """
+    dumps = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False).encode
+    req = request_path or "/"
+    req = req if req.endswith("/") else req + "/"
+    current_href = quote(req, safe="/")
+    base_decoded = unquote(req)
+
+    total, shown = _select_page(dir_path, entries, page, limit, sort, descending, stat)
+    meta = {
+        "path": base_decoded,
+        "hits": get_hits_batch([current_href])[0] if get_hits_batch is not None else None,
+        "page": page,
+        "limit": limit,
+        "total": total,
+        "sort": sort,
+        "order": "desc" if descending else "asc",
+    }
+    if ndjson:
+        yield (dumps(meta) + "\n").encode("utf-8")
+    else:
+        yield (dumps(meta)[:-1] + ',"entries":[').encode("utf-8")
+
+    separator = ""
+    for batch in _iter_rows(dir_path, shown, base_decoded, get_hits_batch, batch_rows, stat):
+        items = [
+            dumps({
+                "name": name + ("/" if is_dir else ""),
+                "href": href,
+                "type": "dir" if is_dir else "file",
+                "size": None if is_dir or st is None else st.st_size,
+                "mtime": int(st.st_mtime) if st is not None else None,
+                "hits": count if get_hits_batch is not None else None,
+            })
+            for name, is_dir, href, st, count in batch
+        ]
+        if ndjson:
+            yield ("\n".join(items) + "\n").encode("utf-8")
         else:
-            lines.append(
-                "<tr>"
-                f"<td class=\"name\">{name_html}</td>"
-                f"<td>{escape(r['modified'])}</td>"
-                "</tr>"
-            )
-
-    lines += ["</tbody></table>", "</div>", "</body></html>"]
-    html = "\n".join(lines).encode("utf-8")
-    return html
\ No newline at end of file
+            yield (separator + ",".join(items)).encode("utf-8")
+            separator = ","
+    if not ndjson:
+        yield b"]}"
+
+
+def _select_page(dir_path, entries, page, limit, sort, descending, stat=None):
+    """(total entries, the slice of them on `page`) after sorting."""
+    if entries is None:
+        entries = scan_directory(dir_path)
+    elif callable(entries):
+        entries = entries()
+    entries = sort_entries(dir_path, entries, sort, descending, stat)
+    first = (page - 1) * limit if limit else 0
+    return len(entries), (entries[first:first + limit] if limit else entries)
+
+
+def _iter_rows(dir_path, shown, base_decoded, get_hits_batch, batch_rows, stat=None):
+    """Batches of (name, is_dir, href, stat or None, hits) for the rows being rendered."""
+    for offset in range(0, len(shown), batch_rows):
+        batch = shown[offset:offset + batch_rows]
+        hrefs = [quote(base_decoded + name + ("/" if is_dir else ""), safe="/") for name, is_dir in batch]
+        counts = get_hits_batch(hrefs) if get_hits_batch is not None else [0] * len(batch)
+        yield [
+            (name, is_dir, href, stat(name) if stat is not None else _stat(dir_path, name), count)
+            for (name, is_dir), href, count in zip(batch, hrefs, counts)
+        ]
+
+
+def _render_pager(current_href, page, limit, total, sort, descending):
+    # An empty directory still has one (empty) page.
+    pages = max(1, (total + limit - 1) // limit)
+
+    def link(target, label):
+        params = {"page": max(1, min(target, pages)), "limit": limit}
+        if sort != "name" or descending:
+            params.update(sort=sort, order="desc" if descending else "asc")
+        return f"<a href=\"{escape(current_href + '?' + urlencode(params))}\">{label}</a>"
+
+    first = (page - 1) * limit + 1
+    last = min(total, page * limit)
+    parts = [f"Entries {first}-{last} of {total}" if first <= total else f"Page {page} is empty ({total} entries)"]
+    if page > 1:
+        parts.append(link(page - 1, "&laquo; prev"))
+    parts.append(f"page {page} / {pages}")
+    if page < pages:
+        parts.append(link(page + 1, "next &raquo;"))
+    return f"<div class=\"pager\">{' &middot; '.join(parts)}</div>"
+
+
+def _render_row(name, href, modified, is_dir, hits, show_hits):
+    icon = "📁" if is_dir else "📄"
+    name_html = f"{icon} <a href=\"{escape(href)}\">{escape(name)}</a>"
+    if is_dir:
+        name_html += " <span class=\"badge\">DIR</span>"
+    if show_hits:
+        return (
+            "<tr>"
+            f"<td class=\"name\">{name_html}</td>"
+            f"<td>{escape(modified)}</td>"
+            f"<td>{escape(str(hits))}</td>"
+            "</tr>"
+        )
+    return (
+        "<tr>"
+        f"<td class=\"name\">{name_html}</td>"
+        f"<td>{escape(modified)}</td>"
+        "</tr>"
+    )
@@ -0,0 +1,138 @@
+import threading
+import time
+import tracemalloc
+
+
+class MemoryBudget:
+    """
+    Global budget for response bytes held in memory at once.
+
+    A response reserves its buffered size before reading a file and gives it back
+    once it has been sent. When the budget is full, acquire() waits up to
+    `timeout` for other responses to finish (queueing) and then reports failure,
+    so the caller can fall back to streaming in small chunks or reject with 503.
+    A limit of 0 means unlimited: usage and peak are still tracked.
+    """
+
+    def __init__(self, limit: int = 0):
+        self.limit = limit
+        self.current = 0
+        self.peak = 0
+        self.waited = 0
+        self.streamed = 0
+        self.rejected = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, size: int, timeout: float = 0.0) -> bool:
+        with self._cond:
+            if self.limit and size > self.limit:
+                return False
+            if self.limit and self.current + size > self.limit:
+                self.waited += 1
+                deadline = time.monotonic() + timeout
+                while self.current + size > self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+            self.current += size
+            self.peak = max(self.peak, self.current)
+            return True
+
+    def charge(self, size: int):
+        """Count bytes that are already in memory, without waiting (may exceed the limit)."""
+        with self._cond:
+            self.current += size
+            self.peak = max(self.peak, self.current)
+
+    def release(self, size: int):
+        with self._cond:
+            self.current -= size
+            self._cond.notify_all()
+
+    def record(self, outcome: str):
+        """Count a fallback: 'streamed' or 'rejected'."""
+        with self._cond:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "limit": self.limit,
+                "current": self.current,
+                "peak": self.peak,
+                "waited": self.waited,
+                "streamed": self.streamed,
+                "rejected": self.rejected,
+            }
+
+
+class SharedReservation:
+    """
+    One budget reservation for a buffer that several responses send (a coalesced
+    read), so N requests sharing one buffer count its size once. Each response
+    hold()s it and release()s it once sent; the bytes go back to the budget when
+    the last holder is done. A hold after that (a waiter that woke up late) charges
+    them again, since the buffer is still in memory.
+    """
+
+    def __init__(self, budget: MemoryBudget, size: int):
+        # Created by the reader right after budget.acquire(size) succeeded.
+        self.budget = budget
+        self.size = size
+        self.holders = 0
+        self._charged = True
+        self._lock = threading.Lock()
+
+    def hold(self):
+        with self._lock:
+            if not self._charged:
+                self.budget.charge(self.size)
+                self._charged = True
+            self.holders += 1
+
+    def release(self):
+        with self._lock:
+            self.holders -= 1
+            if self.holders == 0 and self._charged:
+                self._charged = False
+                self.budget.release(self.size)
+
+
+def iter_file(path, start: int, length: int, chunk_size: int = 64 * 1024):
+    """Yield `length` bytes of a file from `start` in chunk_size reads."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            data = f.read(min(chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+
+def allocation_report(snapshot, previous=None, limit: int = 15) -> tuple[dict, object]:
+    """
+    Top allocation sites of a tracemalloc snapshot, plus growth since `previous`.
+    Returns (report, filtered snapshot); keep the latter as the next `previous`.
+    """
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap>")]
+    snapshot = snapshot.filter_traces(ignore)
+
+    def where(stat):
+        frame = stat.traceback[0]
+        return f"{frame.filename}:{frame.lineno}"
+
+    report = {
+        "top": [
+            {"where": where(stat), "size_kib": round(stat.size / 1024, 1), "count": stat.count}
+            for stat in snapshot.statistics("lineno")[:limit]
+        ],
+    }
+    if previous is not None:
+        report["growth"] = [
+            {"where": where(stat), "size_diff_kib": round(stat.size_diff / 1024, 1), "count_diff": stat.count_diff}
+            for stat in snapshot.compare_to(previous, "lineno")[:limit]
+        ]
+    return report, snapshot
@@ -0,0 +1,151 @@
+import argparse
+import json
+import mmap
+import os
+import stat
+import struct
+import time
+
+from .pathing import normalize_url_path
+
+# Header: magic, index offset, index length. Blobs start on page boundaries so a
+# slice of the mapping is a page-aligned, directly sendable view of one file.
+MAGIC = b"HTTPLAB-PACK\x00\x00\x00\x01"
+HEADER = struct.Struct("<16sQQ")
+ALIGN = 4096
+
+
+def _key(url_path: str) -> str:
+    """Index key for a URL: decoded path without query or trailing slash ('/' for the root)."""
+    return normalize_url_path(url_path).rstrip("/") or "/"
+
+
+def build_pack(root, out_path) -> dict:
+    """
+    Bundle every file under `root` into one pack at `out_path`:
+
+        [header][file blobs, each padded to 4 KiB][JSON index]
+
+    The index maps URL paths to (offset, size, mtime) for files and to
+    (mtime, sorted (name, is_dir) entries) for directories, the entries in the
+    same shape as listing.scan_directory. Written to a temp file and renamed
+    into place, so a running server never maps a half-built pack.
+    """
+    root = os.path.abspath(root)
+    files: dict[str, list] = {}
+    dirs: dict[str, list] = {}
+    tmp_path = f"{out_path}.tmp"
+    with open(tmp_path, "wb") as out:
+        out.write(b"\0" * HEADER.size)
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            rel = os.path.relpath(dirpath, root)
+            dir_key = "/" if rel == "." else "/" + rel.replace(os.sep, "/")
+            # os.walk does not descend into symlinked directories; leave them out of the
+            # listing too, like files that are not packed below, so no entry links to a 404.
+            dirnames[:] = [name for name in dirnames if not os.path.islink(os.path.join(dirpath, name))]
+            packed = []
+            for name in sorted(filenames):
+                src = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(src)
+                except OSError:
+                    continue
+                if not stat.S_ISREG(st.st_mode):
+                    continue
+                out.write(b"\0" * (-out.tell() % ALIGN))
+                offset = out.tell()
+                with open(src, "rb") as f:
+                    size = 0
+                    while chunk := f.read(1 << 20):
+                        out.write(chunk)
+                        size += len(chunk)
+                files[dir_key.rstrip("/") + "/" + name] = [offset, size, int(st.st_mtime)]
+                packed.append(name)
+            entries = [(name, True) for name in dirnames] + [(name, False) for name in packed]
+            entries.sort(key=lambda e: (not e[1], e[0].lower()))
+            dirs[dir_key] = [int(os.stat(dirpath).st_mtime), [[name, is_dir] for name, is_dir in entries]]
+        index = json.dumps({"root": root, "built": int(time.time()), "files": files, "dirs": dirs},
+                           separators=(",", ":")).encode("utf-8")
+        index_offset = out.tell()
+        out.write(index)
+        out.seek(0)
+        out.write(HEADER.pack(MAGIC, index_offset, len(index)))
+    os.replace(tmp_path, out_path)
+    return {"files": len(files), "dirs": len(dirs), "bytes": os.path.getsize(out_path)}
+
+
+class ContentPack:
+    """
+    Read side of a pack: the file is mapped once and every response body is a
+    memoryview slice of that mapping, so serving needs no open()/stat()/read()
+    per request and no copy into a per-request buffer. Lookups go through the
+    in-memory index only; a path that is not in it does not exist, which also
+    rules out traversal outside the packed tree.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, index_offset, index_length = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a content pack")
+        index = json.loads(self._map[index_offset:index_offset + index_length])
+        self.root = index["root"]
+        self.built = index["built"]
+        self.files: dict[str, tuple] = {k: tuple(v) for k, v in index["files"].items()}
+        self.dirs: dict[str, tuple] = {k: (mtime, [tuple(e) for e in entries])
+                                       for k, (mtime, entries) in index["dirs"].items()}
+        self.size = len(self._map)
+        self._view = memoryview(self._map)
+
+    def stat(self, url_path):
+        """os.stat_result-alike for a URL (only mode, size and mtime are set), or None."""
+        key = _key(url_path)
+        entry = self.files.get(key)
+        if entry is not None:
+            return os.stat_result((stat.S_IFREG | 0o444, 0, 0, 1, 0, 0, entry[1], entry[2], entry[2], entry[2]))
+        entry = self.dirs.get(key)
+        if entry is not None:
+            return os.stat_result((stat.S_IFDIR | 0o555, 0, 0, 1, 0, 0, 0, entry[0], entry[0], entry[0]))
+        return None
+
+    def child_stat(self, url_path, name):
+        base = _key(url_path).rstrip("/")
+        return self.stat(f"{base}/{name}")
+
+    def read(self, url_path, start=0, end=None) -> memoryview:
+        """Bytes start..end (inclusive) of a packed file as a view of the mapping."""
+        offset, size, _ = self.files[_key(url_path)]
+        end = size - 1 if end is None else end
+        return self._view[offset + start:offset + end + 1]
+
+    def listing(self, url_path):
+        """Sorted (name, is_dir) entries of a packed directory, or None."""
+        entry = self.dirs.get(_key(url_path))
+        return entry[1] if entry is not None else None
+
+    def close(self):
+        try:
+            self._view.release()
+            self._map.close()
+        except BufferError:
+            # A response still holds a slice; the mapping goes away with the process.
+            pass
+        self._file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a content pack for the lab server (--pack)")
+    parser.add_argument("--root", default="./content", help="Directory tree to pack")
+    parser.add_argument("--out", default="content.pack", help="Pack file to write")
+    args = parser.parse_args()
+    started = time.perf_counter()
+    info = build_pack(args.root, args.out)
+    print(f"Packed {info['files']} files in {info['dirs']} directories from {os.path.abspath(args.root)}")
+    print(f"Wrote {args.out}: {info['bytes'] / (1 << 20):.1f} MiB in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+from functools import lru_cache
 from pathlib import Path
 from urllib.parse import unquote
 
@@ -28,3 +29,14 @@ def resolve_safe(uri):
       return None
 
   return candidate
+
+
+@lru_cache(maxsize=8192)
+def normalize_url_path(url_path):
+  """Counter key for a URL: query/fragment stripped, percent-decoded, leading '/'.
+  Cached (bounded) because the same few hrefs are normalized on every request."""
+  part = url_path.split('?', 1)[0].split('#', 1)[0]
+  part = unquote(part)
+  if not part.startswith('/'):
+      part = '/' + part
+  return part
@@ -0,0 +1,195 @@
+import json
+import os
+import threading
+from collections import defaultdict
+
+
+class HitStore:
+    """
+    Write-behind persistence for per-path hit counters.
+
+    The request path only calls record(), which bumps an in-memory delta under a
+    short lock. A background flusher appends the buffered deltas to an append-only
+    log (one JSON line per path) every `flush_interval` seconds, or sooner once
+    `flush_threshold` increments are pending. When the log grows past
+    `compact_bytes` it is folded into a snapshot file and reset, so a reload
+    at startup reads one compact snapshot plus a short tail of deltas.
+    """
+
+    def __init__(self, path, flush_interval: float = 5.0, flush_threshold: int = 1000,
+                 compact_bytes: int = 1 << 20):
+        self.log_path = str(path)
+        self.snapshot_path = self.log_path + ".snapshot"
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.compact_bytes = compact_bytes
+
+        self._pending: defaultdict[str, int] = defaultdict(int)
+        self._pending_count = 0
+        self._pending_lock = threading.Lock()
+        # Serializes flush/compaction between the flusher thread and close().
+        self._io_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        # Cleared by hold(): the flusher keeps buffering but writes nothing until release().
+        self._released = threading.Event()
+        self._released.set()
+        self._thread: threading.Thread | None = None
+
+        # Epoch tag of the current log file (None until one has been written).
+        self._epoch: str | None = None
+
+        self.flushes = 0
+        self.compactions = 0
+
+        directory = os.path.dirname(os.path.abspath(self.log_path))
+        os.makedirs(directory, exist_ok=True)
+
+    # --- Startup ---
+    def _read(self, path):
+        """Return (header, entries) for one file; header is the leading JSON object, if any."""
+        header: dict = {}
+        entries: list[tuple[str, int]] = []
+        try:
+            f = open(path, "r", encoding="utf-8")
+        except FileNotFoundError:
+            return header, entries
+        with f:
+            for line in f:
+                try:
+                    item = json.loads(line)
+                    if isinstance(item, dict):
+                        header = item
+                        continue
+                    key, count = item
+                    entries.append((key, int(count)))
+                except (ValueError, TypeError):
+                    # A torn final line from a crash mid-append; skip it.
+                    continue
+        return header, entries
+
+    def load(self) -> dict[str, int]:
+        """Return persisted totals: the snapshot plus every delta in the log."""
+        totals: dict[str, int] = {}
+        snap_header, snap_entries = self._read(self.snapshot_path)
+        log_header, log_entries = self._read(self.log_path)
+        # A log whose epoch the snapshot already folded in is left over from a
+        # compaction interrupted before the log was reset; counting it again
+        # would double every delta in it.
+        if log_header.get("epoch") and log_header.get("epoch") == snap_header.get("folded"):
+            log_entries = []
+        for key, count in snap_entries + log_entries:
+            totals[key] = totals.get(key, 0) + count
+        self._epoch = log_header.get("epoch") if log_entries else None
+        return totals
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="HitStore-flusher", daemon=True)
+        self._thread.start()
+
+    # --- Request path (memory only) ---
+    def record(self, key: str, delta: int = 1):
+        with self._pending_lock:
+            self._pending[key] += delta
+            self._pending_count += delta
+            full = self._pending_count >= self.flush_threshold
+        if full:
+            self._wake.set()
+
+    # --- Background flushing ---
+    def hold(self):
+        """Buffer without writing, e.g. while a previous process still owns the files (hot restart)."""
+        self._released.clear()
+
+    def release(self):
+        self._released.set()
+        self._wake.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if not self._released.is_set():
+                continue
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"[HITSTORE] flush failed: {e}")
+
+    def flush(self):
+        with self._pending_lock:
+            if not self._pending:
+                return
+            batch = self._pending
+            self._pending = defaultdict(int)
+            self._pending_count = 0
+
+        with self._io_lock:
+            try:
+                if self._epoch is None:
+                    self._new_log()
+                self._append("".join(json.dumps([key, count]) + "\n" for key, count in batch.items()).encode("utf-8"))
+            except OSError:
+                # A full or failing disk delays these hits; the next flush retries them.
+                with self._pending_lock:
+                    for key, count in batch.items():
+                        self._pending[key] += count
+                        self._pending_count += count
+                raise
+            self.flushes += 1
+            if os.path.getsize(self.log_path) >= self.compact_bytes:
+                self._compact()
+
+    def _append(self, data: bytes):
+        """Append to the log durably, or leave it as it was (no half batch counted on retry)."""
+        fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            start = os.lseek(fd, 0, os.SEEK_END)
+            try:
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(fd, view):]
+                os.fsync(fd)
+            except OSError:
+                try:
+                    os.ftruncate(fd, start)
+                except OSError:
+                    pass
+                raise
+        finally:
+            os.close(fd)
+
+    def _new_log(self):
+        """Atomically replace the log with an empty one tagged with a fresh epoch."""
+        self._epoch = os.urandom(8).hex()
+        tmp_path = self.log_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"epoch": self._epoch}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.log_path)
+
+    def _compact(self):
+        """Fold the log into a fresh snapshot, then reset the log (caller holds _io_lock)."""
+        totals = self.load()
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"folded": self._epoch}) + "\n")
+            for key, count in totals.items():
+                f.write(json.dumps([key, count]) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        self._new_log()
+        self.compactions += 1
+
+    def close(self):
+        """Stop the flusher and persist whatever is still buffered."""
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 1)
+        self.flush()
+        with self._io_lock:
+            if os.path.exists(self.log_path) and os.path.getsize(self.log_path) > 0:
+                self._compact()
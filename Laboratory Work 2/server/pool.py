@@ -0,0 +1,172 @@
+import threading
+import time
+from collections import deque
+
+
+class AdaptivePool:
+    """
+    Thread pool that resizes itself between min_workers and max_workers.
+
+    Grow: when a task is submitted or the monitor ticks, a worker is added if the
+    oldest queued task has waited longer than `grow_wait` seconds, or if demand
+    ((busy + queued) / size) has reached `grow_utilization`.
+
+    Shrink: a worker that has found no work for `idle_timeout` seconds retires,
+    but only while utilization is below `shrink_utilization` and the pool is above
+    min_workers. The gap between the two utilization thresholds plus the idle
+    timeout is the hysteresis that stops the pool from flapping on bursty load.
+
+    Exposes submit() and the context-manager protocol, so it can stand in for
+    the ThreadPoolExecutor used by TCPServer.
+    """
+
+    def __init__(self, min_workers: int = 2, max_workers: int = 10, grow_wait: float = 0.05,
+                 grow_utilization: float = 0.9, shrink_utilization: float = 0.5,
+                 idle_timeout: float = 5.0, name: str = "AdaptivePool"):
+        self.min_workers = max(1, min_workers)
+        self.max_workers = max(self.min_workers, max_workers)
+        self.grow_wait = grow_wait
+        self.grow_utilization = grow_utilization
+        self.shrink_utilization = shrink_utilization
+        self.idle_timeout = idle_timeout
+        self.name = name
+
+        self._queue: deque = deque()
+        self._cond = threading.Condition()
+        self._size = 0
+        self._busy = 0
+        self._next_id = 0
+        self._shutdown = False
+
+        # Stats
+        self.peak_size = 0
+        self.grows = 0
+        self.shrinks = 0
+        self.completed = 0
+        self.total_queue_wait = 0.0
+        self.max_queue_wait = 0.0
+        self.decisions: deque = deque(maxlen=20)
+
+        with self._cond:
+            for _ in range(self.min_workers):
+                self._spawn("initial")
+
+        self._monitor = threading.Thread(target=self._monitor_loop, name=f"{name}-monitor", daemon=True)
+        self._monitor.start()
+
+    # --- Public API ---
+    def submit(self, fn, *args, **kwargs):
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("cannot submit after shutdown")
+            self._queue.append((time.perf_counter(), fn, args, kwargs))
+            self._maybe_grow()
+            self._cond.notify()
+
+    def shutdown(self, wait: bool = True):
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+        if wait:
+            with self._cond:
+                while self._size > 0:
+                    self._cond.wait(0.1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown(wait=True)
+        return False
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "size": self._size,
+                "busy": self._busy,
+                "queued": len(self._queue),
+                "min": self.min_workers,
+                "max": self.max_workers,
+                "peak": self.peak_size,
+                "grows": self.grows,
+                "shrinks": self.shrinks,
+                "completed": self.completed,
+                "avg_queue_wait_s": self.total_queue_wait / self.completed if self.completed else 0.0,
+                "max_queue_wait_s": self.max_queue_wait,
+                "recent_decisions": list(self.decisions),
+            }
+
+    # --- Sizing decisions (called with _cond held) ---
+    def _utilization(self) -> float:
+        # Demand, not just occupancy: queued tasks count as work the pool owes.
+        return (self._busy + len(self._queue)) / self._size if self._size else 1.0
+
+    def _maybe_grow(self):
+        if self._size >= self.max_workers or not self._queue:
+            return
+        waited = time.perf_counter() - self._queue[0][0]
+        utilization = self._utilization()
+        if waited >= self.grow_wait:
+            self._spawn(f"queue wait {waited * 1000:.0f}ms >= {self.grow_wait * 1000:.0f}ms")
+        elif utilization > 1.0 or (utilization >= self.grow_utilization and len(self._queue) > 1):
+            self._spawn(f"utilization {utilization:.0%} >= {self.grow_utilization:.0%}")
+
+    def _spawn(self, reason: str):
+        self._size += 1
+        self._next_id += 1
+        self.peak_size = max(self.peak_size, self._size)
+        if reason != "initial":
+            self.grows += 1
+            self._record("grow", reason)
+        t = threading.Thread(target=self._worker, name=f"{self.name}_{self._next_id}", daemon=True)
+        t.start()
+
+    def _record(self, action: str, reason: str):
+        self.decisions.append((round(time.time(), 3), action, self._size, reason))
+        print(f"[POOL] {action} -> {self._size} workers ({reason})")
+
+    # --- Threads ---
+    def _monitor_loop(self):
+        # Catches queued work that arrived while no submit() was happening.
+        interval = max(0.01, self.grow_wait / 2)
+        while True:
+            time.sleep(interval)
+            with self._cond:
+                if self._shutdown:
+                    return
+                self._maybe_grow()
+
+    def _worker(self):
+        idle_since = time.perf_counter()
+        while True:
+            with self._cond:
+                while not self._queue and not self._shutdown:
+                    remaining = self.idle_timeout - (time.perf_counter() - idle_since)
+                    if remaining <= 0:
+                        if self._size > self.min_workers and self._utilization() < self.shrink_utilization:
+                            self._size -= 1
+                            self.shrinks += 1
+                            self._record("shrink", f"idle {self.idle_timeout:.1f}s")
+                            self._cond.notify_all()
+                            return
+                        idle_since = time.perf_counter()
+                        remaining = self.idle_timeout
+                    self._cond.wait(remaining)
+                if not self._queue and self._shutdown:
+                    self._size -= 1
+                    self._cond.notify_all()
+                    return
+                enqueued, fn, args, kwargs = self._queue.popleft()
+                waited = time.perf_counter() - enqueued
+                self.total_queue_wait += waited
+                self.max_queue_wait = max(self.max_queue_wait, waited)
+                self._busy += 1
+            try:
+                fn(*args, **kwargs)
+            except Exception:
+                pass
+            finally:
+                with self._cond:
+                    self._busy -= 1
+                    self.completed += 1
+                idle_since = time.perf_counter()
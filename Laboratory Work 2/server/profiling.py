@@ -0,0 +1,122 @@
+import cProfile
+import io
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+# Innermost frames of threads that are parked rather than working: pool workers
+# waiting for a task, the accept loop, timed waits. Left out of profiles by
+# default so idle threads do not bury the busy ones.
+IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("thread.py", "_worker"),
+    ("socket.py", "accept"),
+    ("selectors.py", "select"),
+}
+
+
+def _thread_group(name: str) -> str:
+    """'ThreadPoolExecutor-0_3' -> 'ThreadPoolExecutor-0', 'AdaptivePool_7' -> 'AdaptivePool'."""
+    return name.rstrip("0123456789").rstrip("_") or name
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler: every `interval` seconds it snapshots the Python stack
+    of every other thread (sys._current_frames) and counts identical stacks.
+    Nothing is hooked into the profiled code, so the cost is one stack walk per
+    thread per tick, paid by the sampling thread. Output is the "collapsed stack"
+    format (`thread;outer;...;inner count` per line) that flamegraph.pl,
+    speedscope and similar tools read directly.
+    """
+
+    def __init__(self, interval: float = 0.005, include_idle: bool = False):
+        self.interval = interval
+        self.include_idle = include_idle
+        self.samples = 0
+        self.stacks: Counter = Counter()
+
+    def sample(self):
+        me = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            code = frame.f_code
+            if not self.include_idle and (os.path.basename(code.co_filename), code.co_name) in IDLE_LEAVES:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack.append(_thread_group(names.get(ident, str(ident))))
+            self.stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def run(self, seconds: float) -> "SamplingProfiler":
+        """Sample from the calling thread for `seconds`, then return self."""
+        deadline = time.perf_counter() + seconds
+        next_tick = time.perf_counter()
+        while next_tick < deadline:
+            self.sample()
+            next_tick += self.interval
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        return self
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class RequestProfiler:
+    """
+    Deterministic profiling of a sampled fraction of requests: the chosen ones run
+    under cProfile and their stats are merged into one running pstats.Stats.
+    Only one request is profiled at a time (cProfile instrumentation is per
+    thread and costly); a request that draws the sample while another is being
+    profiled simply runs unprofiled.
+    """
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.profiled = 0
+        self._busy = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats: pstats.Stats | None = None
+
+    def start(self):
+        """
+        A running cProfile.Profile if this request draws the sample, else None. It
+        profiles the calling thread until stop(): pass it on when the work of the
+        request goes on after the handler returns (a streamed body).
+        """
+        if random.random() >= self.rate or not self._busy.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def stop(self, profile):
+        profile.disable()
+        self._busy.release()
+        with self._stats_lock:
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+            self.profiled += 1
+
+    def report(self, sort: str = "cumulative", limit: int = 40) -> str:
+        with self._stats_lock:
+            if self._stats is None:
+                return "No requests profiled yet.\n"
+            out = io.StringIO()
+            self._stats.stream = out
+            self._stats.sort_stats(sort).print_stats(limit)
+        return f"{self.profiled} requests profiled (rate {self.rate:g})\n" + out.getvalue()
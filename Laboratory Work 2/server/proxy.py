@@ -0,0 +1,635 @@
+import argparse
+import ipaddress
+import json
+import os
+import random
+import shlex
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+
+from .request import HTTPRequest
+from .tcp_server import TCPServer
+
+# Headers that describe one connection, not the message: never forwarded as-is.
+HOP_BY_HOP = {"connection", "keep-alive", "proxy-connection", "proxy-authenticate", "proxy-authorization",
+              "te", "trailer", "transfer-encoding", "upgrade"}
+STRATEGIES = ("least-conn", "p2c")
+
+
+# --- Forwarded client addresses (also used by HTTPServer) ---
+
+def parse_trusted(text: str | None) -> list:
+    """
+    '127.0.0.1,10.0.0.0/8' -> [ip_network, ...] (used for CLI flags). The word
+    'unix' trusts peers on Unix-socket listeners (a co-located proxy).
+    """
+    return [item.strip() if item.strip() == "unix" else ipaddress.ip_network(item.strip(), strict=False)
+            for item in (text or "").split(",") if item.strip()]
+
+
+def is_trusted(ip: str, networks) -> bool:
+    if ip.startswith("unix:"):
+        return "unix" in networks
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    return any(address in network for network in networks if network != "unix")
+
+
+def forwarded_client(header: str | None, peer: str, networks) -> str:
+    """
+    Client address of a request that came through trusted proxies.
+
+    Each proxy appends the address it received the request from to
+    X-Forwarded-For, so entries further left were supplied by the client and
+    can be forged. Walking from the right, the first address that is not one of
+    our proxies is the real client; if every hop is trusted, the leftmost one is.
+    """
+    hops = [hop.strip() for hop in header.split(",") if hop.strip()] if header else []
+    for hop in reversed(hops):
+        if not is_trusted(hop, networks):
+            try:
+                ipaddress.ip_address(hop)
+            except ValueError:
+                return peer  # garbage is charged to the proxy, not given a fresh bucket
+            return hop
+    return hops[0] if hops else peer
+
+
+# --- Backends ---
+
+def dial(host: str, port: int, timeout: float) -> socket.socket:
+    """Connect to a backend: TCP host:port, or a Unix socket when host is 'unix:PATH'."""
+    if host.startswith("unix:"):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(host[5:])
+        except OSError:
+            sock.close()
+            raise
+        return sock
+    sock = socket.create_connection((host, port), timeout=timeout)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+
+class _Conn:
+    __slots__ = ("sock", "rfile", "used_at")
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.rfile = sock.makefile("rb")
+        self.used_at = time.monotonic()
+
+    def close(self):
+        try:
+            self.rfile.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class Backend:
+    """
+    One upstream HTTPServer and its pool of idle persistent connections.
+
+    At most `pool_size` idle connections are kept; each one occupies a worker
+    thread on the backend while it waits, so the pool should stay well below the
+    backend's --workers. Idle connections older than `idle_timeout` are dropped
+    rather than reused, so it should be below the backend's --keep-alive.
+    """
+
+    def __init__(self, host: str, port: int, pool_size: int = 4, idle_timeout: float = 4.0,
+                 timeout: float = 30.0):
+        self.host = host
+        self.port = port
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.healthy = True
+        self.ejected_until = 0.0
+        self.active = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.probe_successes = 0
+        self.ejections = 0
+        self.connects = 0
+        self.reuses = 0
+        self._idle: deque = deque()
+        self._lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        return self.host if self.host.startswith("unix:") else f"{self.host}:{self.port}"
+
+    def connect(self) -> _Conn:
+        sock = dial(self.host, self.port, self.timeout)
+        with self._lock:
+            self.connects += 1
+        return _Conn(sock)
+
+    def checkout(self) -> tuple[_Conn, bool]:
+        """(connection, reused): a pooled idle connection if a fresh-enough one exists, else a new one."""
+        now = time.monotonic()
+        with self._lock:
+            while self._idle:
+                conn = self._idle.pop()
+                if now - conn.used_at < self.idle_timeout:
+                    self.reuses += 1
+                    return conn, True
+                conn.close()
+        return self.connect(), False
+
+    def checkin(self, conn: _Conn):
+        conn.used_at = time.monotonic()
+        with self._lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close_idle(self):
+        with self._lock:
+            while self._idle:
+                self._idle.pop().close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            idle = len(self._idle)
+        return {
+            "backend": self.name,
+            "healthy": self.healthy,
+            "active": self.active,
+            "idle_connections": idle,
+            "requests": self.requests,
+            "failures": self.failures,
+            "ejections": self.ejections,
+            "connects": self.connects,
+            "reuses": self.reuses,
+        }
+
+
+class LoadBalancer:
+    """
+    Picks a backend per request and tracks backend health.
+
+    least-conn: the backend with the fewest requests in flight (ties broken at
+    random). p2c: two backends at random, the less busy of the two ("power of
+    two choices"), which avoids every proxy thread herding onto the same one.
+
+    `max_fails` consecutive failures (requests that could not be exchanged, or
+    failed health probes) take a backend out of rotation. With health checks on,
+    `rise` consecutive good probes bring it back; without them it is retried
+    after `eject_time` seconds.
+    """
+
+    def __init__(self, backends, strategy: str = "least-conn", max_fails: int = 3, eject_time: float = 10.0,
+                 health_interval: float = 2.0, health_path: str = "/_health", rise: int = 2):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"strategy must be one of {', '.join(STRATEGIES)}")
+        self.backends = list(backends)
+        self.strategy = strategy
+        self.max_fails = max_fails
+        self.eject_time = eject_time
+        self.health_interval = health_interval
+        self.health_path = health_path
+        self.rise = rise
+        self._lock = threading.Lock()
+
+    def pick(self, exclude=()) -> Backend | None:
+        now = time.monotonic()
+        with self._lock:
+            candidates = []
+            for backend in self.backends:
+                if backend in exclude:
+                    continue
+                if not backend.healthy and not self.health_interval and now >= backend.ejected_until:
+                    backend.healthy = True  # no prober: let traffic find out
+                    print(f"[PROXY] {backend.name} back in rotation (ejection expired)")
+                if backend.healthy:
+                    candidates.append(backend)
+            if not candidates:
+                return None
+            if self.strategy == "p2c" and len(candidates) > 1:
+                first, second = random.sample(candidates, 2)
+                chosen = first if first.active <= second.active else second
+            else:
+                fewest = min(b.active for b in candidates)
+                chosen = random.choice([b for b in candidates if b.active == fewest])
+            chosen.active += 1
+            chosen.requests += 1
+            return chosen
+
+    def done(self, backend: Backend, ok: bool, reason: str = ""):
+        with self._lock:
+            backend.active -= 1
+            if ok:
+                backend.consecutive_failures = 0
+                return
+            backend.failures += 1
+            self._failed(backend, reason)
+
+    def _failed(self, backend: Backend, reason: str):
+        backend.consecutive_failures += 1
+        backend.probe_successes = 0
+        if backend.healthy and backend.consecutive_failures >= self.max_fails:
+            backend.healthy = False
+            backend.ejected_until = time.monotonic() + self.eject_time
+            backend.ejections += 1
+            backend.close_idle()
+            print(f"[PROXY] ejected {backend.name} after {backend.consecutive_failures} failures ({reason})")
+
+    def probe(self, backend: Backend) -> bool:
+        try:
+            with dial(backend.host, backend.port, min(2.0, backend.timeout)) as s:
+                s.sendall(f"GET {self.health_path} HTTP/1.1\r\nHost: {backend.name}\r\n"
+                          f"Connection: close\r\n\r\n".encode("ascii"))
+                status = s.makefile("rb").readline(1024).split(b" ", 2)
+            return len(status) > 1 and status[1] == b"200"
+        except OSError:
+            return False
+
+    def check_health(self):
+        for backend in self.backends:
+            ok = self.probe(backend)
+            with self._lock:
+                if not ok:
+                    self._failed(backend, "health check")
+                    continue
+                backend.consecutive_failures = 0
+                if not backend.healthy:
+                    backend.probe_successes += 1
+                    if backend.probe_successes >= self.rise:
+                        backend.healthy = True
+                        print(f"[PROXY] {backend.name} back in rotation ({self.rise} good health checks)")
+
+    def start_health_checks(self):
+        if self.health_interval <= 0:
+            return
+
+        def loop():
+            while True:
+                self.check_health()
+                time.sleep(self.health_interval)
+
+        threading.Thread(target=loop, name="health-check", daemon=True).start()
+
+    def stats(self) -> dict:
+        return {"strategy": self.strategy, "backends": [b.stats() for b in self.backends]}
+
+
+# --- Proxy server ---
+
+class BadResponse(OSError):
+    """A backend answered with something that is not an HTTP/1.x response head."""
+
+
+def parse_status(status: bytes) -> int:
+    """Status code of a response status line such as b'HTTP/1.1 200 OK'; BadResponse if malformed."""
+    parts = status.split(b" ", 2)
+    if len(parts) < 2 or not parts[0].startswith(b"HTTP/1.") or len(parts[1]) != 3 or not parts[1].isdigit():
+        raise BadResponse(f"malformed status line {status[:80]!r}")
+    return int(parts[1])
+
+
+class ProxyServer(TCPServer):
+    """
+    Reverse proxy in front of several HTTPServer backends, on the same
+    thread-per-connection core as the server itself.
+
+    Each request is forwarded on a pooled persistent backend connection with the
+    client's address appended to X-Forwarded-For; the response head is read
+    before answering, and the body is relayed as it arrives (Content-Length,
+    chunked or close-delimited). Idempotent requests that fail before any reply
+    byte is received are retried on another backend, up to `retries` times.
+    """
+
+    def __init__(self, balancer: LoadBalancer, host='127.0.0.1', port=8080, max_workers=64,
+                 keep_alive_timeout: float = 5.0, retries: int = 1):
+        super().__init__(host=host, port=port, max_workers=max_workers, keep_alive_timeout=keep_alive_timeout)
+        self.balancer = balancer
+        self.retries = retries
+
+    def start(self):
+        self.balancer.start_health_checks()
+        super().start()
+
+    def handle_request(self, data, addr):
+        peer = addr[0] if addr else "unknown"
+        try:
+            request = HTTPRequest(data)
+        except ValueError:
+            return self.error_response(400, "Bad Request")
+        if request.uri == "/_proxy":
+            if peer not in ("127.0.0.1", "::1"):
+                return self.error_response(403, "Forbidden")
+            body = json.dumps(self.balancer.stats(), indent=2).encode("utf-8")
+            return self.error_response(200, "OK", body, content_type="application/json")
+        if "transfer-encoding" in request.headers or request.headers.get("content-length", "0") != "0":
+            # Nothing behind this proxy accepts a request body.
+            return self.error_response(501, "Not Implemented", b"<h1>501 Request bodies are not proxied</h1>")
+
+        head = self.forward_head(data, peer)
+        idempotent = request.method in ("GET", "HEAD", "OPTIONS")
+        tried = []
+        for _ in range(1 + (self.retries if idempotent else 0)):
+            backend = self.balancer.pick(exclude=tried)
+            if backend is None:
+                break
+            tried.append(backend)
+            started = time.perf_counter()
+            try:
+                conn, status, code, headers = self.exchange(backend, head)
+            except OSError as e:
+                self.balancer.done(backend, ok=False, reason=type(e).__name__)
+                print(f"[PROXY] {request.method} {request.uri} -> {backend.name} failed: {e!r}")
+                continue
+            print(f"[PROXY] {request.method} {request.uri} -> {backend.name} "
+                  f"({code}, {(time.perf_counter() - started) * 1000:.1f} ms, client {peer})")
+            return self.relay(backend, conn, request, status, code, headers)
+        if not tried:
+            return self.error_response(503, "Service Unavailable", b"<h1>503 No healthy backend</h1>",
+                                       extra={"Retry-After": "1"})
+        return self.error_response(502, "Bad Gateway")
+
+    def forward_head(self, data: bytes, peer: str) -> bytes:
+        """The client's request head, re-framed for a persistent backend connection."""
+        lines = data.split(b"\r\n\r\n", 1)[0].split(b"\r\n")
+        method, uri, _version = lines[0].split(b" ", 2)
+        out = [method + b" " + uri + b" HTTP/1.1"]
+        forwarded = None
+        for line in lines[1:]:
+            name, sep, value = line.partition(b":")
+            key = name.strip().lower()
+            if not sep or key.decode("iso-8859-1") in HOP_BY_HOP:
+                continue
+            if key == b"x-forwarded-for":
+                forwarded = value.strip()
+                continue
+            out.append(line)
+        chain = (forwarded + b", " if forwarded else b"") + peer.encode("ascii")
+        out += [b"X-Forwarded-For: " + chain, b"X-Forwarded-Proto: http", b"Connection: keep-alive"]
+        return b"\r\n".join(out) + b"\r\n\r\n"
+
+    def exchange(self, backend: Backend, head: bytes):
+        """
+        Send the head and read the response head: (conn, status line, status code, header lines).
+        A stale pooled connection is replaced once; a malformed response raises BadResponse
+        with the connection closed, like any other backend failure.
+        """
+        conn, reused = backend.checkout()
+        while True:
+            try:
+                conn.sock.sendall(head)
+                status = conn.rfile.readline(65537)
+                if not status:
+                    raise ConnectionResetError("backend closed the connection")
+                status = status.rstrip(b"\r\n")
+                code = parse_status(status)
+                headers = []
+                while True:
+                    line = conn.rfile.readline(65537)
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    headers.append(line.rstrip(b"\r\n"))
+                return conn, status, code, headers
+            except BadResponse:
+                conn.close()
+                raise
+            except OSError:
+                conn.close()
+                if not reused:
+                    raise
+                # The backend dropped an idle pooled connection (its keep-alive ran out).
+                conn, reused = backend.connect(), False
+
+    def relay(self, backend: Backend, conn: _Conn, request, status: bytes, code: int, headers: list):
+        fields = {}
+        for line in headers:
+            name, _, value = line.partition(b":")
+            fields[name.strip().lower().decode("iso-8859-1")] = value.strip().decode("iso-8859-1")
+        if request.method == "HEAD" or code in (204, 304) or 100 <= code < 200:
+            framing = "none"
+        elif "chunked" in fields.get("transfer-encoding", "").lower():
+            framing = "chunked"
+        elif "content-length" in fields:
+            framing = "length"
+        else:
+            framing = "close"
+        backend_keeps = framing != "close" and fields.get("connection", "").lower() == "keep-alive"
+        client_http11 = request.http_version.upper() == "HTTP/1.1"
+        # A chunked body is passed through framed to HTTP/1.1 clients, unframed to 1.0 ones.
+        dechunk = framing == "chunked" and not client_http11
+        client_keeps = (self.keep_alive_timeout > 0 and client_http11 and not dechunk and framing != "close"
+                        and request.headers.get("connection", "").lower() != "close")
+
+        out = [status]
+        for line in headers:
+            key = line.partition(b":")[0].strip().lower().decode("iso-8859-1")
+            if key in HOP_BY_HOP and not (key == "transfer-encoding" and framing == "chunked" and not dechunk):
+                continue
+            out.append(line)
+        out.append(b"Connection: keep-alive" if client_keeps else b"Connection: close")
+        client_head = b"\r\n".join(out) + b"\r\n\r\n"
+        return self._relay_body(backend, conn, client_head, framing, fields, dechunk, backend_keeps)
+
+    def _relay_body(self, backend, conn, client_head, framing, fields, dechunk, backend_keeps):
+        complete = False
+        backend_error = None
+        try:
+            yield client_head
+            rfile = conn.rfile
+            try:
+                if framing == "length":
+                    remaining = int(fields["content-length"])
+                    while remaining > 0:
+                        data = rfile.read1(min(65536, remaining))
+                        if not data:
+                            raise ConnectionResetError("backend closed mid-body")
+                        remaining -= len(data)
+                        yield data
+                elif framing == "chunked":
+                    while True:
+                        size_line = rfile.readline(1024)
+                        if not size_line:
+                            raise ConnectionResetError("backend closed mid-body")
+                        size = int(size_line.split(b";")[0].strip(), 16)
+                        if size == 0:
+                            trailer = size_line
+                            while True:
+                                line = rfile.readline(65537)
+                                trailer += line
+                                if line in (b"\r\n", b"\n", b""):
+                                    break
+                            if not dechunk:
+                                yield trailer
+                            break
+                        data = rfile.read(size + 2)
+                        if len(data) < size + 2:
+                            raise ConnectionResetError("backend closed mid-chunk")
+                        yield data[:size] if dechunk else size_line + data
+                elif framing == "close":
+                    while True:
+                        data = rfile.read1(65536)
+                        if not data:
+                            break
+                        yield data
+            except (OSError, ValueError) as e:
+                backend_error = e
+                raise
+            complete = True
+        finally:
+            # A client that went away mid-body is not the backend's fault.
+            self.balancer.done(backend, ok=backend_error is None,
+                               reason=type(backend_error).__name__ if backend_error else "")
+            if complete and backend_keeps:
+                backend.checkin(conn)
+            else:
+                conn.close()
+
+    def error_response(self, status: int, reason: str, body: bytes | None = None,
+                       content_type: str = "text/html; charset=utf-8", extra: dict | None = None) -> bytes:
+        body = body if body is not None else f"<h1>{status} {reason}</h1>".encode("utf-8")
+        headers = {"Server": "Crude Proxy", "Content-Type": content_type, "Content-Length": str(len(body)),
+                   "Connection": "close", **(extra or {})}
+        head = f"HTTP/1.1 {status} {reason}\r\n" + "".join(f"{k}: {v}\r\n" for k, v in headers.items()) + "\r\n"
+        return head.encode("iso-8859-1") + body
+
+
+# --- Command line ---
+
+def spawn_backends(count: int, base_port: int, keep_alive: float, extra_args: str, unix_dir: str | None = None):
+    """
+    Start `count` local `python -m server` processes that trust this proxy's
+    X-Forwarded-For, on consecutive TCP ports or on Unix sockets in `unix_dir`.
+    """
+    procs, addresses = [], []
+    for i in range(count):
+        if unix_dir:
+            path = os.path.join(unix_dir, f"backend-{i}.sock")
+            listen = ["--unix", path, "--trusted-proxies", "unix"]
+            address = (f"unix:{path}", 0)
+        else:
+            port = base_port + i
+            listen = ["--host", "127.0.0.1", "--port", str(port), "--trusted-proxies", "127.0.0.1"]
+            address = ("127.0.0.1", port)
+        cmd = [sys.executable, "-m", "server", *listen, "--keep-alive", str(keep_alive), *shlex.split(extra_args)]
+        procs.append(subprocess.Popen(cmd, stdout=subprocess.DEVNULL))
+        addresses.append(address)
+    for host, port in addresses:
+        for _ in range(100):
+            try:
+                dial(host, port, 0.1).close()
+                break
+            except OSError:
+                time.sleep(0.05)
+    return procs, addresses
+
+
+def parse_backend(text: str) -> tuple[str, int]:
+    if text.startswith("unix:") and len(text) > 5:
+        return text, 0
+    host, sep, port = text.rpartition(":")
+    if not sep or not port.isdigit():
+        raise argparse.ArgumentTypeError(f"expected HOST:PORT or unix:PATH, got {text!r}")
+    return host or "127.0.0.1", int(port)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Load-balancing reverse proxy for the lab HTTP server")
+    p.add_argument("--host", default="127.0.0.1", help="Host to bind to")
+    p.add_argument("--port", default=8080, type=int, help="Port to bind to")
+    p.add_argument("--backend", action="append", type=parse_backend, default=[],
+                   help="Backend HOST:PORT or unix:PATH (repeat for each; they should run with --keep-alive "
+                        "and --trusted-proxies)")
+    p.add_argument("--spawn", default=0, type=int,
+                   help="Also start this many local backends, on Unix sockets in a private temporary directory")
+    p.add_argument("--spawn-unix", default=None, metavar="DIR",
+                   help="Put the spawned backends' sockets in DIR (DIR/backend-N.sock)")
+    p.add_argument("--spawn-tcp", action="store_true",
+                   help="Spawned backends listen on 127.0.0.1 TCP ports instead. They trust X-Forwarded-For "
+                        "from 127.0.0.1, so any local process that connects to them directly can choose "
+                        "the client IP used for rate limiting and stats")
+    p.add_argument("--spawn-port", default=8001, type=int, help="First port for --spawn-tcp backends")
+    p.add_argument("--backend-args", default="", help="Extra arguments for spawned backends, e.g. \"--rate-limit 5 --workers 16\"")
+    p.add_argument("--strategy", choices=STRATEGIES, default="least-conn", help="Balancing strategy")
+    p.add_argument("--workers", default=64, type=int, help="Proxy worker threads (concurrent client connections)")
+    p.add_argument("--pool-size", default=4, type=int, help="Idle persistent connections kept per backend")
+    p.add_argument("--idle-timeout", default=4.0, type=float,
+                   help="Drop pooled connections idle this long (keep below the backends' --keep-alive)")
+    p.add_argument("--keep-alive", default=5.0, type=float,
+                   help="Client keep-alive timeout in seconds (0 = close after each response); also passed to --spawn backends")
+    p.add_argument("--max-fails", default=3, type=int, help="Consecutive failures before a backend is ejected")
+    p.add_argument("--eject-time", default=10.0, type=float, help="Ejection length when health checks are off (s)")
+    p.add_argument("--health-interval", default=2.0, type=float, help="Seconds between health checks (0 = off)")
+    p.add_argument("--rise", default=2, type=int, help="Good health checks before an ejected backend returns")
+    p.add_argument("--retries", default=1, type=int, help="Other backends to try when an idempotent request fails")
+    p.add_argument("--timeout", default=30.0, type=float, help="Backend socket timeout (s)")
+    args = p.parse_args()
+
+    procs = []
+    private_dir = None
+    if args.spawn:
+        if args.spawn_tcp and args.spawn_unix:
+            p.error("--spawn-tcp and --spawn-unix are mutually exclusive")
+        unix_dir = args.spawn_unix
+        if not args.spawn_tcp and unix_dir is None:
+            # Only this user can reach the backends, so only the proxy can set their X-Forwarded-For.
+            unix_dir = private_dir = tempfile.mkdtemp(prefix="crude-proxy-")
+        procs, spawned = spawn_backends(args.spawn, args.spawn_port, args.keep_alive, args.backend_args,
+                                        unix_dir=unix_dir)
+        args.backend += spawned
+    if not args.backend:
+        p.error("give at least one --backend or --spawn N")
+
+    backends = [Backend(host, port, pool_size=args.pool_size, idle_timeout=args.idle_timeout, timeout=args.timeout)
+                for host, port in args.backend]
+    balancer = LoadBalancer(backends, strategy=args.strategy, max_fails=args.max_fails, eject_time=args.eject_time,
+                            health_interval=args.health_interval, rise=args.rise)
+    print("=" * 80)
+    print("REVERSE PROXY")
+    print("=" * 80)
+    print(f"Listening         : {args.host}:{args.port} ({args.workers} workers, keep-alive {args.keep_alive}s)")
+    print(f"Backends          : {', '.join(b.name for b in backends)}"
+          + (f" ({args.spawn} spawned)" if args.spawn else ""))
+    print(f"Balancing         : {args.strategy}, {args.pool_size} pooled connection(s) per backend")
+    print(f"Health            : " + (f"GET /_health every {args.health_interval}s, eject after {args.max_fails} "
+                                     f"failures, back after {args.rise} good checks"
+                                     if args.health_interval > 0 else
+                                     f"passive only, eject after {args.max_fails} failures for {args.eject_time}s"))
+    print("Client IP         : appended to X-Forwarded-For (backends need --trusted-proxies)")
+    print("=" * 80)
+
+    server = ProxyServer(balancer, host=args.host, port=args.port, max_workers=args.workers,
+                         keep_alive_timeout=args.keep_alive, retries=args.retries)
+    # SIGTERM (docker stop, kill): drain relayed requests, then stop spawned backends,
+    # which drain their own in turn.
+    signal.signal(signal.SIGTERM, lambda signum, frame: server.request_drain())
+    try:
+        server.start()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            try:
+                proc.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        if private_dir is not None:
+            shutil.rmtree(private_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
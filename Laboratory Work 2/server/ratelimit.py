@@ -0,0 +1,119 @@
+import stat
+import threading
+import time
+
+
+ROUTES = ("listing", "file", "internal", "other")
+
+
+def parse_route_map(text: str | None) -> dict[str, float]:
+    """'listing=2,file=5' -> {'listing': 2.0, 'file': 5.0} (used for CLI flags)."""
+    result: dict[str, float] = {}
+    if not text:
+        return result
+    for item in text.split(","):
+        if not item.strip():
+            continue
+        name, sep, value = item.partition("=")
+        name = name.strip()
+        if not sep or name not in ROUTES:
+            raise ValueError(f"expected ROUTE=NUMBER with ROUTE in {', '.join(ROUTES)}, got {item!r}")
+        result[name] = float(value)
+    return result
+
+
+class RateLimitPolicy:
+    """
+    Route-aware, cost-weighted rate limiting rules.
+
+    Each request is assigned a route class (listing, file, internal, other) and a
+    cost: the route's base cost plus one unit per `bytes_per_unit` bytes of the
+    file it will send. Limits are budgets of cost units per second:
+      - route_limits: per client IP and route (falls back to `default_limit`),
+      - global_limit: one ceiling across all clients and routes (0 = none).
+    A 30 MB PDF therefore spends a client's budget far faster than a 404.
+    """
+
+    def __init__(self, default_limit: float = 0.0, route_limits: dict | None = None,
+                 route_costs: dict | None = None, bytes_per_unit: int = 1 << 20,
+                 global_limit: float = 0.0):
+        self.default_limit = default_limit
+        self.route_limits = route_limits or {}
+        self.route_costs = route_costs or {}
+        self.bytes_per_unit = bytes_per_unit
+        self.global_limit = global_limit
+
+    def assess(self, request, stat_target) -> tuple[str, float]:
+        """
+        Return (route, cost) for a parsed request (None for an unparsable one).
+        stat_target(uri) is the server's own lookup (root directory or content pack),
+        so the route and size are those of what would actually be served.
+        """
+        if request is None:
+            return "other", self.route_costs.get("other", 1.0)
+        size = 0
+        if request.uri.startswith("/_"):
+            route = "internal"
+        else:
+            route = "other"
+            st = stat_target(request.uri)
+            if st is not None:
+                if stat.S_ISDIR(st.st_mode):
+                    route = "listing"
+                elif stat.S_ISREG(st.st_mode):
+                    route = "file"
+                    size = st.st_size
+        cost = self.route_costs.get(route, 1.0)
+        if self.bytes_per_unit > 0:
+            cost += size / self.bytes_per_unit
+        return route, cost
+
+    def limit_for(self, route: str) -> float:
+        return self.route_limits.get(route, self.default_limit)
+
+    def describe(self) -> str:
+        parts = [f"{route}={self.limit_for(route):g}" for route in ROUTES if self.limit_for(route) > 0]
+        text = "per-IP " + (", ".join(parts) if parts else "none")
+        if self.bytes_per_unit > 0:
+            text += f"; +1 cost per {self.bytes_per_unit // 1024} KiB"
+        if self.global_limit > 0:
+            text += f"; global {self.global_limit:g}/s"
+        return text
+
+
+class GCRALimiter:
+    """
+    In-process cost-weighted limiter (GCRA: a token bucket kept as one timestamp
+    per key). Same contract as SharedState.gcra_allow, which is used instead when
+    the server runs with shared memory.
+    """
+
+    def __init__(self):
+        self._tat: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def gcra_allow(self, key: str, rate: float, cost: float = 1.0,
+                   burst: float | None = None) -> tuple[bool, float]:
+        burst = rate if burst is None else burst
+        # Room for `burst` unit-cost requests back to back (classic GCRA tau).
+        tolerance = max(0.0, burst - 1.0) / rate
+        now = time.time()
+        with self._lock:
+            tat = max(self._tat.get(key, now), now)
+            allowed = tat - now <= tolerance
+            if allowed:
+                tat += cost / rate
+                self._tat[key] = tat
+            if len(self._tat) > 10000:
+                # Keys whose debt is repaid carry no state worth keeping.
+                self._tat = {k: t for k, t in self._tat.items() if t > now}
+        return allowed, max(0.0, tat - now - tolerance)
+
+    def gcra_refund(self, key: str, rate: float, cost: float = 1.0):
+        """Give back an allowed gcra_allow() charge for a request refused further on."""
+        with self._lock:
+            if key in self._tat:
+                self._tat[key] -= cost / rate
+
+    def __len__(self):
+        return len(self._tat)
@@ -3,6 +3,12 @@ class HTTPRequest:
         self.method = None
         self.uri = None
         self.http_version = "1.1"
+        # Header names are stored lower-cased for case-insensitive lookups.
+        self.headers: dict[str, str] = {}
+        # Filled in by the server from the connection (not part of the request bytes).
+        self.client_ip = None
+        # Whether the response may leave the connection open for another request.
+        self.keep_alive = False
 
         # call self.parse() method to parse the request data
         self.parse(data)
@@ -26,4 +32,66 @@ class HTTPRequest:
 
         # HTTP version
         self.http_version = words[2].decode(errors="ignore")
-        
\ No newline at end of file
+
+        # Header lines until the blank line that ends the head
+        for line in lines[1:]:
+            if not line:
+                break
+            if b":" not in line:
+                continue
+            name, value = line.split(b":", 1)
+            self.headers[name.decode("iso-8859-1").strip().lower()] = value.decode("iso-8859-1").strip()
+
+
+def parse_byte_range(header, size):
+    """
+    Parse a single-range "Range: bytes=..." header against a resource of `size` bytes.
+    Returns (start, end) with an inclusive end, or None when the header is absent or
+    not something we understand (the caller then serves the full body).
+    Raises ValueError when the range is well-formed but unsatisfiable (-> 416).
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+    if first == "":
+        # Suffix range: the last N bytes.
+        if not last.isdigit():
+            return None
+        suffix = int(last)
+        if suffix == 0:
+            raise ValueError("Empty suffix range")
+        start = max(0, size - suffix)
+        end = size - 1
+    else:
+        if not first.isdigit() or (last and not last.isdigit()):
+            return None
+        start = int(first)
+        end = int(last) if last else size - 1
+    if start >= size:
+        raise ValueError("Range start beyond end of resource")
+    if end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def accepts_encoding(header, coding):
+    """Whether an Accept-Encoding header allows `coding` (listed, or "*", with a nonzero q)."""
+    if not header:
+        return False
+    allowed = {}
+    for item in header.split(","):
+        name, _, params = item.partition(";")
+        q = 1.0
+        params = params.strip().lower()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        allowed[name.strip().lower()] = q
+    return allowed.get(coding, allowed.get("*", 0.0)) > 0
@@ -0,0 +1,66 @@
+CRLF = b"\r\n"
+
+
+class Response:
+    """
+    A response that handlers can return instead of one pre-built bytes object.
+
+    body is either bytes or any iterable/generator of bytes chunks. When the total
+    length is known (bytes body, or `length` given) it is sent with Content-Length;
+    otherwise the server sends it as it is produced with Transfer-Encoding: chunked,
+    so the first byte leaves before the last chunk exists and only about
+    `flush_size` bytes of body are held in memory at a time.
+    """
+
+    def __init__(self, status: int, headers: dict | None = None, body=b"",
+                 length: int | None = None, flush_size: int = 16 * 1024, on_close=None):
+        self.status = status
+        self.headers = dict(headers or {})
+        self.body = body
+        if isinstance(body, (bytes, bytearray, memoryview)):
+            length = len(body)
+        self.length = length
+        self.flush_size = flush_size
+        # Called once the response has been written (or abandoned), e.g. to give
+        # back the memory it reserved.
+        self.on_close = on_close
+
+    @property
+    def chunked(self) -> bool:
+        return self.length is None
+
+    def _pieces(self):
+        """Body chunks regrouped so tiny ones (e.g. table rows) share one send."""
+        if isinstance(self.body, (bytes, bytearray, memoryview)):
+            if self.body:
+                yield self.body
+            return
+        buffer = bytearray()
+        for chunk in self.body:
+            if not chunk:
+                continue
+            if not buffer and len(chunk) >= self.flush_size:
+                yield chunk
+                continue
+            buffer += chunk
+            if len(buffer) >= self.flush_size:
+                yield bytes(buffer)
+                buffer.clear()
+        if buffer:
+            yield bytes(buffer)
+
+    def wire(self, head: bytes, chunked: bool | None = None):
+        """Yield the bytes to put on the socket: `head` first, then the framed body."""
+        chunked = self.chunked if chunked is None else chunked
+        try:
+            yield head
+            if not chunked:
+                yield from self._pieces()
+                return
+            for piece in self._pieces():
+                yield b"%x\r\n" % len(piece) + piece + CRLF
+            # Last chunk; without it the client knows the body was cut short.
+            yield b"0\r\n\r\n"
+        finally:
+            if self.on_close is not None:
+                self.on_close()
@@ -0,0 +1,178 @@
+import threading
+import time
+from collections import deque
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens (bytes) per second, holding at most `burst`."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate: float):
+        with self._lock:
+            self._refill()
+            self.rate = rate
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def take(self, amount: float):
+        """Block until `amount` tokens are available, then consume them."""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait = (amount - self._tokens) / self.rate
+            time.sleep(min(wait, 0.25))
+
+
+class BandwidthShaper:
+    """
+    Byte-rate shaping for the response send path.
+
+    Responses smaller than `min_bytes` (pages, listings, error bodies) bypass the
+    shaper entirely, so interactive traffic is never paced. Larger responses are
+    sent in `chunk_size` pieces through a per-transfer token bucket whose rate is
+    re-evaluated before every chunk as
+
+        min(per_connection, global / active_transfers)
+
+    which caps each connection, splits the global budget evenly between whatever
+    transfers are running right now, and keeps their sum under the global limit.
+    A rate of 0 means "unlimited" for either knob.
+    """
+
+    def __init__(self, global_rate: float = 0.0, per_connection_rate: float = 0.0,
+                 min_bytes: int = 64 * 1024, chunk_size: int = 16 * 1024):
+        self.global_rate = global_rate
+        self.per_connection_rate = per_connection_rate
+        self.min_bytes = min_bytes
+        self.chunk_size = chunk_size
+
+        self._lock = threading.Lock()
+        self.active = 0
+        self.shaped_transfers = 0
+        self.shaped_bytes = 0
+        self.unshaped_bytes = 0
+        # (finished_at, bytes, seconds) of recent shaped transfers, for achieved rates.
+        self.recent: deque = deque(maxlen=50)
+
+    @property
+    def enabled(self) -> bool:
+        return self.global_rate > 0 or self.per_connection_rate > 0
+
+    def _fair_rate(self) -> float:
+        limits = []
+        if self.per_connection_rate > 0:
+            limits.append(self.per_connection_rate)
+        if self.global_rate > 0:
+            limits.append(self.global_rate / max(1, self.active))
+        return min(limits)
+
+    def transfer(self) -> "Transfer":
+        """Pacing state for one response; send its pieces through it, then close() it."""
+        return Transfer(self)
+
+    def _begin(self) -> TokenBucket:
+        with self._lock:
+            self.active += 1
+        return TokenBucket(self._fair_rate(), burst=self.chunk_size)
+
+    def _end(self, size: int, elapsed: float):
+        with self._lock:
+            self.active -= 1
+            self.shaped_transfers += 1
+            self.shaped_bytes += size
+            self.recent.append((time.time(), size, elapsed))
+
+    def _unshaped(self, size: int):
+        with self._lock:
+            self.unshaped_bytes += size
+
+    def stats(self) -> dict:
+        with self._lock:
+            recent = list(self.recent)
+            active = self.active
+        per_transfer = [size / secs for _, size, secs in recent if secs > 0]
+        # Aggregate throughput of transfers that finished in the last 10 seconds.
+        cutoff = time.time() - 10
+        window = [(size, secs) for finished, size, secs in recent if finished >= cutoff]
+        return {
+            "active": active,
+            "shaped_transfers": self.shaped_transfers,
+            "shaped_bytes": self.shaped_bytes,
+            "unshaped_bytes": self.unshaped_bytes,
+            "avg_transfer_rate": sum(per_transfer) / len(per_transfer) if per_transfer else 0.0,
+            "max_transfer_rate": max(per_transfer) if per_transfer else 0.0,
+            "recent_bytes_10s": sum(size for size, _ in window),
+        }
+
+
+class Transfer:
+    """
+    One response passing through a BandwidthShaper, however many pieces it is written in.
+
+    Pieces go out at full speed until the response has reached `min_bytes`; from
+    the piece that crosses it on, every byte of the response draws from a single
+    token bucket kept for the whole response. A body written in small pieces
+    (streamed chunks, HTTP/2 DATA frames) is thus paced like one written at once,
+    with one burst allowance rather than one per piece.
+    """
+
+    def __init__(self, shaper: BandwidthShaper):
+        self.shaper = shaper
+        self.sent = 0
+        self.shaped = 0
+        self.bucket = None
+        self.started = 0.0
+
+    def _admit(self, size: int) -> bool:
+        """Account for `size` more bytes; True if they are to be paced."""
+        shaper = self.shaper
+        if self.bucket is None:
+            if not shaper.enabled or self.sent + size < shaper.min_bytes:
+                self.sent += size
+                shaper._unshaped(size)
+                return False
+            self.bucket = shaper._begin()
+            self.started = time.monotonic()
+        self.sent += size
+        self.shaped += size
+        return True
+
+    def _take(self, size: int):
+        shaper = self.shaper
+        while size > 0:
+            step = min(size, shaper.chunk_size)
+            self.bucket.set_rate(shaper._fair_rate())
+            self.bucket.take(step)
+            size -= step
+
+    def pace(self, size: int):
+        """Wait until `size` more bytes of the response may be written (the caller writes them)."""
+        if self._admit(size):
+            self._take(size)
+
+    def send(self, conn, data):
+        if not self._admit(len(data)):
+            conn.sendall(data)
+            return
+        view = memoryview(data)
+        for offset in range(0, len(view), self.shaper.chunk_size):
+            chunk = view[offset:offset + self.shaper.chunk_size]
+            self._take(len(chunk))
+            conn.sendall(chunk)
+
+    def close(self):
+        if self.bucket is not None:
+            self.bucket = None
+            self.shaper._end(self.shaped, time.monotonic() - self.started)
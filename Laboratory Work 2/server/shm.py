@@ -0,0 +1,373 @@
+import hashlib
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections.abc import Mapping
+from multiprocessing import resource_tracker, shared_memory
+
+try:
+    import fcntl
+except ImportError:  # Windows: no byte-range locks, state is only shared between threads.
+    fcntl = None
+
+
+MAGIC = 0x4C41424853484D31  # "LABHSHM1"
+
+# Header: magic, path_slots, ip_slots, stripes, total_requests, rate_limit_blocked.
+_HEADER = struct.Struct("<QIII4xQQ")
+_HEADER_SIZE = 64
+_TOTAL_AT = 24
+_BLOCKED_AT = 32
+# Requests for paths that do not exist (counted here, never given a path slot).
+_MISSING_AT = 40
+# Path slot: key hash, count, key length, key bytes (truncated; display only).
+_PATH_SLOT = struct.Struct("<QQH110s")
+# Rate-limit slot: client hash, window index, current and previous window usage in
+# milli-cost units (so fractional request costs can be charged exactly).
+_IP_SLOT = struct.Struct("<QQQQ")
+
+_MAX_PROBES = 64
+
+
+def _hash64(key: str) -> int:
+    # Stable across processes, and never 0 (0 marks an empty slot).
+    h = int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+    return h or 1
+
+
+class StripedLock:
+    """
+    N independent locks that work across threads *and* processes.
+
+    POSIX record locks belong to the process, so a thread lock per stripe is taken
+    first and the matching byte of a shared lock file second.
+    """
+
+    def __init__(self, name: str, stripes: int):
+        self.stripes = stripes
+        self._thread_locks = [threading.Lock() for _ in range(stripes + 1)]
+        self._fd = None
+        if fcntl is not None:
+            path = os.path.join(tempfile.gettempdir(), f"{name}.lock")
+            self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+
+    def acquire(self, stripe: int):
+        self._thread_locks[stripe].acquire()
+        if self._fd is not None:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, stripe)
+
+    def release(self, stripe: int):
+        if self._fd is not None:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, stripe)
+        self._thread_locks[stripe].release()
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class SharedState:
+    """
+    Hit counters, request totals and rate-limit windows in one shared-memory
+    segment, so every server process on the host counts and limits globally.
+
+    The first process creates and initializes the segment; later ones attach by
+    name. Both tables are fixed-size open-addressing hash tables; each slot is
+    guarded by one of `stripes` striped locks, so unrelated paths and clients
+    rarely contend. Nothing here does a network round-trip.
+    """
+
+    def __init__(self, name: str = "http-lab-state", path_slots: int = 4096,
+                 ip_slots: int = 4096, stripes: int = 64):
+        self.name = name
+        size = _HEADER_SIZE + path_slots * _PATH_SLOT.size + ip_slots * _IP_SLOT.size
+        self.locks = StripedLock(name, stripes)
+        self._header_stripe = stripes
+
+        self.locks.acquire(self._header_stripe)
+        try:
+            try:
+                self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+                self.created = True
+                _HEADER.pack_into(self._shm.buf, 0, MAGIC, path_slots, ip_slots, stripes, 0, 0)
+            except FileExistsError:
+                self._shm = shared_memory.SharedMemory(name=name)
+                self.created = False
+        finally:
+            self.locks.release(self._header_stripe)
+        # Every process would otherwise unlink the segment at exit, pulling it out
+        # from under the others; it lives until unlink() or reboot instead.
+        resource_tracker.unregister(self._shm._name, "shared_memory")
+
+        magic, self.path_slots, self.ip_slots, self.stripes, _, _ = _HEADER.unpack_from(self._shm.buf, 0)
+        if magic != MAGIC:
+            raise RuntimeError(f"shared memory segment {name!r} is not a server state segment")
+        if self.stripes != stripes:
+            raise RuntimeError(f"segment {name!r} uses {self.stripes} lock stripes, not {stripes}")
+        self.buf = self._shm.buf
+        self._paths_at = _HEADER_SIZE
+        self._ips_at = _HEADER_SIZE + self.path_slots * _PATH_SLOT.size
+        self.hits = SharedHits(self)
+        self.untracked = 0
+
+    # --- Header counters ---
+    def _bump_header(self, offset: int, delta: int = 1) -> int:
+        self.locks.acquire(self._header_stripe)
+        try:
+            value = struct.unpack_from("<Q", self.buf, offset)[0] + delta
+            struct.pack_into("<Q", self.buf, offset, value)
+            return value
+        finally:
+            self.locks.release(self._header_stripe)
+
+    def add_request(self) -> int:
+        return self._bump_header(_TOTAL_AT)
+
+    @property
+    def total_requests(self) -> int:
+        return struct.unpack_from("<Q", self.buf, _TOTAL_AT)[0]
+
+    def add_missing(self) -> int:
+        return self._bump_header(_MISSING_AT)
+
+    @property
+    def missing_requests(self) -> int:
+        return struct.unpack_from("<Q", self.buf, _MISSING_AT)[0]
+
+    @property
+    def rate_limit_blocked(self) -> int:
+        return struct.unpack_from("<Q", self.buf, _BLOCKED_AT)[0]
+
+    # --- Path counters ---
+    def _find_path(self, h: int, key: str | None):
+        """Return the slot offset holding h, claiming an empty one if key is given."""
+        start = h % self.path_slots
+        for probe in range(min(_MAX_PROBES, self.path_slots)):
+            index = (start + probe) % self.path_slots
+            offset = self._paths_at + index * _PATH_SLOT.size
+            slot_hash = struct.unpack_from("<Q", self.buf, offset)[0]
+            if slot_hash == h:
+                return offset, index
+            if slot_hash == 0:
+                if key is None:
+                    return None, None
+                stripe = index % self.stripes
+                self.locks.acquire(stripe)
+                try:
+                    # Re-check under the lock: another process may have claimed it.
+                    slot_hash = struct.unpack_from("<Q", self.buf, offset)[0]
+                    if slot_hash == 0:
+                        raw = key.encode("utf-8")[:110]
+                        _PATH_SLOT.pack_into(self.buf, offset, h, 0, len(raw), raw)
+                        return offset, index
+                    if slot_hash == h:
+                        return offset, index
+                finally:
+                    self.locks.release(stripe)
+        return None, None
+
+    def add_hit(self, key: str, delta: int = 1, delay: float = 0.0) -> tuple[int, int]:
+        """Add delta to key's counter; returns (previous, new). (0, 0) if the table is full."""
+        offset, index = self._find_path(_hash64(key), key)
+        if offset is None:
+            self.untracked += 1
+            return 0, 0
+        stripe = index % self.stripes
+        self.locks.acquire(stripe)
+        try:
+            previous = struct.unpack_from("<Q", self.buf, offset + 8)[0]
+            if delay > 0:
+                time.sleep(delay)
+            struct.pack_into("<Q", self.buf, offset + 8, previous + delta)
+        finally:
+            self.locks.release(stripe)
+        return previous, previous + delta
+
+    def get_hits(self, key: str) -> int:
+        offset, _ = self._find_path(_hash64(key), None)
+        if offset is None:
+            return 0
+        return struct.unpack_from("<Q", self.buf, offset + 8)[0]
+
+    def path_items(self) -> list[tuple[str, int]]:
+        items = []
+        for index in range(self.path_slots):
+            h, count, length, raw = _PATH_SLOT.unpack_from(self.buf, self._paths_at + index * _PATH_SLOT.size)
+            if h:
+                items.append((raw[:length].decode("utf-8", errors="replace"), count))
+        return items
+
+    # --- Rate limiting ---
+    def _client_slot(self, h: int, window: int):
+        """Probe for h's slot; else the first empty or recyclable one; None if saturated."""
+        start = h % self.ip_slots
+        reusable = None
+        for probe in range(min(_MAX_PROBES, self.ip_slots)):
+            index = (start + probe) % self.ip_slots
+            offset = self._ips_at + index * _IP_SLOT.size
+            slot_hash, slot_window = struct.unpack_from("<QQ", self.buf, offset)
+            if slot_hash == h:
+                return index
+            if slot_hash == 0:
+                return reusable if reusable is not None else index
+            if reusable is None and slot_window < window - 1:
+                # Idle for two full windows: its usage is zero, so it can be recycled.
+                reusable = index
+        return reusable
+
+    def rate_limit_allow(self, client: str, limit: float, cost: float = 1.0,
+                         window_size: float = 1.0) -> tuple[bool, float]:
+        """
+        Sliding-window-counter limiter: usage = previous window * (1 - elapsed
+        fraction) + current window. Charges `cost` and returns (True, usage) when
+        usage + cost fits under `limit`; otherwise returns (False, usage).
+        Fails open if the client table is saturated.
+        """
+        now = time.time() / window_size
+        window = int(now)
+        fraction = now - window
+        h = _hash64(client)
+        target = self._client_slot(h, window)
+        if target is None:
+            self.untracked += 1
+            return True, 0.0
+
+        offset = self._ips_at + target * _IP_SLOT.size
+        stripe = target % self.stripes
+        self.locks.acquire(stripe)
+        try:
+            slot_hash, slot_window, current, previous = _IP_SLOT.unpack_from(self.buf, offset)
+            if slot_hash != h:
+                # Empty or recyclable slot (re-checked under the lock).
+                if slot_hash != 0 and slot_window >= window - 1:
+                    self.untracked += 1
+                    return True, 0.0
+                slot_window, current, previous = window, 0, 0
+            if slot_window == window - 1:
+                slot_window, current, previous = window, 0, current
+            elif slot_window != window:
+                slot_window, current, previous = window, 0, 0
+            usage = (previous * (1.0 - fraction) + current) / 1000.0
+            allowed = usage + cost <= limit
+            if allowed:
+                current += int(round(cost * 1000))
+            _IP_SLOT.pack_into(self.buf, offset, h, slot_window, current, previous)
+        finally:
+            self.locks.release(stripe)
+        if not allowed:
+            self._bump_header(_BLOCKED_AT)
+        return allowed, usage + (cost if allowed else 0.0)
+
+    def gcra_allow(self, key: str, rate: float, cost: float = 1.0,
+                   burst: float | None = None) -> tuple[bool, float]:
+        """
+        Cost-weighted limiter (GCRA, a token bucket stored as one timestamp).
+
+        A key is allowed while its "theoretical arrival time" is at most
+        (burst - 1) / rate seconds ahead of now; each allowed request pushes it forward
+        by cost / rate. An expensive request is admitted on remaining budget but
+        leaves the key in debt, blocking it for proportionally longer.
+        Returns (allowed, seconds until the key may send again).
+        """
+        burst = rate if burst is None else burst
+        # Room for `burst` unit-cost requests back to back (classic GCRA tau).
+        tolerance = max(0.0, burst - 1.0) / rate
+        now = time.time()
+        h = _hash64(key)
+        target = self._client_slot(h, int(now))
+        if target is None:
+            self.untracked += 1
+            return True, 0.0
+
+        offset = self._ips_at + target * _IP_SLOT.size
+        stripe = target % self.stripes
+        self.locks.acquire(stripe)
+        try:
+            slot_hash, slot_window, tat_us, _ = _IP_SLOT.unpack_from(self.buf, offset)
+            if slot_hash != h:
+                if slot_hash != 0 and slot_window >= int(now) - 1:
+                    self.untracked += 1
+                    return True, 0.0
+                tat_us = 0
+            tat = max(tat_us / 1e6, now)
+            allowed = tat - now <= tolerance
+            if allowed:
+                tat += cost / rate
+            # The window field holds the second the debt is repaid, so the slot is
+            # only recycled once the key is genuinely idle.
+            _IP_SLOT.pack_into(self.buf, offset, h, int(tat), int(tat * 1e6), 0)
+        finally:
+            self.locks.release(stripe)
+        if not allowed:
+            self._bump_header(_BLOCKED_AT)
+        return allowed, max(0.0, tat - now - tolerance)
+
+    def gcra_refund(self, key: str, rate: float, cost: float = 1.0):
+        """Give back an allowed gcra_allow() charge for a request refused further on."""
+        now = time.time()
+        h = _hash64(key)
+        target = self._client_slot(h, int(now))
+        if target is None:
+            return
+        offset = self._ips_at + target * _IP_SLOT.size
+        stripe = target % self.stripes
+        self.locks.acquire(stripe)
+        try:
+            slot_hash, _, tat_us, _ = _IP_SLOT.unpack_from(self.buf, offset)
+            if slot_hash == h:
+                tat = tat_us / 1e6 - cost / rate
+                _IP_SLOT.pack_into(self.buf, offset, h, int(tat), int(max(tat, 0.0) * 1e6), 0)
+        finally:
+            self.locks.release(stripe)
+
+    def tracked_clients(self, window_size: float = 1.0) -> int:
+        """Clients with usage in the current or previous window."""
+        window = int(time.time() / window_size)
+        count = 0
+        for index in range(self.ip_slots):
+            h, slot_window = struct.unpack_from("<QQ", self.buf, self._ips_at + index * _IP_SLOT.size)
+            if h and slot_window >= window - 1:
+                count += 1
+        return count
+
+    # --- Lifecycle ---
+    def close(self):
+        self.buf = None
+        self.hits = None
+        self._shm.close()
+        self.locks.close()
+
+    def unlink(self):
+        """Destroy the segment (all processes lose the shared counters)."""
+        # SharedMemory.unlink() also unregisters the name from the resource tracker;
+        # register it again first, since __init__ already took it out.
+        resource_tracker.register(self._shm._name, "shared_memory")
+        self._shm.unlink()
+
+
+class SharedHits(Mapping):
+    """Read-only dict-like view of the shared path counters (for stats and listings)."""
+
+    def __init__(self, state: SharedState):
+        self._state = state
+
+    def __getitem__(self, key: str) -> int:
+        offset, _ = self._state._find_path(_hash64(key), None)
+        if offset is None:
+            raise KeyError(key)
+        return struct.unpack_from("<Q", self._state.buf, offset + 8)[0]
+
+    def __iter__(self):
+        return iter([path for path, _ in self._state.path_items()])
+
+    def __len__(self) -> int:
+        return len(self._state.path_items())
+
+    def items(self):
+        return self._state.path_items()
+
+    def values(self):
+        return [count for _, count in self._state.path_items()]
@@ -0,0 +1,88 @@
+import hashlib
+from array import array
+
+
+def _hash64(key: str) -> int:
+    # Stable across processes (unlike hash()), so estimates do not depend on PYTHONHASHSEED.
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class CountMinSketch:
+    """
+    Fixed-size frequency estimator: `depth` rows of `width` counters.
+
+    add() and estimate() touch exactly one counter per row, so both are O(depth)
+    regardless of how many distinct keys were seen. Estimates never undercount;
+    they overcount by at most ~e/width * total with probability 1 - e^-depth.
+    Not thread-safe on its own; callers serialize access.
+    """
+
+    def __init__(self, width: int = 2048, depth: int = 4):
+        self.width = width
+        self.depth = depth
+        self.table = array("Q", bytes(8 * width * depth))
+        self.total = 0
+
+    def _cells(self, key: str):
+        h = _hash64(key)
+        # Double hashing: row i uses h1 + i*h2, which behaves like independent hashes.
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        for i in range(self.depth):
+            yield i * self.width + (h1 + i * h2) % self.width
+
+    def add(self, key: str, count: int = 1) -> int:
+        """Add `count` to key and return its new estimate."""
+        self.total += count
+        estimate = None
+        for cell in self._cells(key):
+            value = self.table[cell] + count
+            self.table[cell] = value
+            if estimate is None or value < estimate:
+                estimate = value
+        return estimate
+
+    def estimate(self, key: str) -> int:
+        return min(self.table[cell] for cell in self._cells(key))
+
+    @property
+    def memory_bytes(self) -> int:
+        return self.table.itemsize * len(self.table)
+
+
+class TopK:
+    """
+    Space-Saving heavy-hitter summary holding at most `k` keys.
+
+    offer() is fed the sketch estimate for a key after each add. A tracked key is
+    updated in place; an untracked key replaces the current minimum once its
+    estimate exceeds it. The minimum is cached and only rescanned (O(k), k is a
+    small constant) when the entry holding it changes.
+    """
+
+    def __init__(self, k: int = 32):
+        self.k = k
+        self.counts: dict[str, int] = {}
+        self._min_key: str | None = None
+
+    def _rescan_min(self):
+        self._min_key = min(self.counts, key=self.counts.__getitem__) if self.counts else None
+
+    def offer(self, key: str, estimate: int):
+        counts = self.counts
+        if key in counts:
+            counts[key] = estimate
+            if key == self._min_key:
+                self._rescan_min()
+            return
+        if len(counts) < self.k:
+            counts[key] = estimate
+            if self._min_key is None or estimate < counts[self._min_key]:
+                self._min_key = key
+            return
+        if estimate > counts[self._min_key]:
+            del counts[self._min_key]
+            counts[key] = estimate
+            self._rescan_min()
+
+    def top(self, n: int) -> list[tuple[str, int]]:
+        return sorted(self.counts.items(), key=lambda x: x[1], reverse=True)[:n]
@@ -1,64 +1,348 @@
+import selectors
 import socket
 import threading
+import time
+from contextlib import nullcontext
 from concurrent.futures import ThreadPoolExecutor
+from .http2 import PREFACE_HEAD, H2Connection, is_h2c_upgrade
+from .listeners import ListenSpec, open_listener, socket_label
+from .pool import AdaptivePool
+
+_NO_SPAN = nullcontext()
 
 
 class TCPServer:
-    def __init__(self, host='127.0.0.1', port=8000, max_workers=10):
+    def __init__(self, host='127.0.0.1', port=8000, max_workers=10, reuse_port=False,
+                 min_workers=None, pool_options=None, bulk_workers=0, shaper=None, tracer=None,
+                 keep_alive_timeout=0.0, drain_timeout=10.0, http2=False, http2_workers=32,
+                 http2_max_streams=100, bulk_queue=None):
         self.host = host
         self.port = port
         self.max_workers = max_workers
+        # Adaptive pool bounds: with min_workers below max_workers the pool grows and
+        # shrinks between them (see pool.AdaptivePool); otherwise it is fixed-size.
+        self.min_workers = min_workers
+        self.pool_options = pool_options or {}
+        self.executor = None
+        # Let several server processes bind the same port; the kernel spreads connections.
+        self.reuse_port = reuse_port
         self._semaphore = threading.Semaphore(self.max_workers)
+        # Optional bulk lane: connections classified as "bulk" after their request is
+        # read are handed to a separate pool with its own budget, releasing the
+        # latency worker (and its semaphore slot) immediately. 0 = single shared pool.
+        # At most bulk_queue connections (default 4 per bulk worker) wait for the lane;
+        # beyond that a bulk request is answered 503 instead of holding its socket open.
+        self.bulk_workers = bulk_workers
+        self.bulk_queue = bulk_queue if bulk_queue is not None else 4 * bulk_workers
+        self.bulk_executor = None
+        self.lane_counts = {"latency": 0, "bulk": 0}
+        self.bulk_queued = 0
+        self.bulk_rejected = 0
+        self.bulk_active = 0
+        self._lane_lock = threading.Lock()
+        # Optional byte-rate shaping of large responses (see shaping.BandwidthShaper).
+        self.shaper = shaper
+        # Optional timeline tracer (see tracing.Tracer): spans per request stage.
+        self.tracer = tracer
+        # Persistent connections: after a response whose head says "Connection:
+        # keep-alive", wait up to this long for the next request on the same socket
+        # (0 = one request per connection). The connection keeps its worker meanwhile.
+        self.keep_alive_timeout = keep_alive_timeout
+        # Listening sockets to accept from, all at once (see listeners.py): TCP or Unix,
+        # bound by the caller or inherited (systemd, handoff.py). When left empty,
+        # start() binds host:port itself.
+        self.listeners: list[socket.socket] = []
+        # Graceful shutdown: request_drain() stops the accept loop, then start() waits
+        # up to drain_timeout for open connections before returning. `on_listening` is
+        # called once connections are being accepted.
+        self.drain_timeout = drain_timeout
+        self.on_listening = None
+        self._draining = threading.Event()
+        # Open connections: True while a request is being handled, False while idle (keep-alive).
+        self._conns: dict = {}
+        self._conns_cond = threading.Condition()
+        # Cleartext HTTP/2 (see http2.H2Connection), by prior knowledge or "Upgrade: h2c".
+        # The connection keeps its worker to read frames; its streams run on a separate
+        # pool of http2_workers threads, at most http2_max_streams at once per connection.
+        self.http2 = http2
+        self.http2_workers = http2_workers
+        self.http2_max_streams = http2_max_streams
+        self.http2_executor = None
+
+    def span(self, name, **args):
+        """Trace span around a stage of request handling (a no-op unless tracing)."""
+        return self.tracer.span(name, **args) if self.tracer is not None else _NO_SPAN
 
     def start(self):
-        # create a socket object
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if not self.listeners:
+            self.listeners = [open_listener(ListenSpec(self.host, self.port), reuse_port=self.reuse_port)]
 
-        # allow the socket to reuse the same address immediately after the program closed
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        # One selector over every listener; each accepted Unix-socket peer is named
+        # after its listener ("unix:PATH") since it has no address of its own.
+        selector = selectors.DefaultSelector()
+        for s in self.listeners:
+            # Non-blocking: another process sharing the socket may take a connection
+            # between select() and accept() (accepted sockets stay blocking).
+            s.setblocking(False)
+            peer = (socket_label(s),) if s.family == socket.AF_UNIX else None
+            selector.register(s, selectors.EVENT_READ, peer)
+            print("Listening at", socket_label(s))
 
-        # bind the socket object to the address and port
-        s.bind((self.host, self.port))
+        # Thread pool for connection handlers; threads are reused across requests.
+        if self.min_workers is not None and self.min_workers < self.max_workers:
+            self.executor = AdaptivePool(min_workers=self.min_workers, max_workers=self.max_workers,
+                                         **self.pool_options)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        if self.bulk_workers > 0:
+            self.bulk_executor = ThreadPoolExecutor(max_workers=self.bulk_workers, thread_name_prefix="bulk")
+        if self.http2:
+            self.http2_executor = ThreadPoolExecutor(max_workers=self.http2_workers, thread_name_prefix="h2")
+        with self.executor as executor:
+            if self.on_listening is not None:
+                self.on_listening()
+            # Wake up regularly to notice a drain request.
+            while not self._draining.is_set():
+                for key, _ in selector.select(timeout=0.5):
+                    try:
+                        conn, addr = key.fileobj.accept()
+                    except (BlockingIOError, InterruptedError):
+                        continue
+                    if key.data is not None:
+                        addr = key.data
+                    else:
+                        # Responses go out as whole pieces (head, body chunks); without this,
+                        # Nagle holds a piece back until the peer's delayed ACK (~40 ms) on
+                        # persistent connections.
+                        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                    print("Connected by", addr)
+                    with self._conns_cond:
+                        self._conns[conn] = True
 
-        # start listening for connections
-        s.listen(128)
+                    # Acquire a slot before dispatching work to the pool to ensure
+                    # at most max_workers connections are processed concurrently.
+                    with self.span("semaphore wait"):
+                        self._semaphore.acquire()
+                    executor.submit(self._handle_connection, conn, addr,
+                                    self.tracer.now() if self.tracer is not None else None)
+            # Closing our listening sockets refuses new connections, unless another
+            # process holds the same sockets (hot restart) and keeps accepting them.
+            selector.close()
+            for s in self.listeners:
+                s.close()
+            self._drain()
+        if self.bulk_executor is not None:
+            self.bulk_executor.shutdown(wait=True)
+        if self.http2_executor is not None:
+            self.http2_executor.shutdown(wait=True)
 
-        print("Listening at", s.getsockname())
+    def request_drain(self):
+        """Stop accepting and let start() return once open connections finish (safe in a signal handler)."""
+        self._draining.set()
 
-        # Thread pool for connection handlers; threads are reused across requests.
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            while True:
-                conn, addr = s.accept()
-                print("Connected by", addr)
+    @property
+    def draining(self) -> bool:
+        return self._draining.is_set()
+
+    def worker_stats(self) -> dict:
+        """Connection workers in use right now, for live monitoring (see events.EventHub)."""
+        with self._conns_cond:
+            busy = sum(1 for active in self._conns.values() if active)
+            connections = len(self._conns)
+        stats = {"workers": self.max_workers, "busy": busy, "connections": connections,
+                 "utilization": round(busy / self.max_workers, 3)}
+        if isinstance(self.executor, AdaptivePool):
+            pool = self.executor.stats()
+            stats.update(threads=pool["size"], queued=pool["queued"])
+        if self.bulk_executor is not None:
+            stats.update(bulk_active=self.bulk_active, bulk_queued=self.bulk_queued, bulk_rejected=self.bulk_rejected)
+        return stats
 
-                # Acquire a slot before dispatching work to the pool to ensure
-                # at most max_workers connections are processed concurrently.
-                self._semaphore.acquire()
-                executor.submit(self._handle_connection, conn, addr)
+    def mark_busy(self, conn, busy: bool):
+        """Record whether a connection is handling a request (False = idle, closed first on drain)."""
+        with self._conns_cond:
+            if conn in self._conns:
+                self._conns[conn] = busy
 
-    def _handle_connection(self, conn, addr):
+    def _forget(self, conn):
+        with self._conns_cond:
+            self._conns.pop(conn, None)
+            self._conns_cond.notify_all()
+
+    @staticmethod
+    def _cut(conn):
         try:
-            data = b""
-            max_bytes = 65536
-            while b"\r\n\r\n" not in data and len(data) < max_bytes:
-                chunk = conn.recv(4096)
-                if not chunk:
-                    break
-                data += chunk
+            conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
 
-            response = self.handle_request(data, addr)
+    def _drain(self):
+        """Wait for open connections (up to drain_timeout), closing idle keep-alive ones at once."""
+        started = time.monotonic()
+        deadline = started + self.drain_timeout
+        with self._conns_cond:
+            busy = sum(1 for active in self._conns.values() if active)
+            idle = [conn for conn, active in self._conns.items() if not active]
+        print(f"[DRAIN] stopped accepting; {busy} connection(s) in flight, {len(idle)} idle closed, "
+              f"waiting up to {self.drain_timeout:g}s")
+        for conn in idle:
+            self._cut(conn)
+        with self._conns_cond:
+            while self._conns and deadline - time.monotonic() > 0:
+                self._conns_cond.wait(deadline - time.monotonic())
+            left = list(self._conns)
+        if left:
+            print(f"[DRAIN] deadline reached; cutting {len(left)} unfinished connection(s)")
+            for conn in left:
+                self._cut(conn)
+        else:
+            print(f"[DRAIN] all connections finished in {time.monotonic() - started:.2f}s")
 
-            conn.sendall(response)
+    def _handle_connection(self, conn, addr, queued_at=None):
+        handed_off = False
+        if queued_at is not None:
+            self.tracer.async_span("queued", queued_at, self.tracer.now(), args={"client": addr[0]})
+        try:
+            with self.span("read head"):
+                data = self._read_head(conn)
+
+            if self.http2 and data.startswith(PREFACE_HEAD):
+                # HTTP/2 with prior knowledge: the whole connection is frames from here on.
+                H2Connection(self, conn, addr, data).serve()
+                return
+
+            lane = self.classify(data) if self.bulk_executor is not None else "latency"
+            shed = False
+            with self._lane_lock:
+                if lane == "bulk" and self.bulk_queued >= self.bulk_queue:
+                    self.bulk_rejected += 1
+                    shed = True
+                else:
+                    self.lane_counts[lane] += 1
+                    if lane == "bulk":
+                        self.bulk_queued += 1
+            if shed:
+                print(f"[BULK] queue full ({self.bulk_queue} waiting); 503 for {addr[0]}")
+                with self.span("send"):
+                    self.send_response(conn, self.busy_response())
+                return
+            if lane == "bulk":
+                # The bulk pool owns the connection from here; this worker goes back
+                # to serving small requests instead of waiting behind the download.
+                self.bulk_executor.submit(self._serve_bulk, conn, addr, data,
+                                          self.tracer.now() if self.tracer is not None else None)
+                handed_off = True
+                return
+
+            self._serve(conn, addr, data)
         except Exception:
             # Swallow unexpected errors per connection to avoid crashing the server.
             pass
         finally:
+            if not handed_off:
+                self._forget(conn)
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            # Release the semaphore slot so another connection can proceed.
+            self._semaphore.release()
+
+    def _serve_bulk(self, conn, addr, data, queued_at=None):
+        if queued_at is not None:
+            self.tracer.async_span("queued (bulk)", queued_at, self.tracer.now(), args={"client": addr[0]})
+        with self._lane_lock:
+            self.bulk_queued -= 1
+            self.bulk_active += 1
+        try:
+            # A persistent connection stays in the lane its first request picked.
+            self._serve(conn, addr, data)
+        except Exception:
+            pass
+        finally:
+            self._forget(conn)
             try:
                 conn.close()
             except Exception:
                 pass
-            # Release the semaphore slot so another connection can proceed.
-            self._semaphore.release()
+            with self._lane_lock:
+                self.bulk_active -= 1
+
+    def _read_head(self, conn, data=b"", max_bytes=65536):
+        """Receive until the blank line that ends a request head (or EOF / max_bytes)."""
+        while b"\r\n\r\n" not in data and len(data) < max_bytes:
+            chunk = conn.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+        return data
+
+    def _serve(self, conn, addr, data):
+        """Answer the request in `data`, then any further ones while the connection persists."""
+        while True:
+            head, sep, rest = data.partition(b"\r\n\r\n")
+            if self.http2 and is_h2c_upgrade(head):
+                # Answered as stream 1 after "101 Switching Protocols".
+                H2Connection(self, conn, addr, rest, upgrade=head + sep).serve()
+                return
+            if not self._respond(conn, addr, head + sep) or self.keep_alive_timeout <= 0:
+                return
+            self.mark_busy(conn, False)
+            if self._draining.is_set():
+                return
+            conn.settimeout(self.keep_alive_timeout)
+            try:
+                data = self._read_head(conn, rest)
+            except OSError:  # idle timeout or reset
+                return
+            if not data.strip():
+                return
+            conn.settimeout(None)
+            self.mark_busy(conn, True)
+
+    def _respond(self, conn, addr, data):
+        """Handle one request and send the response; True if the connection may carry another."""
+        with self.span("handle"):
+            response = self.handle_request(data, addr)
+
+        with self.span("send"):
+            head = self.send_response(conn, response)
+        return head is not None and self.keeps_alive(head)
+
+    def send_response(self, conn, response):
+        # A response is either one bytes object or an iterator of bytes pieces
+        # (a streamed body), sent as each piece is produced. Returns the first piece
+        # (which starts with the head), or None if nothing was sent.
+        pieces = (response,) if isinstance(response, (bytes, bytearray, memoryview)) else response
+        first = None
+        # One shaper transfer per response, so its pieces share one token bucket.
+        transfer = self.shaper.transfer() if self.shaper is not None else None
+        try:
+            for piece in pieces:
+                if first is None:
+                    first = piece
+                if transfer is not None:
+                    transfer.send(conn, piece)
+                else:
+                    conn.sendall(piece)
+        finally:
+            if transfer is not None:
+                transfer.close()
+        return first
+
+    @staticmethod
+    def keeps_alive(head) -> bool:
+        """Whether a sent response head declares the connection persistent."""
+        head = bytes(head[:8192]).partition(b"\r\n\r\n")[0].lower()
+        return b"\r\nconnection: keep-alive" in head
+
+    def classify(self, data):
+        """Pick a lane for a request that has been read but not handled yet."""
+        return "latency"
+
+    def busy_response(self) -> bytes:
+        """Answer to a request shed because its lane's queue is full."""
+        return b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\nRetry-After: 1\r\nConnection: close\r\n\r\n"
 
     def handle_request(self, data, addr):
         return data
@@ -0,0 +1,124 @@
+import itertools
+import json
+import os
+import threading
+import time
+
+
+class Tracer:
+    """
+    Opt-in request timeline in Chrome Trace Event format (chrome://tracing, Perfetto).
+
+    Spans are recorded as one "complete" event when they end, into a fixed-size
+    ring buffer: a slot index comes from an itertools.count (atomic under the GIL)
+    and the slot is overwritten in place, so recording takes no lock and memory
+    stays at `capacity` events however long the server runs. dump() returns the
+    newest events as a Trace Event JSON document with thread names attached.
+    """
+
+    def __init__(self, capacity: int = 65536):
+        self.capacity = capacity
+        self._events: list = [None] * capacity
+        self._seq = itertools.count()
+        self._async_ids = itertools.count(1)
+        self._origin = time.perf_counter()
+        self.pid = os.getpid()
+
+    def now(self) -> float:
+        """Microseconds since the tracer started (trace timestamps)."""
+        return (time.perf_counter() - self._origin) * 1e6
+
+    def _record(self, event: tuple):
+        self._events[next(self._seq) % self.capacity] = event
+
+    def complete(self, name: str, start_us: float, end_us: float, cat: str = "request", args=None):
+        self._record(("X", name, cat, start_us, end_us - start_us, threading.get_ident(), args, None))
+
+    def async_span(self, name: str, start_us: float, end_us: float, cat: str = "queue", args=None):
+        """A span not tied to one thread (e.g. waiting in the pool queue); shown on its own track."""
+        span_id = next(self._async_ids)
+        tid = threading.get_ident()
+        self._record(("b", name, cat, start_us, 0, tid, args, span_id))
+        self._record(("e", name, cat, end_us, 0, tid, None, span_id))
+
+    def span(self, name: str, cat: str = "request", **args):
+        return _Span(self, name, cat, args or None)
+
+    def lock(self, lock, name: str):
+        return TracedLock(lock, name, self)
+
+    def clear(self):
+        self._events = [None] * self.capacity
+
+    def dump(self) -> dict:
+        events = sorted((e for e in self._events if e is not None), key=lambda e: e[3])
+        names = {t.ident: t.name for t in threading.enumerate()}
+        trace = [
+            {"ph": "M", "name": "thread_name", "pid": self.pid, "tid": tid, "args": {"name": names[tid]}}
+            for tid in {e[5] for e in events} if tid in names
+        ]
+        for ph, name, cat, ts, dur, tid, args, span_id in events:
+            event = {"ph": ph, "name": name, "cat": cat, "ts": round(ts, 1), "pid": self.pid, "tid": tid}
+            if ph == "X":
+                event["dur"] = round(dur, 1)
+            if span_id is not None:
+                event["id"] = span_id
+            if args:
+                event["args"] = args
+            trace.append(event)
+        return {"traceEvents": trace, "displayTimeUnit": "ms"}
+
+    def dumps(self) -> str:
+        return json.dumps(self.dump(), separators=(",", ":"))
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "cat", "args", "start")
+
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = self.tracer.now()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.tracer.complete(self.name, self.start, self.tracer.now(), self.cat, self.args)
+        return False
+
+
+class TracedLock:
+    """
+    Lock wrapper that records contention: an uncontended acquire is a plain
+    non-blocking acquire with nothing recorded; only when the lock is already
+    held is the blocking wait timed and traced as "wait <name>".
+    """
+
+    def __init__(self, lock, name: str, tracer: Tracer):
+        self._lock = lock
+        self.name = name
+        self.tracer = tracer
+
+    def acquire(self, blocking: bool = True, timeout: float = -1):
+        if self._lock.acquire(blocking=False):
+            return True
+        if not blocking:
+            return False
+        start = self.tracer.now()
+        acquired = self._lock.acquire(True, timeout)
+        self.tracer.complete(f"wait {self.name}", start, self.tracer.now(), "lock")
+        return acquired
+
+    def release(self):
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False